@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import BookingContext, ChatSession, ChatMessage
+from .models import BookingContext, ChatSession, ChatMessage, BackgroundTask
 
 # Register your models here.
 admin.site.register(BookingContext)
 admin.site.register(ChatSession)
-admin.site.register(ChatMessage)
\ No newline at end of file
+admin.site.register(ChatMessage)
+admin.site.register(BackgroundTask)
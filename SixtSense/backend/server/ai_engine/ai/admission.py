@@ -0,0 +1,342 @@
+# ai_engine/ai/admission.py
+"""
+Admission control for OpenAI calls, shared by every worker on the host.
+
+Each model has two token buckets, requests/min and tokens/min, kept in a
+small SQLite file (AI_LLM_LIMITS_DB) so all Django and uvicorn workers draw
+from the same budget instead of each hitting the provider's 429s on its
+own. The FastAPI prototype uses the same file and schema by default.
+
+The limits themselves live in the same file (table llm_limits: one row per
+model plus "*" for the rest), so both apps always size the shared buckets
+alike. The env defaults below only seed a new file; `manage.py llm_limits`
+shows and changes them.
+
+Inside a process, callers of a model wait in a bounded priority queue:
+interactive chat turns go before background work (prefetch, opening
+pitch, outbox tasks), and background work may only fill half the queue.
+A call that cannot be admitted in time is shed right away with
+LLMOverloaded, so the caller can fall back (rule ranking, a short "busy"
+reply) instead of running into a timeout:
+
+    admission.acquire("gpt-4o-mini", admission.estimate_tokens(prompt, max_tokens=2000))
+    resp = llm.invoke(prompt)
+
+Token counts are estimated up front (about 4 characters per token plus the
+completion budget), so the tokens/min bucket errs on the safe side. The
+SQLite transaction may wait on another process's lock, so aacquire() runs
+it in a worker thread instead of on the event loop.
+Models without a name (fakes in load tests) are not limited.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from core import metrics
+
+ENABLED = os.getenv("AI_LLM_ADMISSION", "true").lower() in ("1", "true", "yes")
+
+LIMITS_DB = os.getenv("AI_LLM_LIMITS_DB") or os.path.join(tempfile.gettempdir(), "sixtsense-llm-limits.sqlite3")
+
+# Seed of the llm_limits table of a new LIMITS_DB: the "*" row, plus
+# per-model rows from AI_LLM_LIMITS. Same seed as the prototype's config.py.
+DEFAULT_RPM = int(os.getenv("AI_LLM_RPM", "500"))
+DEFAULT_TPM = int(os.getenv("AI_LLM_TPM", "30000"))
+MODEL_LIMITS: Dict[str, Dict[str, int]] = json.loads(
+    os.getenv("AI_LLM_LIMITS", '{"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}')
+)
+
+# Waiting callers per process; background work only gets half of it
+QUEUE_SIZE = int(os.getenv("AI_LLM_QUEUE_SIZE", "32"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# How long a caller may wait for admission before it is shed
+MAX_WAIT = {
+    INTERACTIVE: float(os.getenv("AI_LLM_MAX_WAIT", "2.0")),
+    BACKGROUND: float(os.getenv("AI_LLM_BACKGROUND_MAX_WAIT", "20.0")),
+}
+
+# Completion budget assumed when the caller does not know max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Queued callers that are not first in line re-check this often
+POLL_INTERVAL = 0.05
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class LLMOverloaded(Exception):
+    """The call was not admitted: queue full or no budget in time."""
+
+    def __init__(self, model: str, reason: str):
+        super().__init__(f"LLM calls to {model} are shed ({reason})")
+        self.model = model
+        self.reason = reason
+
+
+@contextmanager
+def priority(level: int):
+    """Run the block's LLM calls at `level` (threads started inside do not inherit it)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def estimate_tokens(*texts, max_tokens: Optional[int] = None) -> int:
+    prompt_tokens = sum(len(str(t)) for t in texts) // 4
+    return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def model_name(llm) -> Optional[str]:
+    name = getattr(llm, "model_name", None)
+    return name if isinstance(name, str) else None
+
+
+def _seed() -> List[Tuple[str, float, float]]:
+    rows = [("*", DEFAULT_RPM, DEFAULT_TPM)]
+    for model, limits in MODEL_LIMITS.items():
+        rows.append((model, limits.get("rpm", DEFAULT_RPM), limits.get("tpm", DEFAULT_TPM)))
+    return rows
+
+
+class BucketStore:
+    """
+    Token buckets in SQLite. A bucket holds up to `capacity` and refills
+    `capacity` per minute; take() updates all buckets of a call in one
+    IMMEDIATE transaction, so concurrent processes never overdraw.
+    """
+
+    def __init__(self, path: str, seed: List[Tuple[str, float, float]] = ()):
+        self.path = path
+        self.seed = list(seed)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_buckets ("
+                " key TEXT PRIMARY KEY,"
+                " level REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_limits ("
+                " model TEXT PRIMARY KEY,"
+                " rpm REAL NOT NULL,"
+                " tpm REAL NOT NULL)"
+            )
+            # Rows already there (from either app) win over this process's env
+            conn.executemany("INSERT OR IGNORE INTO llm_limits (model, rpm, tpm) VALUES (?, ?, ?)", self.seed)
+            self._local.conn = conn
+        return conn
+
+    def limits(self, model: str) -> Tuple[float, float]:
+        """(requests/min, tokens/min) of the model, or of "*" without a row of its own."""
+        row = self._connect().execute(
+            "SELECT rpm, tpm FROM llm_limits WHERE model IN (?, '*') ORDER BY model = '*' LIMIT 1", (model,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (DEFAULT_RPM, DEFAULT_TPM)
+
+    def all_limits(self) -> Dict[str, Tuple[float, float]]:
+        rows = self._connect().execute("SELECT model, rpm, tpm FROM llm_limits ORDER BY model").fetchall()
+        return {model: (rpm, tpm) for model, rpm, tpm in rows}
+
+    def set_limits(self, model: str, rpm: float, tpm: float):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO llm_limits (model, rpm, tpm) VALUES (?, ?, ?)", (model, rpm, tpm)
+        )
+
+    def take(self, buckets: List[Tuple[str, float, float]]) -> float:
+        """
+        buckets: (key, amount, capacity). Takes `amount` from every bucket,
+        or from none of them; returns 0.0 when taken, otherwise the seconds
+        until all of them would have enough.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = {}
+            wait = 0.0
+            for key, amount, capacity in buckets:
+                row = conn.execute("SELECT level, updated_at FROM llm_buckets WHERE key = ?", (key,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+                # A single call larger than the bucket waits for a full one
+                amount = min(amount, capacity)
+                if level < amount:
+                    wait = max(wait, (amount - level) * 60 / capacity)
+                levels[key] = level - amount
+
+            if wait == 0.0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO llm_buckets (key, level, updated_at) VALUES (?, ?, ?)",
+                    [(key, level, now) for key, level in levels.items()],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class AdmissionQueue:
+    def __init__(self, model: str, store: BucketStore, size: int = QUEUE_SIZE):
+        self.model = model
+        self.store = store
+        self.size = size
+        self._waiting: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._waiting)
+
+    def _enter(self, level: int) -> Tuple[int, int]:
+        capacity = self.size if level == INTERACTIVE else self.size // 2
+        with self._cond:
+            if len(self._waiting) >= capacity:
+                raise LLMOverloaded(self.model, "queue_full")
+            ticket = (level, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            metrics.gauge(f"llm.admission.queue_depth.{self.model}", len(self._waiting))
+        return ticket
+
+    def _leave(self, ticket: Tuple[int, int]):
+        with self._cond:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            metrics.gauge(f"llm.admission.queue_depth.{self.model}", len(self._waiting))
+            self._cond.notify_all()
+
+    def _first(self, ticket: Tuple[int, int]) -> bool:
+        with self._cond:
+            return self._waiting[0] == ticket
+
+    def _take(self, tokens: int) -> float:
+        """0.0 when admitted, else the seconds until the buckets have enough."""
+        rpm, tpm = self.store.limits(self.model)
+        return self.store.take([(f"{self.model}:rpm", 1, rpm), (f"{self.model}:tpm", tokens, tpm)])
+
+    def _next_wait(self, wait: Optional[float], deadline: float) -> float:
+        left = deadline - time.monotonic()
+        if wait is not None and wait > left:
+            # The budget will not be there in time: shed now, not at the deadline
+            raise LLMOverloaded(self.model, "rate_limited")
+        if left <= 0:
+            raise LLMOverloaded(self.model, "timeout")
+        return min(left, wait if wait is not None else POLL_INTERVAL)
+
+    def _shed(self, e: LLMOverloaded, level: int):
+        metrics.incr(f"llm.admission.shed.{e.reason}")
+        metrics.incr(f"llm.admission.shed.{'interactive' if level == INTERACTIVE else 'background'}")
+
+    def acquire(self, tokens: int, level: int, max_wait: float):
+        started = time.monotonic()
+        try:
+            ticket = self._enter(level)
+        except LLMOverloaded as e:
+            self._shed(e, level)
+            raise
+        try:
+            while True:
+                wait = self._take(tokens) if self._first(ticket) else None
+                if wait == 0.0:
+                    break
+                pause = self._next_wait(wait, started + max_wait)
+                with self._cond:
+                    self._cond.wait(pause)
+        except LLMOverloaded as e:
+            self._shed(e, level)
+            raise
+        finally:
+            self._leave(ticket)
+        metrics.observe("llm.admission.wait", time.monotonic() - started)
+
+    async def aacquire(self, tokens: int, level: int, max_wait: float):
+        started = time.monotonic()
+        try:
+            ticket = self._enter(level)
+        except LLMOverloaded as e:
+            self._shed(e, level)
+            raise
+        try:
+            while True:
+                # BEGIN IMMEDIATE may wait for another process: not on the loop
+                wait = await asyncio.to_thread(self._take, tokens) if self._first(ticket) else None
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(self._next_wait(wait, started + max_wait))
+        except LLMOverloaded as e:
+            self._shed(e, level)
+            raise
+        finally:
+            self._leave(ticket)
+        metrics.observe("llm.admission.wait", time.monotonic() - started)
+
+
+_store: Optional[BucketStore] = None
+_queues: Dict[str, AdmissionQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_store() -> BucketStore:
+    global _store
+    with _queues_lock:
+        if _store is None:
+            _store = BucketStore(LIMITS_DB, _seed())
+        return _store
+
+
+def get_queue(model: str) -> AdmissionQueue:
+    """One queue per model, so a throttled model does not hold up the others."""
+    store = get_store()
+    with _queues_lock:
+        if model not in _queues:
+            _queues[model] = AdmissionQueue(model, store)
+        return _queues[model]
+
+
+def limits_for(model: str) -> Tuple[float, float]:
+    return get_store().limits(model)
+
+
+def _resolve(level: Optional[int], max_wait: Optional[float]) -> Tuple[int, float]:
+    level = current_priority() if level is None else level
+    return level, MAX_WAIT[level] if max_wait is None else max_wait
+
+
+def acquire(model: Optional[str], tokens: int, level: Optional[int] = None, max_wait: Optional[float] = None):
+    """Block until the call may go out; raises LLMOverloaded when shed."""
+    if not ENABLED or not model:
+        return
+    level, max_wait = _resolve(level, max_wait)
+    get_queue(model).acquire(tokens, level, max_wait)
+
+
+async def aacquire(model: Optional[str], tokens: int, level: Optional[int] = None, max_wait: Optional[float] = None):
+    """Async acquire(): waits with asyncio.sleep, holding no thread."""
+    if not ENABLED or not model:
+        return
+    level, max_wait = _resolve(level, max_wait)
+    await get_queue(model).aacquire(tokens, level, max_wait)
@@ -1,60 +1,486 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
+import copy
 import os
+import time
+
+from core import metrics
+
+from . import admission, hedging, router
+
+# LangChain (and pydantic, through ai.reply_schema) is imported lazily (first
+# SalesAgent() in a process): importing it costs most of a worker's startup
+# time, and URLconf loading, management commands and the accounts/booking
+# endpoints never need it.
+
+
+@lru_cache(maxsize=1)
+def _load_system_prompt() -> str:
+    base_dir = Path(__file__).resolve().parent
+    prompt_path = base_dir / "prompt.txt"
+
+    if not prompt_path.exists():
+        raise FileNotFoundError(f"Prompt file not found at: {prompt_path}")
+
+    with prompt_path.open("r", encoding="utf-8") as file:
+        return file.read()
+
+
+@lru_cache(maxsize=1)
+def _build_chain():
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import ChatPromptTemplate
+
+    from . import reply_schema
+
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.4,
+        max_tokens=reply_schema.MAX_OUTPUT_TOKENS,
+        stream_usage=True,
+        api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", _load_system_prompt()),
+            (
+                "human",
+                "Booking info: {booking}\n"
+                "User profile: {profile}\n"
+                "Current session state: {state}\n"
+                "Conversation so far:\n{history}\n"
+                "New user message: {message}\n"
+                "Return ONLY a valid JSON object in the required format."
+            ),
+        ]
+    )
+    return llm, prompt
+
+
+@lru_cache(maxsize=1)
+def _build_backup_llm():
+    """Model for hedged duplicates (AI_HEDGE_FALLBACK_MODEL, else the primary)."""
+    if not hedging.HEDGE_FALLBACK_MODEL:
+        return _build_chain()[0]
+
+    from langchain_openai import ChatOpenAI
+
+    from . import reply_schema
+
+    return ChatOpenAI(
+        model=hedging.HEDGE_FALLBACK_MODEL,
+        temperature=0.4,
+        max_tokens=reply_schema.MAX_OUTPUT_TOKENS,
+        stream_usage=True,
+        api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+
+@lru_cache(maxsize=1)
+def _build_degraded_llm():
+    """Cheaper model used while the "model" stage is degraded (ai_engine.degradation)."""
+    from langchain_openai import ChatOpenAI
+
+    from . import reply_schema
+
+    return ChatOpenAI(
+        model=os.getenv("AI_DEGRADED_MODEL", "gpt-4.1-nano"),
+        temperature=0.4,
+        max_tokens=reply_schema.MAX_OUTPUT_TOKENS,
+        stream_usage=True,
+        api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+
+@lru_cache(maxsize=None)
+def _build_tier_llm(tier: str):
+    """Model for a routed turn (ai.router): "small" or "large"."""
+    from langchain_openai import ChatOpenAI
+
+    from . import reply_schema
+
+    return ChatOpenAI(
+        model=router.SMALL_MODEL if tier == "small" else router.LARGE_MODEL,
+        temperature=0.4,
+        max_tokens=reply_schema.MAX_OUTPUT_TOKENS,
+        stream_usage=True,
+        api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+
+# Reply when the model is overloaded and the call was shed
+# (ai.admission); recommendations still come from the rule ranking.
+BUSY_MESSAGE = (
+    "Sorry, I'm handling a lot of requests right now. Your current choices "
+    "are kept and the options below are still up to date; please send your "
+    "message again in a moment."
+)
+
+
+def busy_reply() -> dict:
+    return {
+        "assistant_message": BUSY_MESSAGE,
+        "state_update": {},
+        "needs": {"protections": [], "addons": []},
+    }
+
+
+def is_stand_in(message: str) -> bool:
+    """BUSY_MESSAGE or reply_schema.FALLBACK: no real answer, never worth keeping."""
+    from . import reply_schema
+
+    return message in (BUSY_MESSAGE, reply_schema.FALLBACK["assistant_message"])
+
+
+def _default_answer_cache():
+    from . import semantic_cache
+
+    return semantic_cache.get_cache("sales_agent") if semantic_cache.ENABLED else None
 
 
 class SalesAgent:
     """
     AI brain: understands the user, updates preferences, and suggests
     what protections/addons are relevant. Does NOT choose specific cars.
+
+    llm / backup_llm / hedger can be injected (e.g. ai.fake_llm.FakeChatModel
+    in load tests); by default the shared models are used and calls are
+    hedged only when AI_HEDGE_ENABLED is set.
+
+    Every call goes through ai.admission. When it is shed, interactive
+    callers get busy_reply(); background callers (opening pitch) get the
+    LLMOverloaded so nothing is cached from it.
+
+    Turns are routed by ai.router first: template turns get a fixed reply
+    without a model call, and with the shared model trivial / hard turns go
+    to the small / large model instead.
+
+    Questions the same offer already got an answer to are served from
+    ai.semantic_cache (shared model only, or an injected answer_cache).
+    The key is the booked category and the catalog fingerprint (`catalog`,
+    from the session's prefetch), not the booking itself, so bookings with
+    the same offer share answers; it also covers the customer's state and
+    profile and the conversation before the question.
+
+    Replies follow ai.reply_schema: the schema is sent as a strict
+    response_format and every reply is validated; fields that are missing
+    or invalid are asked for once more on their own, and fall back to
+    reply_schema.FALLBACK if that fails too (agent.parse_failure.*,
+    agent.repair.*, agent.output_tokens in core.metrics).
     """
 
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.4,
-            max_tokens=2000,
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
-
-        self.parser = JsonOutputParser()
-
-        base_dir = Path(__file__).resolve().parent
-        prompt_path = base_dir / "prompt.txt"
-
-        if not prompt_path.exists():
-            raise FileNotFoundError(f"Prompt file not found at: {prompt_path}")
-
-        with prompt_path.open("r", encoding="utf-8") as file:
-            self.system_prompt = file.read()
-
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", self.system_prompt),
-                (
-                    "human",
-                    "Booking info: {booking}\n"
-                    "User profile: {profile}\n"
-                    "Current session state: {state}\n"
-                    "Conversation so far:\n{history}\n"
-                    "New user message: {message}\n"
-                    "Return ONLY a valid JSON object in the required format."
-                ),
-            ]
-        )
-
-    def run(self, booking, profile, state, message, history: str = ""):
-        chain = self.prompt | self.llm | self.parser
-
-        return chain.invoke(
-            {
-                "booking": booking,
-                "profile": profile,
-                "state": state,
-                "history": history,
-                "message": message,
-            }
-        )
+    def __init__(self, llm=None, backup_llm=None, hedger: Optional[hedging.Hedger] = None, answer_cache=None):
+        # Built once per process and shared by all agents
+        default_llm, self.prompt = _build_chain()
+        self.llm = llm or default_llm
+        self.system_prompt = _load_system_prompt()
+        # An injected model (tests, degraded turns) is not swapped by the router
+        self.routed = llm is None
+        # Set by for_turn(): template turns are recorded on it
+        self.deadline = None
+
+        # An injected model only uses an answer cache that is injected too
+        if answer_cache is None and llm is None:
+            answer_cache = _default_answer_cache()
+        self.answer_cache = answer_cache
+
+        if hedger is None and hedging.HEDGE_ENABLED:
+            hedger = hedging.get_hedger("sales_agent")
+        self.hedger = hedger
+        if hedger is not None:
+            self.backup_llm = backup_llm or (self.llm if llm is not None else _build_backup_llm())
+
+    @classmethod
+    def for_turn(cls, deadline=None) -> "SalesAgent":
+        """Agent for a chat turn: on the cheaper model when the turn is degraded."""
+        if deadline is not None and deadline.is_degraded("model"):
+            # Cached answers of the regular model are still served
+            agent = cls(llm=_build_degraded_llm(), answer_cache=_default_answer_cache())
+        else:
+            agent = cls()
+        agent.deadline = deadline
+        return agent
+
+    def _inputs(self, booking, profile, state, message, history):
+        return {
+            "booking": booking,
+            "profile": profile,
+            "state": state,
+            "history": history,
+            "message": message,
+        }
+
+    def _tokens(self, llm, inputs) -> int:
+        return admission.estimate_tokens(self.system_prompt, *inputs.values(), max_tokens=getattr(llm, "max_tokens", None))
+
+    def _chain(self, llm):
+        from . import reply_schema
+
+        return self.prompt | llm.bind(response_format=reply_schema.RESPONSE_FORMAT)
+
+    def _invoke(self, llm, inputs, max_wait=None):
+        admission.acquire(admission.model_name(llm), self._tokens(llm, inputs), max_wait=max_wait)
+        return self._finish(llm, inputs, self._chain(llm).invoke(inputs))
+
+    async def _ainvoke(self, llm, inputs, max_wait=None):
+        await admission.aacquire(admission.model_name(llm), self._tokens(llm, inputs), max_wait=max_wait)
+        return await self._afinish(llm, inputs, await self._chain(llm).ainvoke(inputs))
+
+    # ---- reply validation / repair (ai.reply_schema) ----
+
+    @staticmethod
+    def _output_tokens(message) -> int:
+        usage = getattr(message, "usage_metadata", None) or {}
+        return usage.get("output_tokens") or len(message.content) // 4
+
+    def _parse(self, message):
+        from . import reply_schema
+
+        result, missing = reply_schema.check(reply_schema.loads(message.content if message else ""))
+        for name in missing:
+            metrics.incr(f"agent.parse_failure.{name}")
+        if missing:
+            metrics.incr("agent.parse_failure")
+        return result, missing
+
+    def _repair_call(self, llm, inputs, message, missing):
+        """(bound model, messages, token estimate) asking only for `missing`."""
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        from . import reply_schema
+
+        model = reply_schema.repair_model(missing)
+        max_tokens = reply_schema.max_output_tokens(model)
+        messages = self.prompt.format_messages(**inputs) + [
+            AIMessage(content=message.content if message else ""),
+            HumanMessage(content=reply_schema.repair_instruction(missing)),
+        ]
+        tokens = admission.estimate_tokens(*(m.content for m in messages), max_tokens=max_tokens)
+        return llm.bind(response_format=reply_schema.response_format(model), max_tokens=max_tokens), messages, tokens
+
+    def _repaired(self, reply, missing) -> dict:
+        from . import reply_schema
+
+        return reply_schema.check(reply_schema.loads(reply.content), missing)[0]
+
+    def _merge(self, result, repaired, missing, output_tokens) -> dict:
+        from . import reply_schema
+
+        still = [name for name in missing if name not in repaired]
+        metrics.incr("agent.repair.failed" if still else "agent.repair.ok")
+        metrics.observe("agent.output_tokens", output_tokens)
+        merged = {**result, **repaired}
+        return {name: merged[name] if name in merged else copy.deepcopy(reply_schema.FALLBACK[name])
+                for name in reply_schema.FIELDS}
+
+    def _finish(self, llm, inputs, message) -> dict:
+        result, missing = self._parse(message)
+        output_tokens = self._output_tokens(message) if message else 0
+        if not missing:
+            metrics.observe("agent.output_tokens", output_tokens)
+            return result
+
+        repaired = {}
+        try:
+            bound, messages, tokens = self._repair_call(llm, inputs, message, missing)
+            admission.acquire(admission.model_name(llm), tokens)
+            reply = bound.invoke(messages)
+            output_tokens += self._output_tokens(reply)
+            repaired = self._repaired(reply, missing)
+        except Exception as e:
+            print(f"[ai_engine] reply repair failed: {e}")
+        return self._merge(result, repaired, missing, output_tokens)
+
+    async def _afinish(self, llm, inputs, message) -> dict:
+        result, missing = self._parse(message)
+        output_tokens = self._output_tokens(message) if message else 0
+        if not missing:
+            metrics.observe("agent.output_tokens", output_tokens)
+            return result
+
+        repaired = {}
+        try:
+            bound, messages, tokens = self._repair_call(llm, inputs, message, missing)
+            await admission.aacquire(admission.model_name(llm), tokens)
+            reply = await bound.ainvoke(messages)
+            output_tokens += self._output_tokens(reply)
+            repaired = self._repaired(reply, missing)
+        except Exception as e:
+            print(f"[ai_engine] reply repair failed: {e}")
+        return self._merge(result, repaired, missing, output_tokens)
+
+    def _route(self, message, history, state=None) -> Optional[router.Route]:
+        if not router.ENABLED:
+            return None
+        route = router.classify(message, history, state)
+        if route.tier != "template" and not self.routed:
+            return None
+        if route.tier == "template" and self.deadline is not None:
+            # The rest of the turn stays model-free too (no LLM re-rank)
+            self.deadline.record("agent", "template")
+        return route
+
+    # ---- answer cache (ai.semantic_cache) ----
+
+    def _cache_key(self, booking, profile, state, message, history, catalog):
+        """(question, fingerprint) if the answer may come from the cache, else None."""
+        if self.answer_cache is None or catalog is None or "comparison" in (state or {}):
+            return None
+        from . import semantic_cache
+        from ..catalog import payload_fingerprint
+
+        if not semantic_cache.is_question(message):
+            return None
+        # The history ends with the question itself; only what came before
+        # decides what "it" / "that one" refer to
+        question = f"User: {message}"
+        before = history[:-len(question)].rstrip("\n") if history.endswith(question) else history
+        return message, payload_fingerprint([
+            (booking or {}).get("bookedCategory"),
+            catalog,
+            state or {},
+            profile or {},
+            before,
+            semantic_cache.facts(message),
+        ])
+
+    def _cached(self, key) -> Optional[dict]:
+        if key is None:
+            return None
+        result = self.answer_cache.get(*key)
+        if result is not None and self.deadline is not None:
+            self.deadline.record("agent", "cache")
+        return result
+
+    def _remember(self, key, result: dict):
+        # Only answers that did not change the customer's state, and real ones
+        if key is None or result["state_update"] or is_stand_in(result["assistant_message"]):
+            return
+        self.answer_cache.put(*key, result)
+
+    def _llm_for(self, route: Optional[router.Route]):
+        if route is None or route.tier == "default":
+            return self.llm
+        return _build_tier_llm(route.tier)
+
+    def _backup_for(self, llm):
+        return self.backup_llm if llm is self.llm else llm
+
+    def _observe(self, route: Optional[router.Route], started: float):
+        if route is None:
+            return
+        seconds = time.perf_counter() - started
+        metrics.incr(f"router.route.{route.tier}")
+        metrics.incr(f"router.intent.{route.intent}")
+        metrics.observe(f"router.latency.{route.tier}", seconds)
+        if route.tier in ("template", "small"):
+            baseline = metrics.percentile("router.latency.default", 0.5)
+            if baseline is not None:
+                metrics.incr("router.saved_seconds", max(0.0, baseline - seconds))
+
+    def _shed(self, e: admission.LLMOverloaded) -> dict:
+        if admission.current_priority() == admission.BACKGROUND:
+            raise e
+        metrics.incr("agent.busy_reply")
+        return busy_reply()
+
+    def run(self, booking, profile, state, message, history: str = "", catalog: Optional[str] = None):
+        started = time.perf_counter()
+        route = self._route(message, history, state)
+        if route is not None and route.reply is not None:
+            self._observe(route, started)
+            return route.reply
+
+        key = self._cache_key(booking, profile, state, message, history, catalog)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        inputs = self._inputs(booking, profile, state, message, history)
+        llm = self._llm_for(route)
+        try:
+            if self.hedger is None:
+                result = self._invoke(llm, inputs)
+            else:
+                # A hedge is optional: it only goes out if admitted right away
+                result = self.hedger.call(
+                    lambda: self._invoke(llm, inputs),
+                    lambda: self._invoke(self._backup_for(llm), inputs, max_wait=0),
+                )
+        except admission.LLMOverloaded as e:
+            return self._shed(e)
+        self._remember(key, result)
+        self._observe(route, started)
+        return result
+
+    async def arun(self, booking, profile, state, message, history: str = "", catalog: Optional[str] = None):
+        """Same as run(), awaiting the model (chain.ainvoke) instead of blocking."""
+        started = time.perf_counter()
+        route = self._route(message, history, state)
+        if route is not None and route.reply is not None:
+            self._observe(route, started)
+            return route.reply
+
+        key = self._cache_key(booking, profile, state, message, history, catalog)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        inputs = self._inputs(booking, profile, state, message, history)
+        llm = self._llm_for(route)
+        try:
+            if self.hedger is None:
+                result = await self._ainvoke(llm, inputs)
+            else:
+                result = await self.hedger.acall(
+                    lambda: self._ainvoke(llm, inputs),
+                    lambda: self._ainvoke(self._backup_for(llm), inputs, max_wait=0),
+                )
+        except admission.LLMOverloaded as e:
+            return self._shed(e)
+        self._remember(key, result)
+        self._observe(route, started)
+        return result
+
+    async def astream(self, booking, profile, state, message, history: str = "", catalog: Optional[str] = None):
+        """
+        Yield the reply as it is generated: the partially parsed object, so
+        "assistant_message" grows chunk by chunk. The last item is the
+        validated (and if needed repaired) result, same as run().
+        """
+        started = time.perf_counter()
+        route = self._route(message, history, state)
+        if route is not None and route.reply is not None:
+            self._observe(route, started)
+            yield route.reply
+            return
+
+        key = self._cache_key(booking, profile, state, message, history, catalog)
+        cached = self._cached(key)
+        if cached is not None:
+            yield cached
+            return
+
+        inputs = self._inputs(booking, profile, state, message, history)
+        llm = self._llm_for(route)
+        try:
+            await admission.aacquire(admission.model_name(llm), self._tokens(llm, inputs))
+        except admission.LLMOverloaded as e:
+            yield self._shed(e)
+            return
+
+        from . import reply_schema
 
+        message, last = None, None
+        async for chunk in self._chain(llm).astream(inputs):
+            message = chunk if message is None else message + chunk
+            partial = reply_schema.partial(message.content)
+            if partial and partial != last:
+                last = partial
+                yield partial
+        result = await self._afinish(llm, inputs, message)
+        self._remember(key, result)
+        yield result
+        self._observe(route, started)
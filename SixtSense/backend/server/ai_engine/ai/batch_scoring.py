@@ -0,0 +1,140 @@
+# ai_engine/ai/batch_scoring.py
+"""
+car_scoring.score_deal for many profiles at once ("what-if" ranking).
+
+    scores = score_matrix(profiles, deals, original_total_price)   # M x N
+    top = top_k(scores, k)                                         # M x k deal indices
+
+what_if() builds the response of POST /api/ai-engine/what-if/ (sales
+analytics, "compare options" view).
+
+The rules are split into deal features (N vectors, computed once per
+catalog) and profile features (M vectors); every rule is then one
+broadcast operation, so M profiles cost a few (M, N) array operations
+instead of M * N score_deal calls. top_k() orders ties by catalog
+position like rank_deals (a stable sort), so row i gives the same cars as
+rank_deals(deals, profiles[i], original_total_price, k).
+
+Keep the weights in sync with car_scoring.score_deal.
+"""
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from core import metrics
+
+from .car_scoring import get_original_price
+from .deal_row import deal_rows
+
+TRIP_TYPES = ("family", "business", "party")
+
+
+def deal_features(deals: List[Dict[str, Any]], original_total_price: float) -> Dict[str, np.ndarray]:
+    rows = deal_rows(deals)
+    groups = [r.group_type for r in rows]
+    seats = np.array([r.seats for r in rows], dtype=float)
+    luxury = np.array([r.luxury for r in rows])
+    total = np.array([r.total for r in rows], dtype=float)
+
+    # Same for every profile: quality, upsell and tier
+    uplift = total - original_total_price
+    base = (
+        np.array([r.recommended for r in rows], dtype=float)
+        + np.array([r.new for r in rows], dtype=float)
+        + np.where(uplift > 0, np.minimum(uplift / 40.0, 4.0),
+                   np.where(uplift == 0, 1.0, np.maximum(uplift / 100.0, -2.0)))
+        + np.select(
+            [total > original_total_price * 1.5, total > original_total_price * 1.2, total > original_total_price],
+            [3.0, 2.0, 1.0],
+            0.0,
+        )
+    )
+
+    return {
+        "base": base,
+        "seats": seats,
+        "big_trunk": np.array([r.bags >= 4 for r in rows]),
+        "premium": luxury | np.array(["PREMIUM" in g.upper() for g in groups]),
+        "family": np.array([g in ("SUV", "MINIVAN") for g in groups]) | (seats >= 7),
+        "business": np.array(["SEDAN" in g for g in groups]) | luxury,
+        "party": np.array([g in ("SUV", "COUPE") for g in groups]) | luxury,
+    }
+
+
+def profile_features(profiles: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    features = {
+        "passengers": np.array([p.get("passengers") or 0 for p in profiles], dtype=float),
+        "many_luggage": np.array([p.get("luggage") == "many" for p in profiles]),
+        "high_comfort": np.array([p.get("comfort_priority") == "high" for p in profiles]),
+    }
+    for trip_type in TRIP_TYPES:
+        features[trip_type] = np.array([p.get("trip_type") == trip_type for p in profiles])
+    return features
+
+
+def score_matrix(profiles: List[Dict[str, Any]], deals: List[Dict[str, Any]],
+                 original_total_price: float) -> np.ndarray:
+    """(len(profiles), len(deals)) scores; row i, column j == score_deal(deals[j], profiles[i], ...)."""
+    d = deal_features(deals, original_total_price)
+    p = profile_features(profiles)
+
+    passengers = p["passengers"][:, None]
+    scores = np.broadcast_to(d["base"], (len(profiles), len(deals))).copy()
+    scores += 3.0 * ((passengers > 0) & (d["seats"] >= passengers))
+    scores += 2.0 * np.outer(p["many_luggage"], d["big_trunk"])
+    scores += 3.0 * np.outer(p["high_comfort"], d["premium"])
+    for trip_type in TRIP_TYPES:
+        scores += 2.0 * np.outer(p[trip_type], d[trip_type])
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best deals per row, best first (ties: catalog order)."""
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def rank_profiles(profiles: List[Dict[str, Any]], deals: List[Dict[str, Any]],
+                  original_total_price: float, k: int = 3) -> List[List[Dict[str, Any]]]:
+    """rank_deals() for every profile, in one pass."""
+    if not profiles or not deals:
+        return [[] for _ in profiles]
+    top = top_k(score_matrix(profiles, deals, original_total_price), k)
+    return [[deals[j] for j in row] for row in top]
+
+
+def what_if(deals: List[Dict[str, Any]], profiles: List[Dict[str, Any]], k: int = 3,
+            include_scores: bool = False) -> Dict[str, Any]:
+    """Response of the what-if endpoint: top-k cars per profile for one booking's deals."""
+    started = time.perf_counter()
+    original_price = get_original_price(deals)
+    scores = score_matrix(profiles, deals, original_price) if deals else np.zeros((len(profiles), 0))
+    top = top_k(scores, k)
+    seconds = time.perf_counter() - started
+    metrics.observe("whatif.seconds", seconds)
+    metrics.incr("whatif.profiles", len(profiles))
+
+    result = {
+        "original_price": original_price,
+        "vehicles": {
+            d["vehicle"]["id"]: {
+                "brand": d["vehicle"].get("brand"),
+                "model": d["vehicle"].get("model"),
+                "groupType": d["vehicle"].get("groupType"),
+                "total_price": d["pricing"]["totalPrice"]["amount"],
+            }
+            for d in deals
+        },
+        "rankings": [
+            {
+                "profile": profile,
+                "cars": [{"id": deals[j]["vehicle"]["id"], "score": round(float(scores[i, j]), 3)} for j in row],
+            }
+            for i, (profile, row) in enumerate(zip(profiles, top))
+        ],
+        "seconds": round(seconds, 4),
+    }
+    if include_scores:
+        # Columns in the order of "vehicles"
+        result["scores"] = np.round(scores, 3).tolist()
+    return result
@@ -0,0 +1,237 @@
+# ai_engine/ai/bundles.py
+"""
+Best protection + addon bundles for the money the customer has left.
+
+recommend_protections / recommend_addons score every item on its own; the
+totals were left to the LLM. best_bundles() picks exactly one protection
+package and any addons (an option with selectionStrategy
+isMultiSelectionAllowed up to maxSelectionLimit times, otherwise at most
+once) so that the bundle
+
+    maximises the summed item scores (protection_engine.score_*),
+    costs at most `budget`,
+    and, between bundles of the same score, is the cheapest,
+
+and returns the top `n` of them. Without a budget there is nothing to
+trade off and no bundles are built.
+
+Quantities are capped by need (_need()): one child seat or additional
+driver per passenger besides the driver, one unit of anything else. The
+child seat types (CHILD_SEATS) are alternatives: a bundle has seats of
+one type only. The search is an exact branch and bound
+over the options: a node is dropped when even the fractional-knapsack
+bound of what is left cannot reach the n-th best bundle found so far.
+Prices are compared in cents.
+
+The k-th unit of an addon counts score / 2**(k-1): a second child seat is
+worth less than the first, so extra units only make it into a bundle when
+the budget allows.
+"""
+import heapq
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import metrics
+
+from .protection_engine import score_addon, score_protection
+
+
+def rental_days(packages: List[Dict[str, Any]]) -> int:
+    """Days of the rental, from a package's total vs daily price (1 when unknown)."""
+    for pkg in packages:
+        price = pkg.get("price") or {}
+        daily = (price.get("displayPrice") or {}).get("amount")
+        total = (price.get("totalPrice") or {}).get("amount")
+        if daily and total:
+            return max(1, round(total / daily))
+    return 1
+
+
+def _cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+# Baby seat, child seat, booster: one family, a bundle picks one of them
+CHILD_SEATS = ("BS", "CS", "BO")
+PER_PASSENGER = CHILD_SEATS + ("AD",)
+
+
+def _need(cid: str, state: Dict[str, Any]) -> int:
+    """Most units of an addon the customer can use."""
+    passengers = state.get("passengers")
+    if cid in PER_PASSENGER and isinstance(passengers, int) and passengers > 1:
+        # Everyone but the driver
+        return passengers - 1
+    return 1
+
+
+def _density(choices: "Choices") -> float:
+    """Best value per cent of a group's choices (free ones first)."""
+    return max(value / cents if cents else float("inf") for value, cents, _ in choices[1:])
+
+
+# A decision of the search is a list of choices (value, cents, item): the
+# protection packages (exactly one is picked), or 0..limit units of one
+# addon (of one of the child seat types).
+Choices = List[Tuple[float, int, Any]]
+
+
+def _protection_choices(packages, state, needs) -> Choices:
+    choices = []
+    for pkg in packages:
+        score, why = score_protection(pkg, state, needs)
+        choices.append((float(score), _cents(pkg["price"]["totalPrice"]["amount"]), (pkg, why)))
+    return choices
+
+
+def _addon_choices(addons, state, needs, days) -> List[Choices]:
+    families: Dict[str, Choices] = {}
+    for group in addons:
+        for option in group.get("options", []):
+            info = option["additionalInfo"]
+            if info.get("isEnabled") is False:
+                continue
+            score, why = score_addon(option, state, needs)
+            if score <= 0:
+                # Never adds value, only cost
+                continue
+            cid = option["chargeDetail"]["id"]
+            strategy = info.get("selectionStrategy") or {}
+            limit = max(1, strategy.get("maxSelectionLimit", 1)) if strategy.get("isMultiSelectionAllowed") else 1
+            limit = min(limit, _need(cid, state))
+            price = info["price"]
+            unit = _cents(price["totalPrice"]["amount"] if price.get("totalPrice") else price["displayPrice"]["amount"] * days)
+            choices = families.setdefault("child_seat" if cid in CHILD_SEATS else cid, [(0.0, 0, None)])
+            for quantity in range(1, limit + 1):
+                value = sum(score / 2 ** k for k in range(quantity))
+                choices.append((value, unit * quantity, (option, why, quantity)))
+    # Best value per cent first: good bundles early let the bound prune more
+    return sorted(families.values(), key=lambda choices: -_density(choices))
+
+
+def _units(groups: List[Choices]) -> List[Tuple[float, int]]:
+    """
+    Addon choices as single units (value, cents), best value per cent first.
+    The units of every alternative of a group count, which only loosens the
+    bound (it stays an upper bound).
+    """
+    units = []
+    for choices in groups:
+        previous: Dict[int, Tuple[float, int]] = {}
+        for value, cents, (option, _, _) in choices[1:]:
+            last_value, last_cents = previous.get(id(option), (0.0, 0))
+            units.append((value - last_value, cents - last_cents))
+            previous[id(option)] = (value, cents)
+    units.sort(key=lambda u: -u[0] / u[1] if u[1] else float("-inf"))
+    return units
+
+
+def _fractional_bound(units: List[Tuple[float, int]], budget: int) -> float:
+    """Upper bound of the value these units can add within budget (fractional knapsack)."""
+    bound, left = 0.0, budget
+    for value, cents in units:
+        if cents <= left:
+            bound += value
+            left -= cents
+        else:
+            bound += value * left / cents
+            break
+    return bound
+
+
+def _search(groups: List[Choices], budget: int, n: int):
+    """
+    Top-n (value, cents, picks) by value, then price; picks holds one choice
+    index per group. groups[0] (the protection) is the only group where a
+    choice has to be made.
+    """
+    # Bound of what the addons groups[depth:] can still add
+    suffix_units = [None] + [_units(groups[depth:]) for depth in range(1, len(groups) + 1)]
+
+    best: List[Tuple[float, int, Tuple[int, ...]]] = []  # min-heap of (value, -cents, picks)
+    nodes = 0
+
+    def visit(depth: int, value: float, cents: int, picks: Tuple[int, ...]):
+        nonlocal nodes
+        nodes += 1
+        if depth == len(groups):
+            entry = (value, -cents, picks)
+            if len(best) < n:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+            return
+        left = budget - cents
+        if depth and len(best) == n and value + _fractional_bound(suffix_units[depth], left) < best[0][0]:
+            return
+        # Most units first, same reason as the group order
+        order = range(len(groups[depth])) if depth == 0 else reversed(range(len(groups[depth])))
+        for index in order:
+            choice_value, choice_cents, _ = groups[depth][index]
+            if choice_cents > left:
+                continue
+            visit(depth + 1, value + choice_value, cents + choice_cents, picks + (index,))
+
+    visit(0, 0.0, 0, ())
+    metrics.observe("bundles.nodes", nodes)
+    return [(value, -neg_cents, picks) for value, neg_cents, picks in sorted(best, reverse=True)]
+
+
+def best_bundles(
+    packages: List[Dict[str, Any]],
+    addons: List[Dict[str, Any]],
+    state: Dict[str, Any],
+    needs: Dict[str, Any],
+    budget: Optional[float] = None,
+    n: int = 3,
+) -> List[Dict[str, Any]]:
+    """
+    The n best-value bundles that fit `budget` (what is left for extras),
+    best first. Empty without a budget, without packages or when nothing
+    fits.
+    """
+    if budget is None or not packages or n <= 0:
+        return []
+    started = time.perf_counter()
+    days = rental_days(packages)
+    groups = [_protection_choices(packages, state, needs.get("protections", []))]
+    groups += _addon_choices(addons, state, needs.get("addons", []), days)
+
+    found = _search(groups, _cents(max(budget, 0.0)), n)
+    metrics.observe("bundles.seconds", time.perf_counter() - started)
+
+    currency = packages[0]["price"]["totalPrice"].get("currency")
+    return [_bundle(groups, picks, value, cents, currency, days) for value, cents, picks in found]
+
+
+def _bundle(groups, picks, value, cents, currency, days) -> Dict[str, Any]:
+    pkg, why = groups[0][picks[0]][2]
+    why_parts = list(why)
+    items = []
+    for choices, index in zip(groups[1:], picks[1:]):
+        choice = choices[index]
+        if choice[2] is None:
+            continue
+        option, option_why, quantity = choice[2]
+        why_parts += [w for w in option_why if w not in why_parts]
+        items.append({
+            "id": option["chargeDetail"]["id"],
+            "name": option["chargeDetail"]["title"],
+            "quantity": quantity,
+            "total_price": choice[1] / 100,
+        })
+
+    return {
+        "id": "+".join([pkg["id"]] + [a["id"] if a["quantity"] == 1 else f"{a['id']}*{a['quantity']}" for a in items]),
+        "protection": {
+            "id": pkg["id"],
+            "name": pkg["name"],
+            "total_price": pkg["price"]["totalPrice"]["amount"],
+        },
+        "addons": items,
+        "total_price": cents / 100,
+        "currency": currency,
+        "days": days,
+        "score": round(value, 3),
+        "why": " ".join(why_parts) or "Best value for your budget.",
+    }
@@ -1,54 +1,90 @@
 # ai_engine/ai/car_scoring.py
-from typing import List, Dict, Any, Optional
-from langchain_openai import ChatOpenAI
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Callable, Optional, Tuple, TYPE_CHECKING
 
+from core import metrics
 
-def score_deal(deal: Dict[str, Any],
-               profile: Dict[str, Any],
-               original_total_price: float) -> float:
+from ..deadline import RERANK_MIN_BUDGET, RERANK_MAX_SECONDS
+
+from . import admission
+from .deal_row import DealRow, deal_rows
+
+if TYPE_CHECKING:
+    # imported lazily in _rerank_llm, only when the LLM re-rank is used
+    from langchain_openai import ChatOpenAI
+
+    from ..deadline import Deadline
+
+# Runs deadline-bound re-rank calls so the caller can stop waiting for them
+_rerank_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_RERANK_WORKERS", "8")),
+    thread_name_prefix="rerank",
+)
+
+# What re-ranks the candidates: "llm", or "learned" (ai.learned_ranker, no
+# LLM call). In "llm" mode a trained model still ranks them in shadow.
+RERANKER = os.getenv("AI_RERANKER", "llm").lower()
+
+
+def get_original_price(deals: List[Dict[str, Any]]) -> float:
+    """
+    Total price of the booked category (the baseline for upsell scoring).
+    """
+    for d in deals:
+        if d.get("dealInfo") == "BOOKED_CATEGORY":
+            return d["pricing"]["totalPrice"]["amount"]
+    if deals:
+        return deals[0]["pricing"]["totalPrice"]["amount"]
+    return 0.0
+
+
+def score_row(row: DealRow,
+              profile: Dict[str, Any],
+              original_total_price: float) -> float:
     """
     Rule-based scoring: matches vehicle features to customer needs.
     Higher score = better match for upselling.
     """
     score = 0.0
-    vehicle = deal["vehicle"]
-    pricing = deal["pricing"]
 
     # Core needs
     passengers = profile.get("passengers")
-    if passengers and vehicle.get("passengersCount", 0) >= passengers:
+    if passengers and row.seats >= passengers:
         score += 3
 
     luggage = profile.get("luggage")
-    if luggage == "many" and vehicle.get("bagsCount", 0) >= 4:
+    if luggage == "many" and row.bags >= 4:
         score += 2
 
     # Comfort & trip type
     comfort = profile.get("comfort_priority")
     if comfort == "high":
-        if vehicle.get("isMoreLuxury") or "PREMIUM" in vehicle.get("groupType", "").upper():
+        if row.luxury or "PREMIUM" in row.group_type.upper():
             score += 3
 
     trip_type = profile.get("trip_type")
     if trip_type == "family":
-        if vehicle.get("groupType") in ["SUV", "MINIVAN"] or vehicle.get("passengersCount", 0) >= 7:
+        if row.group_type in ["SUV", "MINIVAN"] or row.seats >= 7:
             score += 2
     if trip_type == "business":
-        if "SEDAN" in vehicle.get("groupType", "") or vehicle.get("isMoreLuxury"):
+        if "SEDAN" in row.group_type or row.luxury:
             score += 2
     if trip_type == "party":
         # prefer fun / SUV / ‘moreLuxury’
-        if vehicle.get("groupType") in ["SUV", "COUPE"] or vehicle.get("isMoreLuxury"):
+        if row.group_type in ["SUV", "COUPE"] or row.luxury:
             score += 2
 
     # Quality indicators
-    if vehicle.get("isRecommended"):
+    if row.recommended:
         score += 1
-    if vehicle.get("isNewCar"):
+    if row.new:
         score += 1
 
     # Price-based scoring: upsell but stay reasonable
-    total_price = pricing["totalPrice"]["amount"]
+    total_price = row.total
     uplift = total_price - original_total_price
     if uplift > 0:
         # reward upsell, but cap it
@@ -69,35 +105,57 @@ def score_deal(deal: Dict[str, Any],
     return score
 
 
+def score_deal(deal: Dict[str, Any],
+               profile: Dict[str, Any],
+               original_total_price: float) -> float:
+    return score_row(DealRow.from_deal(deal), profile, original_total_price)
+
+
+def rank_rows(rows: List[DealRow],
+              profile: Dict[str, Any],
+              original_total_price: float,
+              k: int = 3) -> List[DealRow]:
+    scored = [(score_row(r, profile, original_total_price), r) for r in rows]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [r for s, r in scored[:k]]
+
+
 def rank_deals(deals: List[Dict[str, Any]],
                profile: Dict[str, Any],
                original_total_price: float,
                k: int = 3) -> List[Dict[str, Any]]:
-    scored = []
-    for d in deals:
-        s = score_deal(d, profile, original_total_price)
-        scored.append((s, d))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [d for s, d in scored[:k]]
+    return [r.deal for r in rank_rows(deal_rows(deals), profile, original_total_price, k)]
 
 
-def llm_rank_all_deals_batch(
-    deals: List[Dict[str, Any]],
-    profile: Dict[str, Any],
-    original_total_price: float,
-    k: int = 3,
-    llm: Optional[ChatOpenAI] = None,
-) -> List[Dict[str, Any]]:
+# rank(deals, k) -> the k best deals; rank_deals for one profile, or the
+# cached scores of an ai.ranking_session.RankingSession
+Rank = Callable[[List[Dict[str, Any]], int], List[Dict[str, Any]]]
+
+
+def rule_rank(profile: Dict[str, Any], original_total_price: float) -> Rank:
     """
-    Optional: use LLM to re-rank a small candidate set.
+    rank_deals for one profile. hybrid_rank_deals ranks the same deals more
+    than once (candidates, rule fallback): each deal is flattened and
+    scored only the first time.
     """
-    if not deals:
-        return []
+    # id(deal) -> (deal, score); the deal keeps its id from being reused
+    scores: Dict[int, Tuple[Dict[str, Any], float]] = {}
 
-    if llm is None:
-        # fallback to rule-based
-        return rank_deals(deals, profile, original_total_price, k)
+    def score(deal):
+        entry = scores.get(id(deal))
+        if entry is None:
+            entry = scores[id(deal)] = (deal, score_row(DealRow.from_deal(deal), profile, original_total_price))
+        return entry[1]
 
+    return lambda deals, k: sorted(deals, key=score, reverse=True)[:k]
+
+
+def _rerank_prompt(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int,
+) -> str:
     # Build concise vehicle descriptions
     vehicles_summary = []
     for i, deal in enumerate(deals):
@@ -134,7 +192,7 @@ def llm_rank_all_deals_batch(
 
     customer_desc = ", ".join(profile_parts) if profile_parts else "general needs"
 
-    prompt = f"""You are a car rental expert. Rank these {len(deals)} vehicles for this customer from BEST to WORST match.
+    return f"""You are a car rental expert. Rank these {len(deals)} vehicles for this customer from BEST to WORST match.
 
 Customer needs: {customer_desc}
 Original booking price: {original_total_price}
@@ -150,27 +208,94 @@ Instructions:
 
 Respond with ONLY the top {k} vehicle numbers in order, comma-separated (e.g., "3,1,2")."""
 
+
+def _parse_rerank(content: str, deals: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    indices = [int(x.strip()) - 1 for x in content.strip().split(",")]
+    result = []
+    for i in indices[:k]:
+        if 0 <= i < len(deals):
+            result.append(deals[i])
+    return result or deals[:k]
+
+
+def _llm_rerank(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int,
+    llm: "ChatOpenAI",
+    max_wait: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    prompt = _rerank_prompt(deals, profile, original_total_price, k)
+    admission.acquire(admission.model_name(llm), admission.estimate_tokens(prompt), max_wait=max_wait)
+    resp = llm.invoke([{"role": "user", "content": prompt}])
+    return _parse_rerank(resp.content, deals, k)
+
+
+async def _allm_rerank(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int,
+    llm: "ChatOpenAI",
+    max_wait: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    prompt = _rerank_prompt(deals, profile, original_total_price, k)
+    await admission.aacquire(admission.model_name(llm), admission.estimate_tokens(prompt), max_wait=max_wait)
+    resp = await llm.ainvoke([{"role": "user", "content": prompt}])
+    return _parse_rerank(resp.content, deals, k)
+
+
+def llm_rank_all_deals_batch(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int = 3,
+    llm: Optional["ChatOpenAI"] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Optional: use LLM to re-rank a small candidate set.
+    Falls back to the rule ranking on any error, including a shed call
+    (ai.admission).
+    """
+    if not deals:
+        return []
+
+    if llm is None:
+        # fallback to rule-based
+        return rank_deals(deals, profile, original_total_price, k)
+
     try:
-        resp = llm.invoke([{"role": "user", "content": prompt}])
-        indices = [int(x.strip()) - 1 for x in resp.content.strip().split(",")]
-        result = []
-        for i in indices[:k]:
-            if 0 <= i < len(deals):
-                result.append(deals[i])
-        return result or deals[:k]
+        return _llm_rerank(deals, profile, original_total_price, k, llm)
     except Exception:
         return rank_deals(deals, profile, original_total_price, k)
 
 
-def hybrid_rank_deals(
+async def allm_rank_all_deals_batch(
     deals: List[Dict[str, Any]],
     profile: Dict[str, Any],
     original_total_price: float,
     k: int = 3,
-    use_llm: bool = False,
+    llm: Optional["ChatOpenAI"] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Hybrid strategy: filter → rule-based scoring → optional LLM reranking.
+    Async version of llm_rank_all_deals_batch (llm.ainvoke).
+    """
+    if not deals:
+        return []
+
+    if llm is None:
+        return rank_deals(deals, profile, original_total_price, k)
+
+    try:
+        return await _allm_rerank(deals, profile, original_total_price, k, llm)
+    except Exception:
+        return rank_deals(deals, profile, original_total_price, k)
+
+
+def filter_deals(deals: List[Dict[str, Any]], profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Hard filters; returns all deals when nothing passes.
     """
     filtered = []
 
@@ -192,17 +317,267 @@ def hybrid_rank_deals(
 
         filtered.append(d)
 
-    if not filtered:
-        filtered = deals
+    return filtered or deals
 
-    if not use_llm:
-        return rank_deals(filtered, profile, original_total_price, k)
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1)
+def _rerank_candidates(filtered: List[Dict[str, Any]], rank: Rank) -> Optional[List[Dict[str, Any]]]:
+    """
+    Deals worth sending to the LLM, or None when the set is too large.
+    """
     if len(filtered) <= 5:
-        return llm_rank_all_deals_batch(filtered, profile, original_total_price, k, llm)
+        return filtered
     elif len(filtered) <= 15:
-        top_rule = rank_deals(filtered, profile, original_total_price, k=10)
-        return llm_rank_all_deals_batch(top_rule, profile, original_total_price, k, llm)
-    else:
-        return rank_deals(filtered, profile, original_total_price, k)
+        return rank(filtered, 10)
+    return None
+
+
+def rerank_candidates(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    filtered: Optional[List[Dict[str, Any]]] = None,
+    rank: Optional[Rank] = None,
+) -> List[Dict[str, Any]]:
+    """
+    The cars a re-ranker chooses from for this profile (the rule top 10
+    when the filtered set is too large for the LLM).
+    """
+    if filtered is None:
+        filtered = filter_deals(deals, profile)
+    rank = rank or rule_rank(profile, original_total_price)
+    candidates = _rerank_candidates(filtered, rank)
+    if candidates is None:
+        return rank(filtered, 10)
+    return candidates
+
+
+def candidate_row(deal: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What ai.learned_ranker needs from a deal (logged with every turn).
+    """
+    return DealRow.from_deal(deal).candidate()
+
+
+def _rerank_llm(timeout: Optional[float] = None) -> "ChatOpenAI":
+    from langchain_openai import ChatOpenAI
+
+    if timeout is None:
+        return ChatOpenAI(model="gpt-4o-mini", temperature=0.1)
+    # With a deadline a retry could never finish in time
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0.1, timeout=timeout, max_retries=0)
+
+
+def _record(deadline: Optional["Deadline"], path: str):
+    if deadline is not None:
+        deadline.record("rerank", path)
+
+
+def _plan_rerank(
+    filtered: List[Dict[str, Any]],
+    rank: Rank,
+    use_llm: bool,
+    deadline: Optional["Deadline"],
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[float]]:
+    """
+    Decide whether the LLM re-rank runs: returns (candidates, timeout).
+    candidates is None when the rule ranking is used as-is (the reason is
+    recorded on the deadline); timeout is None when there is no deadline.
+    """
+    if not use_llm:
+        _record(deadline, "rules")
+        return None, None
+
+    candidates = _rerank_candidates(filtered, rank)
+    if candidates is None:
+        _record(deadline, "rules_large_set")
+        return None, None
+
+    if deadline is None:
+        return candidates, None
+    if deadline.paths.get("agent") == "template":
+        _record(deadline, "rules_template")
+        return None, None
+    if deadline.is_degraded("rerank"):
+        _record(deadline, "rules_degraded")
+        return None, None
+    if deadline.remaining() < RERANK_MIN_BUDGET:
+        _record(deadline, "rules_no_budget")
+        return None, None
+    return candidates, deadline.timeout_for(RERANK_MAX_SECONDS)
+
+
+def _observe_overlap(llm_result: List[Dict[str, Any]], rule_result: List[Dict[str, Any]]):
+    # How often the (slow) LLM re-rank actually changes what we show
+    if rule_result:
+        llm_ids = {d["vehicle"]["id"] for d in llm_result}
+        same = sum(1 for d in rule_result if d["vehicle"]["id"] in llm_ids)
+        metrics.observe("rerank.rule_overlap", same / len(rule_result))
+
+
+def _learned_ranker():
+    # numpy stays out of the view imports (manage.py import_budget)
+    from .learned_ranker import get_ranker
+
+    return get_ranker()
+
+
+def _learned_rerank(
+    filtered: List[Dict[str, Any]],
+    rank: Rank,
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int,
+    deadline: Optional["Deadline"],
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    AI_RERANKER=learned: the trained model ranks the LLM candidates. None
+    when there is no model (the LLM path runs as before).
+    """
+    ranker = _learned_ranker()
+    if ranker is None:
+        return None
+    candidates = _rerank_candidates(filtered, rank)
+    if candidates is None:
+        _record(deadline, "rules_large_set")
+        return rank(filtered, k)
+    _record(deadline, "learned")
+    metrics.incr("rerank.learned")
+    return ranker.rank(candidates, profile, original_total_price, k)
+
+
+def _shadow_compare(
+    candidates: List[Dict[str, Any]],
+    llm_result: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int,
+):
+    # How close the learned model gets to the LLM on live traffic
+    try:
+        ranker = _learned_ranker()
+        if ranker is None or not llm_result:
+            return
+        learned = ranker.rank(candidates, profile, original_total_price, k)
+    except Exception:
+        metrics.incr("rerank.shadow.error")
+        return
+    llm_ids = {d["vehicle"]["id"] for d in llm_result}
+    same = sum(1 for d in learned if d["vehicle"]["id"] in llm_ids)
+    metrics.observe("rerank.shadow.overlap", same / len(llm_result))
+    metrics.observe("rerank.shadow.top1_agree",
+                    float(learned[0]["vehicle"]["id"] == llm_result[0]["vehicle"]["id"]))
+
+
+def hybrid_rank_deals(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int = 3,
+    use_llm: bool = False,
+    deadline: Optional["Deadline"] = None,
+    filtered: Optional[List[Dict[str, Any]]] = None,
+    rank: Optional[Rank] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hybrid strategy: filter → rule-based scoring → optional LLM reranking.
+
+    With a deadline the LLM re-rank gets the remaining turn budget (capped)
+    and is abandoned for the rule ranking when it does not finish in time.
+    With AI_RERANKER=learned a trained model replaces the LLM call.
+
+    filtered / rank let an ai.ranking_session.RankingSession pass the
+    filtered deals and rule ranking it keeps up to date between turns.
+    """
+    if filtered is None:
+        filtered = filter_deals(deals, profile)
+    rank = rank or rule_rank(profile, original_total_price)
+
+    if use_llm and RERANKER == "learned":
+        result = _learned_rerank(filtered, rank, profile, original_total_price, k, deadline)
+        if result is not None:
+            return result
+
+    candidates, timeout = _plan_rerank(filtered, rank, use_llm, deadline)
+    if candidates is None:
+        return rank(filtered, k)
+    if timeout is None:
+        result = llm_rank_all_deals_batch(candidates, profile, original_total_price, k, _rerank_llm())
+        _shadow_compare(candidates, result, profile, original_total_price, k)
+        return result
+
+    rule_result = rank(filtered, k)
+    # The copied context keeps the caller's admission priority
+    future = _rerank_pool.submit(
+        contextvars.copy_context().run,
+        _llm_rerank, candidates, profile, original_total_price, k, _rerank_llm(timeout), timeout,
+    )
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # The call itself stops at the client timeout; nobody waits for it
+        _record(deadline, "rules_timeout")
+        return rule_result
+    except admission.LLMOverloaded:
+        _record(deadline, "rules_shed")
+        return rule_result
+    except Exception:
+        _record(deadline, "rules_error")
+        return rule_result
+
+    _record(deadline, "llm")
+    _observe_overlap(result, rule_result)
+    _shadow_compare(candidates, result, profile, original_total_price, k)
+    return result
+
+
+async def ahybrid_rank_deals(
+    deals: List[Dict[str, Any]],
+    profile: Dict[str, Any],
+    original_total_price: float,
+    k: int = 3,
+    use_llm: bool = False,
+    deadline: Optional["Deadline"] = None,
+    filtered: Optional[List[Dict[str, Any]]] = None,
+    rank: Optional[Rank] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Async version of hybrid_rank_deals: the LLM re-rank is awaited instead
+    of blocking a thread, and cancelled when the deadline is reached.
+    """
+    if filtered is None:
+        filtered = filter_deals(deals, profile)
+    rank = rank or rule_rank(profile, original_total_price)
+
+    if use_llm and RERANKER == "learned":
+        result = _learned_rerank(filtered, rank, profile, original_total_price, k, deadline)
+        if result is not None:
+            return result
+
+    candidates, timeout = _plan_rerank(filtered, rank, use_llm, deadline)
+    if candidates is None:
+        return rank(filtered, k)
+    if timeout is None:
+        result = await allm_rank_all_deals_batch(candidates, profile, original_total_price, k, _rerank_llm())
+        _shadow_compare(candidates, result, profile, original_total_price, k)
+        return result
+
+    rule_result = rank(filtered, k)
+    try:
+        result = await asyncio.wait_for(
+            _allm_rerank(candidates, profile, original_total_price, k, _rerank_llm(timeout), timeout),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        _record(deadline, "rules_timeout")
+        return rule_result
+    except admission.LLMOverloaded:
+        _record(deadline, "rules_shed")
+        return rule_result
+    except Exception:
+        _record(deadline, "rules_error")
+        return rule_result
+
+    _record(deadline, "llm")
+    _observe_overlap(result, rule_result)
+    _shadow_compare(candidates, result, profile, original_total_price, k)
+    return result
@@ -0,0 +1,78 @@
+# ai_engine/ai/deal_row.py
+"""
+Flat view of a deal with only what ranking reads.
+
+A SIXT deal is a nested dict (vehicle with images, attributes,
+upsellReasons, ...; pricing with display and total price). The rules read
+the same handful of fields for every profile, every turn:
+
+    deal["vehicle"]["passengersCount"]            -> row.seats
+    deal["pricing"]["totalPrice"]["amount"]       -> row.total
+
+A DealRow holds those fields in __slots__ (no per-row __dict__) plus a
+reference to the upstream dict, which is what the results are built from.
+Rows are built once per deal: per hybrid_rank_deals call (car_scoring.
+rule_rank), per catalog and chat (RankingSession), per what-if request
+(batch_scoring) and per logged candidate (learned_ranker).
+
+`manage.py ranking_bench` compares memory per deal and scoring throughput
+with the dict form.
+"""
+from typing import Any, Dict, List, Optional
+
+
+class DealRow:
+    __slots__ = ("deal", "id", "seats", "bags", "group_type", "luxury", "recommended", "new", "total")
+
+    def __init__(self, deal: Optional[Dict[str, Any]], id: str, seats: int, bags: int, group_type: str,
+                 luxury: bool, recommended: bool, new: bool, total: float):
+        self.deal = deal
+        self.id = id
+        self.seats = seats
+        self.bags = bags
+        self.group_type = group_type
+        self.luxury = luxury
+        self.recommended = recommended
+        self.new = new
+        self.total = total
+
+    @classmethod
+    def from_deal(cls, deal: Dict[str, Any]) -> "DealRow":
+        v = deal["vehicle"]
+        return cls(
+            deal,
+            v["id"],
+            v.get("passengersCount", 0),
+            v.get("bagsCount", 0),
+            v.get("groupType") or "",
+            bool(v.get("isMoreLuxury")),
+            bool(v.get("isRecommended")),
+            bool(v.get("isNewCar")),
+            deal["pricing"]["totalPrice"]["amount"],
+        )
+
+    @classmethod
+    def from_candidate(cls, row: Dict[str, Any]) -> "DealRow":
+        """From a logged car_scoring.candidate_row() (no upstream deal)."""
+        return cls(None, row["id"], row["seats"], row["bags"], row["groupType"],
+                   row["luxury"], row["recommended"], row["new"], row["total"])
+
+    def candidate(self) -> Dict[str, Any]:
+        """The car_scoring.candidate_row() form."""
+        return {
+            "id": self.id,
+            "seats": self.seats,
+            "bags": self.bags,
+            "groupType": self.group_type,
+            "luxury": self.luxury,
+            "recommended": self.recommended,
+            "new": self.new,
+            "total": self.total,
+        }
+
+    def __repr__(self):
+        return f"DealRow({self.id!r}, total={self.total!r})"
+
+
+def deal_rows(deals: List[Dict[str, Any]]) -> List[DealRow]:
+    return [DealRow.from_deal(d) for d in deals]
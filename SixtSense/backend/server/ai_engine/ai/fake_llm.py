@@ -0,0 +1,61 @@
+# ai_engine/ai/fake_llm.py
+"""
+Offline chat model with an injectable latency distribution, for load tests
+and for exercising hedging / deadlines without calling OpenAI:
+
+    llm = FakeChatModel(latency=latency_distribution(median=0.8, outlier_rate=0.05))
+    SalesAgent(llm=llm).run(...)
+"""
+import asyncio
+import math
+import random
+import time
+from typing import Any, Callable, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+DEFAULT_RESPONSE = (
+    '{"assistant_message": "Happy to help with your trip!", '
+    '"state_update": {}, "needs": {"protections": [], "addons": []}}'
+)
+
+
+def latency_distribution(median: float = 0.5, sigma: float = 0.3,
+                         outlier_rate: float = 0.0, outlier_seconds: float = 5.0,
+                         seed: Optional[int] = None) -> Callable[[], float]:
+    """
+    Log-normal latencies around `median`, plus a fraction `outlier_rate`
+    of calls that take `outlier_seconds` (the provider's slow tail).
+    """
+    rng = random.Random(seed)
+
+    def sample() -> float:
+        if outlier_rate and rng.random() < outlier_rate:
+            return outlier_seconds
+        return rng.lognormvariate(math.log(median), sigma)
+
+    return sample
+
+
+class FakeChatModel(BaseChatModel):
+    response: str = DEFAULT_RESPONSE
+    latency: Callable[[], float] = lambda: 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency())
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency())
+        return self._result()
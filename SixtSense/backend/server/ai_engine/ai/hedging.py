@@ -0,0 +1,183 @@
+# ai_engine/ai/hedging.py
+"""
+Hedged LLM calls, to cut the tail latency caused by slow provider outliers.
+
+The primary request starts right away. If it has not returned after the
+AI_HEDGE_PERCENTILE latency of recent calls from the same call site, a
+duplicate goes out, to the same model or to AI_HEDGE_FALLBACK_MODEL. The
+first successful result wins. The loser is cancelled (async) or left to
+finish unobserved (sync).
+
+Extra spend is capped by a hedge budget: every call earns AI_HEDGE_MAX_RATE
+of a hedge and a hedge costs one, with at most AI_HEDGE_BURST saved up. In
+the long run at most that fraction of calls is duplicated.
+
+Off unless AI_HEDGE_ENABLED is set. Metrics per call site <name>:
+    llm.latency.<name>        primary completion times (drive the threshold)
+    llm.turn_latency.<name>   what the caller waited
+    llm.hedge.{calls,fired,won,capped,errors}.<name>
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from core import metrics
+
+HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+# Until this many latencies were seen, hedge after HEDGE_DEFAULT_DELAY
+HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "3.0"))
+HEDGE_MAX_RATE = float(os.getenv("AI_HEDGE_MAX_RATE", "0.1"))
+HEDGE_BURST = float(os.getenv("AI_HEDGE_BURST", "2"))
+# Calls over which hedge_rate() is reported
+HEDGE_WINDOW = int(os.getenv("AI_HEDGE_WINDOW", "200"))
+HEDGE_FALLBACK_MODEL = os.getenv("AI_HEDGE_FALLBACK_MODEL") or None
+
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_HEDGE_WORKERS", "32")),
+    thread_name_prefix="llm-hedge",
+)
+
+
+class Hedger:
+    def __init__(self, name: str,
+                 percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES,
+                 default_delay: float = HEDGE_DEFAULT_DELAY,
+                 max_rate: float = HEDGE_MAX_RATE,
+                 burst: float = HEDGE_BURST,
+                 window: int = HEDGE_WINDOW):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.max_rate = max_rate
+        self.burst = burst
+        self._budget = burst
+        # One bool per recent call: was it hedged?
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for the primary before hedging."""
+        name = f"llm.latency.{self.name}"
+        if metrics.get_timing_count(name) < self.min_samples:
+            return self.default_delay
+        return metrics.percentile(name, self.percentile)
+
+    def _earn(self):
+        with self._lock:
+            self._budget = min(self.burst, self._budget + self.max_rate)
+
+    def _admit_hedge(self) -> bool:
+        with self._lock:
+            allowed = self._budget >= 1
+            if allowed:
+                self._budget -= 1
+        if not allowed:
+            metrics.incr(f"llm.hedge.capped.{self.name}")
+        return allowed
+
+    def _finish(self, hedged: bool, started: float, winner: str = "primary"):
+        with self._lock:
+            self._recent.append(hedged)
+        if hedged:
+            metrics.incr(f"llm.hedge.fired.{self.name}")
+            if winner == "backup":
+                metrics.incr(f"llm.hedge.won.{self.name}")
+        metrics.observe(f"llm.turn_latency.{self.name}", time.perf_counter() - started)
+
+    def _observe_primary(self, started: float):
+        # Done-callback: record how long the primary took, even when it lost
+        def observe(future):
+            if not future.cancelled() and future.exception() is None:
+                metrics.observe(f"llm.latency.{self.name}", time.perf_counter() - started)
+        return observe
+
+    def hedge_rate(self) -> float:
+        with self._lock:
+            return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    # -----------------------------------------------------------------
+    def call(self, primary: Callable[[], Any], backup: Optional[Callable[[], Any]] = None) -> Any:
+        metrics.incr(f"llm.hedge.calls.{self.name}")
+        self._earn()
+        started = time.perf_counter()
+        # Pool threads run in the caller's context (e.g. the LLM admission priority)
+        first = _pool.submit(contextvars.copy_context().run, primary)
+        first.add_done_callback(self._observe_primary(started))
+
+        done, _ = wait([first], timeout=self.delay())
+        if done or not self._admit_hedge():
+            try:
+                return first.result()
+            finally:
+                self._finish(False, started)
+
+        second = _pool.submit(contextvars.copy_context().run, backup or primary)
+        labels = {first: "primary", second: "backup"}
+        pending, error = set(labels), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self._finish(True, started, labels[future])
+                    return future.result()
+                error = future.exception()
+                metrics.incr(f"llm.hedge.errors.{self.name}")
+        self._finish(True, started, "none")
+        raise error
+
+    async def acall(self, primary: Callable[[], Awaitable[Any]],
+                    backup: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        metrics.incr(f"llm.hedge.calls.{self.name}")
+        self._earn()
+        started = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+        first.add_done_callback(self._observe_primary(started))
+        tasks = {first: "primary"}
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay())
+            if done or not self._admit_hedge():
+                try:
+                    return await first
+                finally:
+                    self._finish(False, started)
+
+            second = asyncio.ensure_future((backup or primary)())
+            tasks[second] = "backup"
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._finish(True, started, tasks[task])
+                        return task.result()
+                    error = task.exception()
+                    metrics.incr(f"llm.hedge.errors.{self.name}")
+            self._finish(True, started, "none")
+            raise error
+        finally:
+            # The loser (or both, if the caller was cancelled)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name: str) -> Hedger:
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = Hedger(name)
+        return _hedgers[name]
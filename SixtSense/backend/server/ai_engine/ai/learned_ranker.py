@@ -0,0 +1,244 @@
+# ai_engine/ai/learned_ranker.py
+"""
+Learned re-ranker for the 5-15 cars hybrid_rank_deals used to send to the
+LLM, trained offline on what customers actually booked.
+
+Every chat turn logs its candidate set (ChatRecommender, message metadata
+"ranking": profile, original price and one car_scoring.candidate_row() per
+car). The
+label is the vehicle the booking ended up with (SIXT selectedVehicle).
+`manage.py train_ranker` turns those into (candidates, chosen) examples,
+fits a pairwise logistic model (RankNet-style, plain NumPy gradient
+descent) and writes it as JSON:
+
+    {"version": ..., "features": [...], "mean": [...], "std": [...],
+     "weights": [...], "trained_on": {...}, "metrics": {...}}
+
+Serving is one small matrix-vector product per turn. AI_RERANKER selects
+what hybrid_rank_deals does with the candidates:
+
+    llm      LLM re-rank as before; the learned model (if there is one)
+             ranks the same candidates in shadow (rerank.shadow.*)
+    learned  learned model only, no LLM call (rules if no model is loaded)
+
+The model file is AI_RANKER_MODEL (default ai/ranker.json next to this
+module); a missing file just means no learned model.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .car_scoring import candidate_row, score_row
+from .deal_row import DealRow
+
+MODEL_PATH = os.getenv("AI_RANKER_MODEL", str(Path(__file__).resolve().parent / "ranker.json"))
+
+FEATURES = (
+    "fits_passengers",
+    "seat_surplus",
+    "fits_luggage",
+    "bags",
+    "comfort_premium",
+    "premium",
+    "trip_fit",
+    "recommended",
+    "new_car",
+    "uplift_ratio",
+    "over_budget",
+    "rule_score",
+)
+
+_TRIP_FIT = {
+    "family": lambda r: r["groupType"] in ("SUV", "MINIVAN") or r["seats"] >= 7,
+    "business": lambda r: "SEDAN" in r["groupType"] or r["luxury"],
+    "party": lambda r: r["groupType"] in ("SUV", "COUPE") or r["luxury"],
+}
+
+
+def featurize(rows: Sequence[Dict[str, Any]], profile: Dict[str, Any], original_price: float) -> np.ndarray:
+    """(len(rows), len(FEATURES)) feature matrix of one candidate set."""
+    passengers = profile.get("passengers") or 0
+    budget = profile.get("budget_total")
+    trip_fit = _TRIP_FIT.get(profile.get("trip_type"))
+    many_luggage = profile.get("luggage") == "many"
+    high_comfort = profile.get("comfort_priority") == "high"
+
+    matrix = np.empty((len(rows), len(FEATURES)))
+    for i, row in enumerate(rows):
+        premium = row["luxury"] or "PREMIUM" in row["groupType"].upper()
+        matrix[i] = (
+            passengers > 0 and row["seats"] >= passengers,
+            min(row["seats"] - passengers, 4) / 4 if passengers else 0.0,
+            many_luggage and row["bags"] >= 4,
+            row["bags"] / 5,
+            high_comfort and premium,
+            premium,
+            bool(trip_fit and trip_fit(row)),
+            row["recommended"],
+            row["new"],
+            (row["total"] - original_price) / original_price if original_price else 0.0,
+            bool(budget) and row["total"] > budget,
+            score_row(DealRow.from_candidate(row), profile, original_price) / 10,
+        )
+    return matrix
+
+
+class LearnedRanker:
+    def __init__(self, weights, mean, std, version: str = "", trained_on: Optional[Dict[str, Any]] = None,
+                 metrics: Optional[Dict[str, Any]] = None):
+        self.weights = np.asarray(weights, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.std = np.asarray(std, dtype=float)
+        self.version = version
+        self.trained_on = trained_on or {}
+        self.metrics = metrics or {}
+
+    def scores(self, features: np.ndarray) -> np.ndarray:
+        return ((features - self.mean) / self.std) @ self.weights
+
+    def rank(self, deals: List[Dict[str, Any]], profile: Dict[str, Any], original_price: float,
+             k: int = 3) -> List[Dict[str, Any]]:
+        if not deals:
+            return []
+        scores = self.scores(featurize([candidate_row(d) for d in deals], profile, original_price))
+        # Stable: ties keep the rule order of the candidates
+        return [deals[i] for i in np.argsort(-scores, kind="stable")[:k]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "features": list(FEATURES),
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "weights": self.weights.tolist(),
+            "trained_on": self.trained_on,
+            "metrics": self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LearnedRanker":
+        if list(data["features"]) != list(FEATURES):
+            raise ValueError(f"Ranker {data.get('version')!r} was trained on other features: {data['features']}")
+        return cls(data["weights"], data["mean"], data["std"], data.get("version", ""),
+                   data.get("trained_on"), data.get("metrics"))
+
+    def save(self, path: str = MODEL_PATH):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "LearnedRanker":
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_dict(json.load(fh))
+
+
+# -------------------------------------------------------------------------
+#  Training
+# -------------------------------------------------------------------------
+
+# (candidate rows, profile, original price, index of the chosen car)
+Example = Tuple[List[Dict[str, Any]], Dict[str, Any], float, int]
+
+
+def _pairs(examples: List[Example]) -> np.ndarray:
+    """Chosen-minus-other feature differences, one row per (example, other candidate)."""
+    diffs = []
+    for rows, profile, original_price, chosen in examples:
+        features = featurize(rows, profile, original_price)
+        others = np.delete(np.arange(len(rows)), chosen)
+        diffs.append(features[chosen] - features[others])
+    return np.vstack(diffs) if diffs else np.empty((0, len(FEATURES)))
+
+
+def train(examples: List[Example], epochs: int = 300, learning_rate: float = 0.5,
+          l2: float = 1e-3) -> LearnedRanker:
+    """Pairwise logistic regression: the chosen car should outscore every other candidate."""
+    examples = [e for e in examples if len(e[0]) > 1]
+    if not examples:
+        raise ValueError("No training examples with at least two candidates.")
+
+    all_features = np.vstack([featurize(rows, profile, price) for rows, profile, price, _ in examples])
+    mean = all_features.mean(axis=0)
+    std = all_features.std(axis=0)
+    std[std == 0] = 1.0
+
+    diffs = _pairs(examples) / std
+    weights = np.zeros(len(FEATURES))
+    for _ in range(epochs):
+        margins = diffs @ weights
+        # d/dw mean(log(1 + exp(-margin))) = -mean(sigmoid(-margin) * diff)
+        gradient = -(diffs * (1.0 / (1.0 + np.exp(margins)))[:, None]).mean(axis=0) + l2 * weights
+        weights -= learning_rate * gradient
+
+    digest = hashlib.sha1(weights.tobytes()).hexdigest()[:8]
+    return LearnedRanker(
+        weights, mean, std,
+        version=f"{time.strftime('%Y%m%d')}-{digest}",
+        trained_on={"examples": len(examples), "pairs": int(len(diffs))},
+    )
+
+
+def evaluate(rank_fn, examples: List[Example]) -> Dict[str, float]:
+    """Top-1 accuracy and mean reciprocal rank of the chosen car; rank_fn(rows, profile, price) -> order."""
+    if not examples:
+        return {"top1": 0.0, "mrr": 0.0, "examples": 0}
+    top1, reciprocal = 0, 0.0
+    for rows, profile, original_price, chosen in examples:
+        order = list(rank_fn(rows, profile, original_price))
+        position = order.index(chosen)
+        top1 += position == 0
+        reciprocal += 1.0 / (position + 1)
+    return {"top1": round(top1 / len(examples), 4), "mrr": round(reciprocal / len(examples), 4),
+            "examples": len(examples)}
+
+
+def rule_order(rows, profile, original_price) -> List[int]:
+    scores = [score_row(DealRow.from_candidate(row), profile, original_price) for row in rows]
+    return sorted(range(len(rows)), key=lambda i: -scores[i])
+
+
+def model_order(ranker: LearnedRanker):
+    def order(rows, profile, original_price) -> List[int]:
+        return list(np.argsort(-ranker.scores(featurize(rows, profile, original_price)), kind="stable"))
+    return order
+
+
+# -------------------------------------------------------------------------
+#  Serving
+# -------------------------------------------------------------------------
+
+_ranker: Optional[LearnedRanker] = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_ranker() -> Optional[LearnedRanker]:
+    """The model in MODEL_PATH, loaded once per process; None if there is none."""
+    global _ranker, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                try:
+                    _ranker = LearnedRanker.load(MODEL_PATH)
+                    print(f"[ai_engine] learned ranker {_ranker.version} loaded")
+                except FileNotFoundError:
+                    _ranker = None
+                except (ValueError, KeyError) as e:
+                    print(f"[ai_engine] learned ranker not loaded: {e}")
+                    _ranker = None
+                _loaded = True
+    return _ranker
+
+
+def reload():
+    global _loaded
+    with _lock:
+        _loaded = False
@@ -1,5 +1,44 @@
 # ai_engine/ai/protection_engine.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+
+
+def score_protection(
+    pkg: Dict[str, Any],
+    state: Dict[str, Any],
+    abstract_needs: List[str],
+) -> Tuple[int, List[str]]:
+    """
+    How well one protection package fits the customer: (score, reasons).
+    """
+    name = pkg["name"].lower()
+    risk = state.get("risk_aversion", "medium")
+
+    score = 0
+    why_parts = []
+
+    if "full_cover" in abstract_needs or risk == "high":
+        if "peace of mind" in name or "cover the car & liability" in name:
+            score += 3
+            why_parts.append("You prefer strong protection.")
+
+    if "liability" in abstract_needs or state.get("trip_type") == "business":
+        if "liability" in name:
+            score += 2
+            why_parts.append("Liability is important for your trip.")
+
+    if "roadside" in abstract_needs or state.get("winter_driving", False):
+        if any(i.get("id") == "BC" for i in pkg.get("includes", [])):
+            score += 2
+            why_parts.append("Roadside help is useful for your conditions.")
+
+    if state.get("kids", False):
+        score += 1
+        why_parts.append("Travelling with family usually benefits from better coverage.")
+
+    if "no_protection" in abstract_needs and name.startswith("i don’t need protection"):
+        score += 100  # force this one
+
+    return score, why_parts
 
 
 def recommend_protections(
@@ -14,38 +53,8 @@ def recommend_protections(
     """
     results = []
 
-    risk = state.get("risk_aversion", "medium")
-    trip_type = state.get("trip_type")
-    winter = state.get("winter_driving", False)
-    kids = state.get("kids", False)
-
     for pkg in packages:
-        name = pkg["name"].lower()
-
-        score = 0
-        why_parts = []
-
-        if "full_cover" in abstract_needs or risk == "high":
-            if "peace of mind" in name or "cover the car & liability" in name:
-                score += 3
-                why_parts.append("You prefer strong protection.")
-
-        if "liability" in abstract_needs or trip_type == "business":
-            if "liability" in name:
-                score += 2
-                why_parts.append("Liability is important for your trip.")
-
-        if "roadside" in abstract_needs or winter:
-            if any(i.get("id") == "BC" for i in pkg.get("includes", [])):
-                score += 2
-                why_parts.append("Roadside help is useful for your conditions.")
-
-        if kids:
-            score += 1
-            why_parts.append("Travelling with family usually benefits from better coverage.")
-
-        if "no_protection" in abstract_needs and pkg["name"].lower().startswith("i don’t need protection"):
-            score += 100  # force this one
+        score, why_parts = score_protection(pkg, state, abstract_needs)
 
         if score > 0:
             results.append(
@@ -78,6 +87,34 @@ def recommend_protections(
     return results[:3]
 
 
+def score_addon(
+    option: Dict[str, Any],
+    state: Dict[str, Any],
+    abstract_needs: List[str],
+) -> Tuple[int, List[str]]:
+    """
+    How useful one addon option is to the customer: (score, reasons).
+    """
+    cid = option["chargeDetail"]["id"]
+
+    score = 0
+    why_parts = []
+
+    if "toll" in abstract_needs and cid == "T4":
+        score += 2
+        why_parts.append("You mentioned highways / long drives.")
+
+    if "additional_driver" in abstract_needs and cid == "AD":
+        score += 2
+        why_parts.append("You want to share the driving.")
+
+    if state.get("kids", False) and cid in ["BS", "CS", "BO"]:
+        score += 3
+        why_parts.append("You travel with kids, a child seat is recommended.")
+
+    return score, why_parts
+
+
 def recommend_addons(
     addons: List[Dict[str, Any]],
     state: Dict[str, Any],
@@ -88,28 +125,12 @@ def recommend_addons(
     to concrete addon options.
     """
     results = []
-    has_kids = state.get("kids", False)
 
     for group in addons:
         for option in group.get("options", []):
             cd = option["chargeDetail"]
             info = option["additionalInfo"]
-            cid = cd["id"]
-
-            score = 0
-            why_parts = []
-
-            if "toll" in abstract_needs and cid == "T4":
-                score += 2
-                why_parts.append("You mentioned highways / long drives.")
-
-            if "additional_driver" in abstract_needs and cid == "AD":
-                score += 2
-                why_parts.append("You want to share the driving.")
-
-            if has_kids and cid in ["BS", "CS", "BO"]:
-                score += 3
-                why_parts.append("You travel with kids, a child seat is recommended.")
+            score, why_parts = score_addon(option, state, abstract_needs)
 
             if score > 0:
                 price = info["price"]["displayPrice"]
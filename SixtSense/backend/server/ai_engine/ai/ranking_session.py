@@ -0,0 +1,336 @@
+# ai_engine/ai/ranking_session.py
+"""
+Per-chat car ranking that is updated instead of recomputed every turn.
+
+score_deal() is a sum of rules, and each rule reads a few profile fields:
+
+    passengers   passengers          luggage   luggage
+    comfort      comfort_priority    trip      trip_type
+    base         (deal and original price only: quality, upsell, tier)
+
+filter_deals() likewise has one hard filter per field (passengers,
+luggage, budget_total). A RankingSession keeps every deal's rule scores
+and filter results. update() diffs the new profile against the previous
+one and recomputes only the rules and filters that read a changed field;
+a new deal list (other cars or prices) recomputes everything. The filtered
+deals and a rank function over the cached scores then go to
+hybrid_rank_deals.
+
+When neither the deals nor the profile changed since the last rank()
+with the same k / use_llm, the previous result is returned as-is: no
+scoring and no LLM re-rank (deadline path rerank "unchanged"). Only
+results of a path that gives the same answer again are kept (STABLE_PATHS):
+a rule fallback after a slow or shed LLM call is not, so the next turn
+tries the re-rank again.
+
+A session is shared by the foreground turn and the background
+compute_session_recommendations job: rank() / arank() / candidates() work
+on a snapshot taken under the lock, and a result is only kept when no
+update() came in between.
+
+shown holds the vehicle ids of the cars the chat showed last (ranked
+here, or set with show()); ai.similarity uses the top one as the
+reference of "similar but cheaper".
+
+Sessions live in process memory, one per chat session id
+(get_session(), at most AI_RANKING_SESSIONS). Metrics:
+ranking_session.{full,partial,unchanged}, ranking_session.rescored
+(rule / filter columns recomputed).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from core import metrics
+
+from .car_scoring import ahybrid_rank_deals, hybrid_rank_deals, rerank_candidates
+from .deal_row import DealRow, deal_rows
+
+if TYPE_CHECKING:
+    from ..deadline import Deadline
+
+MAX_SESSIONS = int(os.getenv("AI_RANKING_SESSIONS", "2048"))
+
+# Re-rank paths (car_scoring) whose result is the same again for the same
+# deals and profile; the rule fallbacks (rules_timeout, rules_shed, ...) are not
+STABLE_PATHS = ("rules", "rules_large_set", "llm", "learned")
+
+
+def _columns(rows: List[DealRow]) -> Dict[str, list]:
+    """What the rules and filters read from the deals, one list per attribute."""
+    groups = [r.group_type for r in rows]
+    seats = [r.seats for r in rows]
+    luxury = [r.luxury for r in rows]
+    return {
+        "seats": seats,
+        "bags": [r.bags for r in rows],
+        "premium": [lux or "PREMIUM" in g.upper() for lux, g in zip(luxury, groups)],
+        "family": [g in ("SUV", "MINIVAN") or n >= 7 for g, n in zip(groups, seats)],
+        "business": ["SEDAN" in g or lux for g, lux in zip(groups, luxury)],
+        "party": [g in ("SUV", "COUPE") or lux for g, lux in zip(groups, luxury)],
+        "total": [r.total for r in rows],
+    }
+
+
+def _points(points: int, column: list) -> List[int]:
+    return [points if fits else 0 for fits in column]
+
+
+def _passengers(c, p):
+    return [3 if n >= p["passengers"] else 0 for n in c["seats"]] if p.get("passengers") else None
+
+
+def _luggage(c, p):
+    return [2 if bags >= 4 else 0 for bags in c["bags"]] if p.get("luggage") == "many" else None
+
+
+def _comfort(c, p):
+    return _points(3, c["premium"]) if p.get("comfort_priority") == "high" else None
+
+
+def _trip(c, p):
+    trip_type = p.get("trip_type")
+    return _points(2, c[trip_type]) if trip_type in ("family", "business", "party") else None
+
+
+def _seats_filter(c, p):
+    return [n >= p["passengers"] for n in c["seats"]] if p.get("passengers") else None
+
+
+def _luggage_filter(c, p):
+    return [bags >= 3 for bags in c["bags"]] if p.get("luggage") == "many" else None
+
+
+def _budget_filter(c, p):
+    budget = p.get("budget_total")
+    return [total <= budget * 1.5 for total in c["total"]] if budget else None
+
+
+# name -> (profile fields read, per-deal points or None when 0 for all);
+# keep in sync with score_row
+RULES = {
+    "passengers": (("passengers",), _passengers),
+    "luggage": (("luggage",), _luggage),
+    "comfort": (("comfort_priority",), _comfort),
+    "trip": (("trip_type",), _trip),
+}
+
+# name -> (profile fields read, per-deal pass or None when all pass);
+# keep in sync with filter_deals
+FILTERS = {
+    "passengers": (("passengers",), _seats_filter),
+    "luggage": (("luggage",), _luggage_filter),
+    "budget": (("budget_total",), _budget_filter),
+}
+
+
+def _base(row: DealRow, original_total_price) -> Tuple[int, float, int]:
+    """The profile-independent part of score_row: (quality, upsell, tier)."""
+    quality = (1 if row.recommended else 0) + (1 if row.new else 0)
+
+    total_price = row.total
+    uplift = total_price - original_total_price
+    if uplift > 0:
+        upsell = min(uplift / 40.0, 4.0)
+    elif uplift == 0:
+        upsell = 1.0
+    else:
+        upsell = max(uplift / 100.0, -2.0)
+
+    if total_price > original_total_price * 1.5:
+        tier = 3
+    elif total_price > original_total_price * 1.2:
+        tier = 2
+    elif total_price > original_total_price:
+        tier = 1
+    else:
+        tier = 0
+    return quality, upsell, tier
+
+
+def _deal_key(deal: Dict[str, Any]) -> Tuple[str, float]:
+    return deal["vehicle"]["id"], deal["pricing"]["totalPrice"]["amount"]
+
+
+def _remap(result: List[Dict[str, Any]], deals: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The same cars as this turn's deal objects (fresh images, tags, dealInfo)."""
+    by_key = {_deal_key(d): d for d in deals}
+    return [by_key[_deal_key(d)] for d in result]
+
+
+def _rank_by(scores: Dict[int, float]):
+    """rank_deals over cached scores (the deals must come from the same list)."""
+    def rank(deals: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        return sorted(deals, key=lambda d: scores[id(d)], reverse=True)[:k]
+    return rank
+
+
+class RankingSession:
+    def __init__(self):
+        self.deals: List[Dict[str, Any]] = []
+        self.profile: Dict[str, Any] = {}
+        self.original_total_price = 0.0
+        self.filtered: List[Dict[str, Any]] = []
+
+        self._deals_key = None
+        self._columns: Dict[str, list] = {}
+        self._base: List[Tuple[int, float, int]] = []
+        # Per rule / filter: the per-deal values, None when neutral for all
+        self._rules: Dict[str, Optional[List[int]]] = {}
+        self._passes: Dict[str, Optional[List[bool]]] = {}
+        # Integer part of every score: rule points + quality
+        self._points: List[int] = []
+        self._filtered_indexes: List[int] = []
+        # id(deal) -> score_deal(deal, profile, original_total_price)
+        self._scores: Dict[int, float] = {}
+        # ((k, use_llm), result) of the last stable rank() since the last change
+        self._result: Optional[Tuple[Tuple[int, bool], List[Dict[str, Any]]]] = None
+        self.shown: List[str] = []
+        self._lock = threading.Lock()
+
+    def update(self, deals: List[Dict[str, Any]], profile: Dict[str, Any], original_total_price: float):
+        """Bring the scores up to date with this turn's deals and profile."""
+        deals_key = (original_total_price, [_deal_key(d) for d in deals])
+        with self._lock:
+            if deals_key != self._deals_key:
+                self._load(deals, profile, original_total_price, deals_key)
+            else:
+                changed = {f for f in set(profile) | set(self.profile) if profile.get(f) != self.profile.get(f)}
+                if changed:
+                    self._apply(profile, changed)
+                elif deals is self.deals:
+                    return
+                # Same cars and prices: keep the scores, use this turn's objects
+                if self._result is not None and deals is not self.deals:
+                    self._result = (self._result[0], _remap(self._result[1], deals))
+                self.deals = deals
+            self._scores = {
+                id(d): float(points) + upsell + tier
+                for d, points, (_, upsell, tier) in zip(self.deals, self._points, self._base)
+            }
+            self.filtered = [self.deals[i] for i in self._filtered_indexes] or self.deals
+
+    def _load(self, deals, profile, original_total_price, deals_key):
+        metrics.incr("ranking_session.full")
+        self.deals = deals
+        self.profile = dict(profile)
+        self.original_total_price = original_total_price
+        self._deals_key = deals_key
+        # Flattened once per deal list; the columns keep what the rules read
+        rows = deal_rows(deals)
+        self._columns = _columns(rows)
+        self._base = [_base(r, original_total_price) for r in rows]
+        self._rules = {name: rule(self._columns, profile) for name, (_, rule) in RULES.items()}
+        self._passes = {name: passes(self._columns, profile) for name, (_, passes) in FILTERS.items()}
+        self._points = [quality for quality, _, _ in self._base]
+        for points in self._rules.values():
+            if points is not None:
+                self._points = [total + p for total, p in zip(self._points, points)]
+        self._filter()
+        self._result = None
+
+    def _apply(self, profile, changed):
+        metrics.incr("ranking_session.partial")
+        self.profile = dict(profile)
+        rescored = 0
+        for name, (fields, rule) in RULES.items():
+            if not changed.intersection(fields):
+                continue
+            old, new = self._rules[name], rule(self._columns, profile)
+            self._rules[name] = new
+            rescored += 1
+            # Integer points: updating in place gives the same sum as score_deal
+            if old is not None:
+                self._points = [total - p for total, p in zip(self._points, old)]
+            if new is not None:
+                self._points = [total + p for total, p in zip(self._points, new)]
+        filters = [name for name, (fields, _) in FILTERS.items() if changed.intersection(fields)]
+        for name in filters:
+            self._passes[name] = FILTERS[name][1](self._columns, profile)
+        if filters:
+            self._filter()
+        metrics.incr("ranking_session.rescored", rescored + len(filters))
+        # Fields outside the rules (likes, ...) still change the LLM re-rank
+        self._result = None
+
+    def _filter(self):
+        active = [passes for passes in self._passes.values() if passes is not None]
+        if active:
+            self._filtered_indexes = [i for i, flags in enumerate(zip(*active)) if all(flags)]
+        else:
+            self._filtered_indexes = list(range(len(self.deals)))
+
+    def _snapshot(self, k: int, use_llm: bool, deadline: Optional["Deadline"]):
+        """(cached result or None, snapshot) under the lock."""
+        with self._lock:
+            snapshot = (self.deals, self.profile, self.original_total_price, self.filtered, self._scores)
+            if self._result is None or self._result[0] != (k, use_llm):
+                return None, snapshot
+            result = list(self._result[1])
+        metrics.incr("ranking_session.unchanged")
+        if deadline is not None:
+            deadline.record("rerank", "unchanged")
+        return result, snapshot
+
+    def _keep(self, k: int, use_llm: bool, deadline: Optional["Deadline"], scores, result):
+        if deadline is not None:
+            stable = deadline.paths.get("rerank") in STABLE_PATHS
+        else:
+            # Without a deadline the LLM re-rank falls back silently
+            stable = not use_llm
+        with self._lock:
+            # An update() in between replaced the scores: the result is stale
+            if stable and scores is self._scores:
+                self._result = ((k, use_llm), result)
+
+    def show(self, deals: List[Dict[str, Any]]):
+        self.shown = [d["vehicle"]["id"] for d in deals]
+
+    def rank(self, k: int = 3, use_llm: bool = False, deadline: Optional["Deadline"] = None) -> List[Dict[str, Any]]:
+        cached, (deals, profile, original_total_price, filtered, scores) = self._snapshot(k, use_llm, deadline)
+        if cached is not None:
+            self.show(cached)
+            return cached
+        result = hybrid_rank_deals(
+            deals, profile, original_total_price, k, use_llm, deadline,
+            filtered=filtered, rank=_rank_by(scores),
+        )
+        self._keep(k, use_llm, deadline, scores, result)
+        self.show(result)
+        return list(result)
+
+    async def arank(self, k: int = 3, use_llm: bool = False,
+                    deadline: Optional["Deadline"] = None) -> List[Dict[str, Any]]:
+        cached, (deals, profile, original_total_price, filtered, scores) = self._snapshot(k, use_llm, deadline)
+        if cached is not None:
+            self.show(cached)
+            return cached
+        result = await ahybrid_rank_deals(
+            deals, profile, original_total_price, k, use_llm, deadline,
+            filtered=filtered, rank=_rank_by(scores),
+        )
+        self._keep(k, use_llm, deadline, scores, result)
+        self.show(result)
+        return list(result)
+
+    def candidates(self) -> List[Dict[str, Any]]:
+        """car_scoring.rerank_candidates from the cached scores."""
+        with self._lock:
+            deals, profile, original_total_price, filtered, scores = (
+                self.deals, self.profile, self.original_total_price, self.filtered, self._scores)
+        return rerank_candidates(deals, profile, original_total_price,
+                                 filtered=filtered, rank=_rank_by(scores))
+
+
+_sessions: "OrderedDict[str, RankingSession]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_session(chat_session_id: str) -> RankingSession:
+    with _sessions_lock:
+        session = _sessions.pop(chat_session_id, None) or RankingSession()
+        _sessions[chat_session_id] = session
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+        return session
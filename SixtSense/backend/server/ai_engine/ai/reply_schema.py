@@ -0,0 +1,197 @@
+# ai_engine/ai/reply_schema.py
+"""
+Output contract of SalesAgent.
+
+AgentReply is sent to OpenAI as a strict json_schema response_format, so the
+provider only returns objects of this shape. The completion budget comes from
+the same schema (max_output_tokens), not from a fixed 2000.
+
+The reply is still validated field by field when it comes back. A reply
+cut off at the token limit, or one from a model without structured outputs,
+may lack some fields; check() lists them so the agent can ask again for
+just those fields (repair_model()), not for the whole turn.
+"""
+import json
+import os
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, create_model
+
+# Longest assistant_message the token budget is sized for
+MESSAGE_MAX_CHARS = int(os.getenv("AI_AGENT_MESSAGE_MAX_CHARS", "1200"))
+
+# Free-text list items (likes / dislikes) budgeted per list
+LIST_ITEMS = 5
+
+Level = Literal["low", "medium", "high"]
+
+
+class StateUpdate(BaseModel):
+    """Only the fields this message changed; everything else null."""
+
+    passengers: Optional[int] = None
+    luggage: Optional[Literal["light", "normal", "many"]] = None
+    trip_type: Optional[Literal["family", "business", "party", "leisure", "other"]] = None
+    comfort_priority: Optional[Level] = None
+    budget_total: Optional[float] = None
+    dislikes: Optional[List[str]] = None
+    likes: Optional[List[str]] = None
+    winter_driving: Optional[bool] = None
+    kids: Optional[bool] = None
+    risk_aversion: Optional[Level] = None
+    upgrade_openness: Optional[Level] = None
+    preferred_transmission: Optional[Literal["automatic", "manual"]] = None
+    fuel_preference: Optional[Literal["petrol", "diesel", "electric", "hybrid"]] = None
+
+
+class Needs(BaseModel):
+    """Abstract needs mapped to products by ai.protection_engine."""
+
+    protections: List[Literal["full_cover", "liability", "roadside", "no_protection"]] = Field(default_factory=list)
+    addons: List[Literal["child_seat", "toll", "additional_driver"]] = Field(default_factory=list)
+
+
+class AgentReply(BaseModel):
+    assistant_message: str
+    state_update: StateUpdate
+    needs: Needs
+
+
+FIELDS = tuple(AgentReply.model_fields)
+
+_adapters = {name: TypeAdapter(field.annotation) for name, field in AgentReply.model_fields.items()}
+
+
+# -------------------------------------------------------------------------
+#  Provider schema and token budget
+# -------------------------------------------------------------------------
+
+def _strict(node: Any) -> Any:
+    """OpenAI strict mode: every property required, no extra keys, no defaults/titles."""
+    if isinstance(node, list):
+        return [_strict(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    node = {key: _strict(value) for key, value in node.items() if key not in ("default", "title")}
+    if node.get("type") == "object" and "properties" in node:
+        node["required"] = list(node["properties"])
+        node["additionalProperties"] = False
+    return node
+
+
+def strict_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    return _strict(model.model_json_schema())
+
+
+def response_format(model: Type[BaseModel] = AgentReply) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "strict": True, "schema": strict_schema(model)},
+    }
+
+
+def _tokens(node: Dict[str, Any], defs: Dict[str, Any], in_list: bool = False) -> int:
+    """Upper bound of the tokens one value of this schema node takes."""
+    if "$ref" in node:
+        return _tokens(defs[node["$ref"].rsplit("/", 1)[-1]], defs, in_list)
+    if "anyOf" in node:
+        return max(_tokens(option, defs, in_list) for option in node["anyOf"])
+    if "enum" in node:
+        return max(len(str(value)) for value in node["enum"]) // 3 + 2
+    kind = node.get("type")
+    if kind == "object":
+        # Key, quotes and separators per property
+        return 2 + sum(len(key) // 3 + 3 + _tokens(value, defs) for key, value in node["properties"].items())
+    if kind == "array":
+        items = node["items"]
+        count = len(items["enum"]) if "enum" in items else LIST_ITEMS
+        return 2 + count * (_tokens(items, defs, in_list=True) + 1)
+    if kind == "string":
+        # likes / dislikes items are short phrases; the only free text is
+        # assistant_message, and DE / IT run at about 3 characters per token
+        return 8 if in_list else MESSAGE_MAX_CHARS // 3
+    return 3
+
+
+def max_output_tokens(model: Type[BaseModel] = AgentReply) -> int:
+    schema = model.model_json_schema()
+    return _tokens(schema, schema.get("$defs", {})) + 16
+
+
+RESPONSE_FORMAT = response_format()
+MAX_OUTPUT_TOKENS = max_output_tokens()
+
+
+# -------------------------------------------------------------------------
+#  Validation and repair
+# -------------------------------------------------------------------------
+
+def loads(text: str) -> Dict[str, Any]:
+    """The JSON object in the model's text; {} when there is none."""
+    from langchain_core.utils.json import parse_partial_json
+
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # Cut off at the token limit: keep the fields that made it, but not
+        # the one that was being written
+        start = text.find("{")
+        data = parse_partial_json(text[start:]) if start >= 0 else None
+        if isinstance(data, dict) and data:
+            data.pop(list(data)[-1])
+    return data if isinstance(data, dict) else {}
+
+
+def partial(text: str) -> Optional[Dict[str, Any]]:
+    """The object parsed so far while the reply streams in."""
+    from langchain_core.utils.json import parse_partial_json
+
+    start = text.find("{")
+    data = parse_partial_json(text[start:]) if start >= 0 else None
+    return data if isinstance(data, dict) else None
+
+
+def check(data: Dict[str, Any], fields=FIELDS) -> Tuple[Dict[str, Any], List[str]]:
+    """(valid fields in agent-result form, names of missing / invalid fields)."""
+    valid, missing = {}, []
+    for name in fields:
+        if name not in data:
+            missing.append(name)
+            continue
+        try:
+            value = _adapters[name].validate_python(data[name])
+        except ValidationError:
+            missing.append(name)
+            continue
+        if name == "state_update":
+            value = value.model_dump(exclude_none=True)
+        elif name == "needs":
+            value = value.model_dump()
+        valid[name] = value
+    return valid, missing
+
+
+def repair_model(missing: List[str]) -> Type[BaseModel]:
+    """Schema with only the fields to ask for again."""
+    return create_model(
+        "AgentReplyRepair",
+        **{name: (AgentReply.model_fields[name].annotation, ...) for name in missing},
+    )
+
+
+def repair_instruction(missing: List[str]) -> str:
+    return (
+        f"Your reply was missing or had invalid values for: {', '.join(missing)}. "
+        "Return ONLY a JSON object with exactly these fields."
+    )
+
+
+# Used for fields that are still missing after the repair
+FALLBACK = {
+    "assistant_message": "Sorry, I didn't quite get that. Could you tell me a bit more about your trip?",
+    "state_update": {},
+    "needs": {"protections": [], "addons": []},
+}
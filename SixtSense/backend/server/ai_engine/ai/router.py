@@ -0,0 +1,151 @@
+# ai_engine/ai/router.py
+"""
+Local routing of chat turns by message complexity, no network involved.
+
+    route = classify(message, history, state)
+    route.tier    "template" | "small" | "default" | "large"
+    route.intent  "thanks" | "greeting" | "passengers" | "slots" | "ack" | "chat"
+
+- template: a deterministic reply (thanks, greeting, a bare passenger
+  count answering our question, a message that only states preferences
+  ai.slots extracts with confidence), no model call at all.
+- small:    short acknowledgements and other trivial turns -> AI_ROUTER_SMALL_MODEL.
+- default:  the agent's regular model.
+- large:    multi-constraint turns -> AI_ROUTER_LARGE_MODEL.
+
+Intents are matched with rules; complexity is a small hand-weighted linear
+model over surface features (length, constraints mentioned, numbers,
+questions, clauses). SalesAgent records routing decisions and the latency
+saved against the default tier in core.metrics (router.*).
+"""
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from . import slots
+
+ENABLED = os.getenv("AI_ROUTER", "true").lower() in ("1", "true", "yes")
+
+SMALL_MODEL = os.getenv("AI_ROUTER_SMALL_MODEL", "gpt-4.1-nano")
+LARGE_MODEL = os.getenv("AI_ROUTER_LARGE_MODEL", "gpt-4o")
+
+# Decision thresholds on ComplexityModel.decision_function()
+SMALL_BELOW = float(os.getenv("AI_ROUTER_SMALL_BELOW", "0.0"))
+LARGE_ABOVE = float(os.getenv("AI_ROUTER_LARGE_ABOVE", "2.5"))
+
+TIERS = ("template", "small", "default", "large")
+
+_THANKS = re.compile(
+    r"^(ok(ay)?[,!. ]*)?(thanks?( you)?( so much| a lot)?|thx|ty|cheers|danke( schön)?|grazie( mille)?)[!. ]*$"
+)
+_GREETING = re.compile(r"^(hi|hey|hello|hallo|ciao|servus|good (morning|afternoon|evening))( there)?[!. ]*$")
+_ACK = re.compile(
+    r"^(ok(ay)?|k|yes|yeah|yep|sure|fine|great|perfect|cool|alright|sounds good|no|nope|ja|nein|si|sì)[!. ]*$"
+)
+_PASSENGERS = re.compile(
+    r"^(we are |we're |there are |just |only )?(?P<n>\d{1,2}|one|two|three|four|five|six|seven|eight|nine)"
+    r"( (people|persons|passengers|adults|of us))?[!. ]*$"
+)
+_ASKED_PASSENGERS = re.compile(r"how many (people|passengers|of you|persons|travell?ers)|who.{0,20}travell?ing with")
+
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
+
+_CONSTRAINTS = re.compile(
+    r"€|\$|\b(budget|price|cheap|expensive|eur|kids?|child|children|baby|luggage|bags?|suitcases?|"
+    r"automatic|manual|electric|hybrid|diesel|petrol|winter|snow|mountains?|highway|insurance|protection|"
+    r"cover|deductible|seats?|gps|navigation|driver|luxury|suv|van|convertible|compare|difference|versus|"
+    r"vs|instead)\b"
+)
+
+TEMPLATES = {
+    "thanks": "You're welcome! If anything else comes up about your rental, just ask.",
+    "greeting": "Hi! Tell me a bit about your trip — who is travelling and what you'll be doing — and I'll suggest the best options.",
+    "passengers": "Got it, {n} passengers. I've updated the suggestions so everyone fits comfortably. Anything else I should know, like luggage or kids?",
+}
+
+
+class ComplexityModel:
+    """Linear score over message features; higher means harder (sklearn-style API)."""
+
+    features = ("log_words", "constraints", "numbers", "questions", "clauses", "negations")
+
+    def __init__(self, coef: Optional[List[float]] = None, intercept: float = -1.5):
+        self.coef_ = coef or [0.6, 0.8, 0.3, 0.4, 0.35, 0.5]
+        self.intercept_ = intercept
+
+    @staticmethod
+    def featurize(text: str) -> List[float]:
+        return [
+            math.log1p(len(text.split())),
+            len(_CONSTRAINTS.findall(text)),
+            len(re.findall(r"\d+", text)),
+            text.count("?"),
+            text.count(",") + len(re.findall(r"\b(and|but|or|also|plus)\b", text)),
+            len(re.findall(r"\b(not|don't|dont|no|without|never)\b", text)),
+        ]
+
+    def decision_function(self, text: str) -> float:
+        return self.intercept_ + sum(c * x for c, x in zip(self.coef_, self.featurize(text)))
+
+
+_model = ComplexityModel()
+
+
+class Route:
+    def __init__(self, tier: str, intent: str, score: float, reply: Optional[Dict[str, Any]] = None):
+        self.tier = tier
+        self.intent = intent
+        self.score = score
+        # Full agent result for template turns
+        self.reply = reply
+
+    def __repr__(self):
+        return f"Route({self.tier!r}, {self.intent!r}, score={self.score:.2f})"
+
+
+def _last_assistant_message(history: str) -> str:
+    idx = history.rfind("Assistant:")
+    return history[idx:].lower() if idx >= 0 else ""
+
+
+def _template(intent: str, state_update: Optional[Dict[str, Any]] = None, **fmt) -> Dict[str, Any]:
+    return {
+        "assistant_message": TEMPLATES[intent].format(**fmt),
+        "state_update": state_update or {},
+        "needs": {"protections": [], "addons": []},
+    }
+
+
+def classify(message: str, history: str = "", state: Optional[Dict[str, Any]] = None) -> Route:
+    text = " ".join(message.lower().split())
+    score = _model.decision_function(text)
+
+    if _THANKS.match(text):
+        return Route("template", "thanks", score, _template("thanks"))
+    if _GREETING.match(text):
+        return Route("template", "greeting", score, _template("greeting"))
+
+    # First, so "we are 4" / "4 people" take the slot fast path
+    extraction = slots.extract(message)
+    if extraction.confident:
+        return Route("template", "slots", score, slots.reply(extraction, state))
+
+    match = _PASSENGERS.match(text)
+    if match:
+        # A bare number only means passengers if that is what we asked
+        if _ASKED_PASSENGERS.search(_last_assistant_message(history)):
+            n = match["n"]
+            n = int(n) if n.isdigit() else _NUMBER_WORDS[n]
+            return Route("template", "passengers", score, _template("passengers", {"passengers": n}, n=n))
+        return Route("small", "chat", score)
+
+    if _ACK.match(text):
+        # "yes" / "ok" depend on the conversation: still a model call, a cheap one
+        return Route("small", "ack", score)
+
+    if score < SMALL_BELOW:
+        return Route("small", "chat", score)
+    if score > LARGE_ABOVE:
+        return Route("large", "chat", score)
+    return Route("default", "chat", score)
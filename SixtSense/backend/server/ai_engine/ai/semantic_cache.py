@@ -0,0 +1,221 @@
+# ai_engine/ai/semantic_cache.py
+"""
+Semantic answer cache for recurring customer questions ("what does Peace
+of Mind cover", "is the deductible zero", "do I need a child seat").
+
+Questions are embedded locally, on the CPU, with no model download: a
+hashing vectorizer over words, word pairs and character trigrams, signed
+and L2-normalised. A question is served from the cache when a stored
+question with the same catalog fingerprint (ai_engine.catalog) has a
+cosine similarity of at least AI_SEMANTIC_CACHE_THRESHOLD. Entries expire
+after AI_SEMANTIC_CACHE_TTL seconds, and the least recently used one is
+evicted once AI_SEMANTIC_CACHE_SIZE entries are stored.
+
+Only questions are looked up (is_question()). The fingerprint also
+covers what the question says about the customer (facts(), from
+ai.slots): "do I need a child seat" and "we are 5 with 2 kids, do I need
+a child seat" never share an answer. The numbers and named things in the
+question (entities(): package tiers, addons, ...) must match exactly too,
+so "is the deductible zero for the premium package" is never answered
+with the basic package's answer (0.87 similar).
+
+Metrics per cache <name>: semantic_cache.<name>.{hit,miss,stored,
+evicted,size,similarity}.
+"""
+import copy
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from core import metrics
+
+from . import slots
+
+ENABLED = os.getenv("AI_SEMANTIC_CACHE", "true").lower() in ("1", "true", "yes")
+THRESHOLD = float(os.getenv("AI_SEMANTIC_CACHE_THRESHOLD", "0.85"))
+TTL_SECONDS = float(os.getenv("AI_SEMANTIC_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("AI_SEMANTIC_CACHE_SIZE", "512"))
+
+# Hashed feature space of the embedding
+DIM = 2 ** 12
+
+_WORD = re.compile(r"\w+")
+# Words that change nothing about the question
+_NOISE = {
+    "please", "pls", "hi", "hello", "hey", "thanks", "thank", "you", "ok", "so", "just", "quick", "question",
+    "bitte", "hallo", "danke", "mal", "eigentlich",
+    "ciao", "grazie", "per", "favore", "scusa",
+}
+_QUESTION = re.compile(
+    r"\?|^(what|which|how|is|are|do|does|can|could|should|will|would|why|when|where|"
+    r"was|welche[rsn]?|wie|ist|sind|brauche|brauchen|kann|muss|gibt|"
+    r"cosa|che|quale|quali|come|quanto|quanta|è|serve|posso|devo)\b"
+)
+
+
+# Named things a question can be about. Two questions that differ in one of
+# them ("... for the premium package" / "... for the basic package") or in
+# a number are different questions however similar the rest of the text is,
+# so the entities are matched exactly, next to the fingerprint.
+_ENTITIES = [
+    ("peace_of_mind", r"peace of mind"),
+    ("basic", r"basic|basis|base"),
+    ("smart", r"smart"),
+    ("premium", r"premium"),
+    ("full", r"full|complete|vollkasko|completa|completo"),
+    ("child_seat", r"child seats?|baby seats?|kindersitze?|babyschale|seggiolin[oi]"),
+    ("booster", r"boosters?|sitzerhöhung|rialzo"),
+    ("navigation", r"gps|navigation|navi|sat ?nav|navigatore"),
+    ("additional_driver", r"(?:additional|second|extra) drivers?|zusatzfahrer|zweiter fahrer|secondo (?:conducente|guidatore)"),
+    ("snow_chains", r"snow chains|schneeketten|catene(?: da neve)?"),
+    ("winter_tyres", r"winter (?:tyres|tires|wheels)|winterreifen|(?:gomme|pneumatici) invernali"),
+    ("tyres", r"tyres?|tires?|reifen|gomme|pneumatici"),
+    ("glass", r"glass|windscreen|windshield|glas|scheiben?|vetri|parabrezza"),
+    ("theft", r"theft|stolen|diebstahl|furto"),
+]
+# "one" / "ein" / "uno" double as articles ("which one"), so they are left out
+_NUMBER_WORDS = {
+    "zero": 0, "null": 0,
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "zwei": 2, "drei": 3, "vier": 4, "fünf": 5, "sechs": 6, "sieben": 7, "acht": 8, "neun": 9, "zehn": 10,
+    "due": 2, "tre": 3, "quattro": 4, "cinque": 5, "sei": 6, "sette": 7, "otto": 8, "nove": 9, "dieci": 10,
+}
+_ENTITY = re.compile(
+    r"(?<!\w)(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in _ENTITIES)
+    + r"|(?P<number>\d+(?:[.,]\d+)?|" + "|".join(_NUMBER_WORDS) + r"))(?!\w)"
+)
+
+
+def normalize(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(w for w in _WORD.findall(text) if w not in _NOISE)
+
+
+def _features(text: str):
+    words = text.split()
+    yield from words
+    yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"<{word}>"
+        yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def embed(question: str, dim: int = DIM) -> np.ndarray:
+    """Unit vector of the normalised question (zeros if nothing is left)."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(normalize(question)):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Low bits pick the bucket, the top bit the sign (fewer collisions add up)
+        vector[h % dim] += 1.0 if h >> 31 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def is_question(message: str) -> bool:
+    return bool(_QUESTION.search(" ".join(message.lower().split())))
+
+
+def facts(message: str) -> Dict[str, Any]:
+    """What the message says about the customer (part of the fingerprint)."""
+    return slots.extract(message).slots
+
+
+def entities(question: str) -> str:
+    """The question's numbers and named things, as an exact-match key."""
+    found = set()
+    for match in _ENTITY.finditer(unicodedata.normalize("NFKC", question).lower()):
+        if match.lastgroup == "number":
+            value = match.group()
+            found.add(str(_NUMBER_WORDS[value]) if value in _NUMBER_WORDS else value.replace(",", "."))
+        else:
+            found.add(match.lastgroup)
+    return "|".join(sorted(found))
+
+
+class SemanticCache:
+    def __init__(self, name: str, threshold: float = THRESHOLD, ttl: float = TTL_SECONDS,
+                 max_entries: int = MAX_ENTRIES, dim: int = DIM):
+        self.name = name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # One row per entry; empty and expired rows never match
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._fingerprints = np.full(max_entries, "", dtype=object)
+        self._expires = np.zeros(max_entries)
+        self._answers: list = [None] * max_entries
+        # Rows in use, least recently used first
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def get(self, question: str, fingerprint: str) -> Optional[Any]:
+        vector = embed(question)
+        if not vector.any():
+            return None
+        fingerprint = f"{fingerprint}:{entities(question)}"
+        with self._lock:
+            live = (self._fingerprints == fingerprint) & (self._expires > time.monotonic())
+            if live.any():
+                similarity = np.where(live, self._vectors @ vector, -1.0)
+                row = int(similarity.argmax())
+                if similarity[row] >= self.threshold:
+                    self._lru.move_to_end(row)
+                    metrics.incr(f"semantic_cache.{self.name}.hit")
+                    metrics.observe(f"semantic_cache.{self.name}.similarity", float(similarity[row]))
+                    return copy.deepcopy(self._answers[row])
+        metrics.incr(f"semantic_cache.{self.name}.miss")
+        return None
+
+    def put(self, question: str, fingerprint: str, answer: Any):
+        vector = embed(question)
+        if not vector.any():
+            return
+        fingerprint = f"{fingerprint}:{entities(question)}"
+        with self._lock:
+            row = self._free_row()
+            self._vectors[row] = vector
+            self._fingerprints[row] = fingerprint
+            self._expires[row] = time.monotonic() + self.ttl
+            self._answers[row] = copy.deepcopy(answer)
+            self._lru[row] = None
+        metrics.incr(f"semantic_cache.{self.name}.stored")
+        metrics.gauge(f"semantic_cache.{self.name}.size", len(self._lru))
+
+    def _free_row(self) -> int:
+        if len(self._lru) < self.max_entries:
+            return next(i for i in range(self.max_entries) if i not in self._lru)
+        # Full: an expired entry if there is one, else the least recently used
+        expired = [row for row in self._lru if self._expires[row] <= time.monotonic()]
+        row = expired[0] if expired else next(iter(self._lru))
+        del self._lru[row]
+        metrics.incr(f"semantic_cache.{self.name}.evicted")
+        return row
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints[:] = ""
+            self._expires[:] = 0.0
+            self._answers = [None] * self.max_entries
+            self._lru.clear()
+
+
+_caches: Dict[str, SemanticCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> SemanticCache:
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = SemanticCache(name)
+        return _caches[name]
@@ -0,0 +1,362 @@
+# ai_engine/ai/similarity.py
+"""
+Similarity index over one catalog's cars, for "something like the BMW but
+automatic" / "similar but cheaper" turns.
+
+Every car is a vector of normalized features:
+
+    group type     one-hot over the catalog's group types
+    seats, bags    scaled to [0, 1] over the catalog
+    transmission   one-hot
+    fuel           one-hot
+    luxury         isMoreLuxury or a PREMIUM group
+    price          log of the total price, scaled to [0, 1]
+
+Each block is multiplied by its WEIGHTS entry; one-hot blocks are scaled
+so that two different values are exactly the weight apart. A query takes
+the reference car's vector and returns the cars that pass the constraints,
+nearest first (Euclidean distance, one (N, D) array operation).
+
+    request = parse(message)                      # None: not a comparison
+    comparison = compare(deals, request, shown)   # None: no reference car
+
+parse() is plain regex work (no catalog, no NumPy): it looks for a
+comparison ("something like the", "similar", "etwas wie der", "ähnlich",
+"qualcosa come il", "simile", ...; a bare "like the" only with a "but"
+after it, "I really like the X1" is praise) and reads the constraints
+from what follows "but" / "aber" / "ma" (the whole message when there is
+none): transmission, fuel, passengers, luggage and budget as ai.slots
+extracts them, group words and the relative ones (cheaper, bigger,
+smaller, more luxurious). compare() picks the reference car: the brand /
+model the message names, else (for "this one", "similar", ...) the top
+car shown on the previous turn. The reference car itself is only left
+out when the customer asks for a different one (a "but" or a relative
+constraint).
+
+Indexes are cached per catalog fingerprint, at most AI_SIMILARITY_INDEXES;
+NumPy is imported when the first one is built. Metrics: similarity.queries,
+similarity.no_reference, similarity.no_match, similarity.indexes_built.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core import metrics
+
+from ..catalog import catalog_fingerprint
+from . import slots
+from .deal_row import deal_rows
+
+MAX_INDEXES = int(os.getenv("AI_SIMILARITY_INDEXES", "256"))
+
+WEIGHTS = {
+    "group": 1.0,
+    "seats": 1.0,
+    "bags": 0.75,
+    "transmission": 0.75,
+    "fuel": 0.5,
+    "luxury": 0.75,
+    "price": 1.0,
+}
+
+# "something like the BMW": a comparison on its own
+_CUED_LIKE = (
+    r"\b(?:something|anything|one|ones|car|cars|more) like (?:the|this|that|it|my|an?)\b|"
+    r"\b(?:etwas|so|einen?|auto|wagen) wie (?:der|die|das|den|dem|dieser|diese|dieses)\b|"
+    r"\b(?:qualcosa|una?|auto|macchina) come (?:il|la|lo|l'|quell[oa]|questo|questa)"
+)
+# A bare "like the BMW" is praise ("I really like the X1", "seems like the
+# best option"): a comparison only with a contrast after it. "I'd like the
+# BMW" is a choice, not a comparison
+_LIKE = re.compile(
+    r"(?<!would )(?<!'d )(?<!\bi )(?<!we )(?<!you )\blike (?:the|this|that|it|my|an?|one)\b|"
+    r"\bwie (?:der|die|das|den|dem|dieser|diese|dieses)\b|\bcome (?:il|la|lo|l'|quell[oa]|questo|questa)"
+)
+_SIMILAR = r"\b(?:similar|comparable|same as|alternative to|ähnlich\w*|vergleichbar\w*|simil[ei]|tipo)\b"
+_COMPARISON = re.compile(f"{_CUED_LIKE}|{_SIMILAR}")
+# Refers to the car on screen rather than naming one
+_DEICTIC = re.compile(
+    _SIMILAR + r"|\b(?:this|that|it|this one|that one|dies\w*|das|den|questo|questa|quello|quella)\b"
+)
+_CONTRAST = re.compile(r"\b(?:but|except|only|instead|aber|nur|statt|ma|però|solo|invece)\b")
+
+_RELATIVE = {
+    "cheaper": r"cheaper|less expensive|lower price|günstiger|billiger|preiswerter|più economic[oa]|meno car[oa]",
+    "bigger": r"bigger|larger|more space|roomier|größer|mehr platz|geräumiger|più grande|più spazios[oa]",
+    "smaller": r"smaller|more compact|kleiner|kompakter|più piccol[oa]|più compatt[oa]",
+    "luxury": r"nicer|fancier|more luxurious|luxury|premium|luxuriöser|edler|più lussuos[oa]|di lusso",
+}
+_GROUP_WORDS = {
+    "SUV": r"suv",
+    "MINIVAN": r"minivan|van|kleinbus|monovolume",
+    "SEDAN": r"sedan|saloon|limousine|berlina",
+    "COUPE": r"coupe|coupé",
+    "CONVERTIBLE": r"convertible|cabrio|cabriolet|decappottabile",
+    "ESTATE": r"estate|station wagon|kombi|wagon",
+}
+_RELATIVE_RE = {name: re.compile(rf"\b(?:{p})\b") for name, p in _RELATIVE.items()}
+_GROUP_RE = {group: re.compile(rf"\b(?:{p})\b") for group, p in _GROUP_WORDS.items()}
+
+
+class Request:
+    """A comparison found in a message (no catalog needed)."""
+
+    def __init__(self, text: str, constraints: Dict[str, Any], deictic: bool, contrast: bool = False):
+        self.text = text
+        self.constraints = constraints
+        # May fall back to the car shown last
+        self.deictic = deictic
+        # "but ..." / "aber ..." / "ma ...": something other than the reference
+        self.contrast = contrast
+
+    @property
+    def wants_other(self) -> bool:
+        """The reference car itself is not an answer (a contrast or a relative constraint)."""
+        return self.contrast or any(self.constraints.get(name) for name in _RELATIVE)
+
+    def __repr__(self):
+        return f"Request({self.constraints}, deictic={self.deictic}, contrast={self.contrast})"
+
+
+def parse(message: str) -> Optional[Request]:
+    text = " ".join(message.lower().split())
+    contrast = _CONTRAST.search(text)
+    if not _COMPARISON.search(text):
+        like = _LIKE.search(text)
+        if like is None or contrast is None or contrast.start() < like.end():
+            return None
+
+    tail = text[contrast.end():] if contrast else text
+    found = slots.extract(tail).slots
+
+    constraints: Dict[str, Any] = {}
+    if found.get("preferred_transmission"):
+        constraints["transmission"] = found["preferred_transmission"]
+    if found.get("fuel_preference"):
+        constraints["fuel"] = found["fuel_preference"]
+    if found.get("passengers"):
+        constraints["min_seats"] = found["passengers"]
+    if found.get("luggage") == "many":
+        # Same threshold as car_scoring.filter_deals
+        constraints["min_bags"] = 3
+    if found.get("budget_total"):
+        constraints["max_price"] = found["budget_total"]
+    for group, pattern in _GROUP_RE.items():
+        if pattern.search(tail):
+            constraints["group_type"] = group
+            break
+    for name, pattern in _RELATIVE_RE.items():
+        if pattern.search(tail):
+            constraints[name] = True
+
+    return Request(text, constraints, bool(_DEICTIC.search(text)), contrast is not None)
+
+
+class Comparison:
+    """The reference car and the cars like it that pass the constraints."""
+
+    def __init__(self, reference: Dict[str, Any], constraints: Dict[str, Any],
+                 matches: List[Tuple[Dict[str, Any], float]]):
+        self.reference = reference
+        self.constraints = constraints
+        self.matches = matches
+
+    @property
+    def deals(self) -> List[Dict[str, Any]]:
+        return [deal for deal, _ in self.matches]
+
+    @property
+    def vehicle_ids(self) -> List[str]:
+        return [deal["vehicle"]["id"] for deal, _ in self.matches]
+
+    def summary(self) -> Dict[str, Any]:
+        """For the agent's state and the message metadata."""
+        return {
+            "reference": _car(self.reference),
+            "constraints": self.constraints,
+            "matches": [{**_car(deal), "distance": round(distance, 3)} for deal, distance in self.matches],
+        }
+
+    def __repr__(self):
+        return f"Comparison({self.reference['vehicle']['id']!r}, {self.constraints}, {self.vehicle_ids})"
+
+
+def _car(deal: Dict[str, Any]) -> Dict[str, Any]:
+    v = deal["vehicle"]
+    return {
+        "id": v["id"],
+        "name": f"{v.get('brand', '')} {v.get('model', '')}".strip(),
+        "total_price": deal["pricing"]["totalPrice"]["amount"],
+    }
+
+
+class VehicleIndex:
+    def __init__(self, deals: List[Dict[str, Any]]):
+        import numpy as np
+
+        self.deals = deals
+        rows = deal_rows(deals)
+        vehicles = [d["vehicle"] for d in deals]
+        self.ids = [r.id for r in rows]
+        self._positions = {vehicle_id: i for i, vehicle_id in enumerate(self.ids)}
+
+        self.groups = [r.group_type.upper() for r in rows]
+        self.transmissions = [(v.get("transmissionType") or "").lower() for v in vehicles]
+        self.fuels = [(v.get("fuelType") or "").lower() for v in vehicles]
+        self.seats = np.array([r.seats for r in rows], dtype=float)
+        self.bags = np.array([r.bags for r in rows], dtype=float)
+        self.luxury = np.array([r.luxury or "PREMIUM" in g for r, g in zip(rows, self.groups)])
+        self.prices = np.array([r.total for r in rows], dtype=float)
+
+        self.vectors = np.hstack([
+            _one_hot(self.groups, WEIGHTS["group"]),
+            _scaled(self.seats, WEIGHTS["seats"]),
+            _scaled(self.bags, WEIGHTS["bags"]),
+            _one_hot(self.transmissions, WEIGHTS["transmission"]),
+            _one_hot(self.fuels, WEIGHTS["fuel"]),
+            (WEIGHTS["luxury"] * self.luxury)[:, None],
+            _scaled(np.log(np.maximum(self.prices, 1.0)), WEIGHTS["price"]),
+        ])
+
+        # "brand model", "model" and "brand" of every car, longest first
+        mentions: Dict[str, List[int]] = {}
+        for i, v in enumerate(vehicles):
+            brand, model = (v.get("brand") or "").lower(), (v.get("model") or "").lower()
+            for phrase in {f"{brand} {model}".strip(), model, brand}:
+                if len(phrase) >= 2:
+                    mentions.setdefault(phrase, []).append(i)
+        self._mentions = mentions
+        self._mention_re = re.compile(
+            r"\b(" + "|".join(re.escape(p) for p in sorted(mentions, key=len, reverse=True)) + r")\b"
+        ) if mentions else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, vehicle_id: str) -> Optional[int]:
+        return self._positions.get(vehicle_id)
+
+    def find(self, text: str, prefer: Sequence[str] = ()) -> Optional[int]:
+        """The car the text names (longest brand / model match), preferring `prefer` ids."""
+        if self._mention_re is None:
+            return None
+        found = [m.group(1) for m in self._mention_re.finditer(text.lower())]
+        if not found:
+            return None
+        positions = self._mentions[max(found, key=len)]
+        preferred = [self._positions[vid] for vid in prefer if vid in self._positions]
+        return next((i for i in preferred if i in positions), positions[0])
+
+    def mask(self, reference: int, constraints: Dict[str, Any], exclude_reference: bool = True):
+        import numpy as np
+
+        ok = np.ones(len(self.ids), dtype=bool)
+        if constraints.get("transmission"):
+            ok &= np.array([constraints["transmission"] in t for t in self.transmissions])
+        if constraints.get("fuel"):
+            ok &= np.array([constraints["fuel"] in f for f in self.fuels])
+        if constraints.get("group_type"):
+            ok &= np.array([constraints["group_type"] in g for g in self.groups])
+        if constraints.get("min_seats"):
+            ok &= self.seats >= constraints["min_seats"]
+        if constraints.get("min_bags"):
+            ok &= self.bags >= constraints["min_bags"]
+        if constraints.get("max_price"):
+            ok &= self.prices <= constraints["max_price"]
+        if constraints.get("luxury"):
+            ok &= self.luxury
+
+        seats, bags, price = self.seats[reference], self.bags[reference], self.prices[reference]
+        if constraints.get("cheaper"):
+            ok &= self.prices < price
+        if constraints.get("bigger"):
+            ok &= (self.seats >= seats) & (self.bags >= bags) & ((self.seats > seats) | (self.bags > bags))
+        if constraints.get("smaller"):
+            ok &= (self.seats <= seats) & (self.bags <= bags) & ((self.seats < seats) | (self.bags < bags))
+        if exclude_reference:
+            ok[reference] = False
+        return ok
+
+    def nearest(self, reference: int, k: int = 3, constraints: Optional[Dict[str, Any]] = None,
+                exclude_reference: bool = True) -> List[Tuple[Dict[str, Any], float]]:
+        """(deal, distance) of the k cars nearest to the reference that pass the constraints."""
+        import numpy as np
+
+        distances = np.sqrt(((self.vectors - self.vectors[reference]) ** 2).sum(axis=1))
+        candidates = np.flatnonzero(self.mask(reference, constraints or {}, exclude_reference))
+        # Stable: equally distant cars keep the catalog order
+        best = candidates[np.argsort(distances[candidates], kind="stable")[:k]]
+        return [(self.deals[i], float(distances[i])) for i in best]
+
+    def similar(self, vehicle_id: str, k: int = 3, **constraints) -> List[Tuple[Dict[str, Any], float]]:
+        """nearest() by vehicle id; empty for a car that is not in the catalog."""
+        reference = self.position(vehicle_id)
+        if reference is None:
+            return []
+        return self.nearest(reference, k, constraints)
+
+    def compare(self, request: Request, shown: Sequence[str] = (), k: int = 3) -> Optional[Comparison]:
+        reference = self.find(request.text, prefer=shown)
+        if reference is None and request.deictic and shown:
+            reference = self.position(shown[0])
+        if reference is None:
+            return None
+        matches = self.nearest(reference, k, request.constraints, exclude_reference=request.wants_other)
+        return Comparison(self.deals[reference], request.constraints, matches)
+
+
+def _one_hot(values: List[str], weight: float):
+    import numpy as np
+
+    vocabulary = {value: j for j, value in enumerate(sorted(set(values)))}
+    matrix = np.zeros((len(values), len(vocabulary)))
+    matrix[np.arange(len(values)), [vocabulary[v] for v in values]] = weight / math.sqrt(2)
+    return matrix
+
+
+def _scaled(column, weight: float):
+    span = column.max() - column.min() if len(column) else 0.0
+    scaled = (column - column.min()) / span if span else column * 0.0
+    return (weight * scaled)[:, None]
+
+
+_indexes: "OrderedDict[str, VehicleIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def index_for(deals: List[Dict[str, Any]]) -> VehicleIndex:
+    """The catalog's index, shared by every booking with the same catalog."""
+    key = catalog_fingerprint(deals)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = VehicleIndex(deals)
+    metrics.incr("similarity.indexes_built")
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def compare(deals: List[Dict[str, Any]], request: Request, shown: Sequence[str] = (),
+            k: int = 3) -> Optional[Comparison]:
+    """index_for(deals).compare(), with metrics; None without deals or a reference car."""
+    if not deals:
+        return None
+    started = time.perf_counter()
+    metrics.incr("similarity.queries")
+    comparison = index_for(deals).compare(request, shown, k)
+    metrics.observe("similarity.seconds", time.perf_counter() - started)
+    if comparison is None:
+        metrics.incr("similarity.no_reference")
+    elif not comparison.matches:
+        metrics.incr("similarity.no_match")
+    return comparison
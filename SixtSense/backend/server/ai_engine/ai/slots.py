@@ -0,0 +1,390 @@
+# ai_engine/ai/slots.py
+"""
+Deterministic slot filling for messages that only state facts
+("we are 4 with two kids and lots of luggage", "wir sind zu dritt,
+Automatik bitte", "siamo in 5, budget 400 euro").
+
+All rules (English, German, Italian, like Profile.LANGUAGE_CHOICES) are
+compiled into ONE alternation when the module is imported, so a message is
+scanned once. Each rule maps to a ChatSession.state field:
+
+    passengers, kids, luggage, budget_total, trip_type, comfort_priority,
+    winter_driving, risk_aversion, preferred_transmission, fuel_preference
+
+(the last two use the Profile choices). An extraction is confident when
+every word of the message is either part of a match or a filler word,
+there is no question and no field got two different values. Only then
+does ai.router answer the turn from reply() without calling the model.
+
+A match shortly after a negation in the same clause ("no diesel please",
+"I'm not going to the mountains", "kein Automatik") is dropped: it does
+not set the field and the extraction is not confident. Negated values the
+rules spell out themselves ("no kids", "ohne Kinder") still count.
+
+An adult count plus kids ("2 adults and 2 kids") gives the sum as
+passengers; with kids of unknown number ("2 adults with kids") passengers
+is left out and the extraction is not confident.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Share of words that must be covered by matches or fillers
+MIN_COVERAGE = float(os.getenv("AI_SLOTS_MIN_COVERAGE", "1.0"))
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "eins": 1, "zwei": 2, "drei": 3, "vier": 4, "fünf": 5, "sechs": 6, "sieben": 7, "acht": 8, "neun": 9,
+    "uno": 1, "due": 2, "tre": 3, "quattro": 4, "cinque": 5, "sei": 6, "sette": 7, "otto": 8, "nove": 9,
+}
+# German "zu dritt" / Italian "in tre" style counts
+_GROUP_WORDS = {"zweit": 2, "dritt": 3, "viert": 4, "fünft": 5, "sechst": 6, "siebt": 7, "acht": 8}
+
+_N = r"\d{1,2}|" + "|".join(_NUMBER_WORDS)
+_AMOUNT = r"\d{2,6}(?:[.,]\d{1,2})?"
+
+NUM = "<number>"
+AMOUNT = "<amount>"
+
+# (field, value, language, pattern); {N} / {AMOUNT} become the value when
+# value is NUM / AMOUNT, language "" is shared (no vote for the reply
+# language). At the same position earlier rules win, so negations come
+# before the positive forms.
+RULES: List[Tuple[str, Any, str, str]] = [
+    # passengers
+    ("passengers", NUM, "en", r"(?:we are|we're|there are|there will be) {N}(?: (?:people|persons|adults|of us))?"),
+    ("passengers", NUM, "en", r"{N} (?:people|persons|passengers|adults|travell?ers)"),
+    ("passengers", NUM, "en", r"{N} of us"),
+    ("passengers", NUM, "de", r"wir sind (?:zu )?{N}(?: (?:personen|leute|erwachsene))?"),
+    ("passengers", NUM, "de", r"{N} (?:personen|leute|erwachsene|reisende|mitfahrer)"),
+    ("passengers", NUM, "de", r"(?:wir sind |wir reisen |wir fahren )?zu (?:zweit|dritt|viert|fünft|sechst|siebt|acht)"),
+    ("passengers", NUM, "it", r"siamo (?:in )?{N}(?: (?:persone|adulti))?"),
+    ("passengers", NUM, "it", r"{N} (?:persone|passeggeri|adulti|viaggiatori)"),
+    # kids
+    ("kids", False, "en", r"(?:no|without) (?:kids|children|child)"),
+    ("kids", False, "de", r"(?:keine|ohne) kinder"),
+    ("kids", False, "it", r"(?:senza|niente|nessun) (?:bambini|bambino|figli)"),
+    ("kids", True, "en", r"(?:{N} )?(?:kids|children|child|baby|toddlers?)"),
+    ("kids", True, "de", r"(?:{N} )?(?:kinder|kind|baby|kleinkind|kleinkinder)"),
+    ("kids", True, "it", r"(?:{N} )?(?:bambini|bambino|bimbi|bimbo|figli|neonato)"),
+    # luggage
+    ("luggage", "light", "en", r"(?:little|light|no|only hand|just hand) (?:luggage|bags|baggage)|just a backpack"),
+    ("luggage", "light", "de", r"(?:wenig|kein|nur) (?:gepäck|handgepäck)"),
+    ("luggage", "light", "it", r"(?:poco|niente|nessun|solo) bagagli[oa]?(?: a mano)?"),
+    ("luggage", "many", "en", r"(?:lots of|a lot of|many|big|large|heavy|several) (?:luggage|bags|suitcases|baggage)"),
+    ("luggage", "many", "de", r"(?:viel|viele|große|großes|schwere|mehrere) (?:gepäck|koffer|taschen)"),
+    ("luggage", "many", "it", r"(?:molti|tanti|grandi|parecchi) (?:bagagli|valigie)|molto bagaglio"),
+    # budget
+    ("budget_total", AMOUNT, "", r"budget(?: of| is| von| ist| di| è)? (?:€ ?)?{AMOUNT}(?: ?(?:€|eur|euros?))?"),
+    ("budget_total", AMOUNT, "en", r"(?:max|maximum|up to|under) (?:€ ?)?{AMOUNT}(?: ?(?:€|eur|euros?))?"),
+    ("budget_total", AMOUNT, "de", r"(?:höchstens|maximal|bis zu) (?:€ ?)?{AMOUNT}(?: ?(?:€|eur|euro))?"),
+    ("budget_total", AMOUNT, "it", r"(?:al massimo|massimo|fino a) (?:€ ?)?{AMOUNT}(?: ?(?:€|eur|euro))?"),
+    ("budget_total", AMOUNT, "", r"€ ?{AMOUNT}"),
+    ("budget_total", AMOUNT, "", r"{AMOUNT} ?(?:€|eur|euros?)"),
+    # trip type
+    ("trip_type", "family", "en", r"family (?:trip|holiday|vacation)"),
+    ("trip_type", "family", "de", r"familienurlaub|familienreise|mit der familie"),
+    ("trip_type", "family", "it", r"vacanza in famiglia|viaggio in famiglia|con la famiglia"),
+    ("trip_type", "business", "en", r"(?:a )?business trip|work trip|for work|for business"),
+    ("trip_type", "business", "de", r"geschäftsreise|dienstreise|beruflich"),
+    ("trip_type", "business", "it", r"viaggio di lavoro|per lavoro|trasferta"),
+    ("trip_type", "party", "en", r"(?:a )?bachelor party|party trip"),
+    ("trip_type", "party", "de", r"junggesellenabschied"),
+    ("trip_type", "party", "it", r"addio al celibato|festa"),
+    ("trip_type", "party", "", r"party|festival"),
+    # comfort
+    ("comfort_priority", "high", "en", r"(?:something )?(?:comfortable|comfort|luxury|luxurious|premium)"),
+    ("comfort_priority", "high", "de", r"komfortabel|komfort|bequem|luxus|luxuriös"),
+    ("comfort_priority", "high", "it", r"comod[oa]|comfort|lusso|lussuos[oa]"),
+    # winter
+    ("winter_driving", True, "en", r"(?:in )?(?:winter|snow|skiing|ski trip|the mountains|the alps)"),
+    ("winter_driving", True, "de", r"(?:im )?(?:winter|schnee|skiurlaub|skifahren|in die berge|in die alpen)"),
+    ("winter_driving", True, "it", r"(?:in )?(?:inverno|neve|settimana bianca|montagna|sulle alpi)"),
+    # risk
+    ("risk_aversion", "low", "en", r"(?:no|basic|minimum|minimal) (?:coverage|cover|protection|insurance)"),
+    ("risk_aversion", "low", "de", r"(?:keine|minimale) (?:versicherung|absicherung)|basisschutz"),
+    ("risk_aversion", "low", "it", r"(?:nessuna|minima) (?:assicurazione|copertura)|copertura base"),
+    ("risk_aversion", "high", "en", r"(?:full|maximum|complete|best) (?:coverage|cover|protection|insurance)"),
+    ("risk_aversion", "high", "de", r"vollkasko|volle absicherung|rundum abgesichert"),
+    ("risk_aversion", "high", "it", r"kasko|copertura (?:completa|totale)|massima protezione"),
+    # transmission (Profile.TRANSMISSION_CHOICES)
+    ("preferred_transmission", "automatic", "en", r"(?:an )?automatic(?: transmission| car| gearbox)?"),
+    ("preferred_transmission", "automatic", "de", r"automatik(?:getriebe)?"),
+    ("preferred_transmission", "automatic", "it", r"(?:cambio )?automatic[oa]"),
+    ("preferred_transmission", "manual", "en", r"(?:a )?manual(?: transmission| car| gearbox)?|stick shift"),
+    ("preferred_transmission", "manual", "de", r"schaltgetriebe|schaltwagen|manuell"),
+    ("preferred_transmission", "manual", "it", r"cambio manuale|manuale"),
+    # fuel (Profile.FUEL_CHOICES)
+    ("fuel_preference", "electric", "en", r"(?:an )?(?:electric|ev)(?: car)?"),
+    ("fuel_preference", "electric", "de", r"elektro(?:auto)?|e-auto|elektrisch"),
+    ("fuel_preference", "electric", "it", r"elettric[oa]|auto elettrica"),
+    ("fuel_preference", "hybrid", "", r"(?:a )?hybrid(?: car|auto)?"),
+    ("fuel_preference", "hybrid", "it", r"ibrid[oa]"),
+    ("fuel_preference", "diesel", "", r"(?:a )?diesel"),
+    ("fuel_preference", "petrol", "en", r"petrol|gasoline"),
+    ("fuel_preference", "petrol", "de", r"benzin(?:er)?"),
+    ("fuel_preference", "petrol", "it", r"benzina"),
+]
+
+FILLERS = {
+    "en": {
+        "we", "are", "i", "am", "i'm", "with", "and", "a", "an", "the", "our", "my", "us", "of", "for",
+        "have", "has", "need", "want", "would", "like", "also", "plus", "just", "only", "please", "ok",
+        "okay", "yes", "so", "will", "be", "going", "travelling", "traveling", "prefer", "some", "car",
+        "total", "around", "about", "on", "in", "to", "it", "is", "trip", "too",
+    },
+    "de": {
+        "wir", "sind", "ich", "bin", "mit", "und", "ein", "eine", "einen", "unser", "unsere", "haben",
+        "hat", "brauchen", "brauche", "möchte", "möchten", "gerne", "gern", "auch", "bitte", "ja", "für",
+        "das", "die", "der", "den", "auto", "wagen", "etwa", "ungefähr", "reisen", "fahren", "im", "in",
+        "es", "ist", "also", "insgesamt",
+    },
+    "it": {
+        "siamo", "sono", "io", "con", "e", "un", "una", "il", "la", "i", "le", "lo", "abbiamo", "ho",
+        "vorrei", "vorremmo", "serve", "servono", "anche", "per", "favore", "sì", "si", "macchina", "auto",
+        "circa", "viaggiamo", "in", "di", "a", "ok", "è", "totale", "ci", "noi",
+    },
+}
+_ALL_FILLERS = set().union(*FILLERS.values())
+# Fillers of one language only: they decide the reply language on a tie
+_OWN_FILLERS = {
+    language: words - set().union(*(w for lang, w in FILLERS.items() if lang != language))
+    for language, words in FILLERS.items()
+}
+
+
+def _compile():
+    parts = []
+    for i, (_, value, _, pattern) in enumerate(RULES):
+        if value in (NUM, AMOUNT) and pattern.count("{N}") + pattern.count("{AMOUNT}") > 1:
+            # Only the first would be captured: one rule per alternative
+            raise ValueError(f"slot rule {i} has more than one number: {pattern!r}")
+        pattern = pattern.replace("{N}", f"(?:{_N})").replace("{AMOUNT}", f"(?:{_AMOUNT})")
+        if value in (NUM, AMOUNT):
+            # Capture the first number of the rule
+            number = _N if value == NUM else _AMOUNT
+            pattern = pattern.replace(f"(?:{number})", f"(?P<v{i}>{number})", 1)
+        parts.append(f"(?P<r{i}>{pattern})")
+    return re.compile(r"(?<!\w)(?:" + "|".join(parts) + r")(?!\w)")
+
+
+_PATTERN = _compile()
+_WORD = re.compile(r"[\w€$'-]+")
+
+# A negation this many words before a match (same clause) cancels it
+NEGATION_WINDOW = 3
+_NEGATIONS = {
+    "not", "no", "don't", "dont", "doesn't", "never", "without",
+    "nicht", "kein", "keine", "keinen", "nie", "ohne",
+    "non", "niente", "senza", "mai",
+}
+_CLAUSE_BREAK = re.compile(r"[,.;:!?]|\b(?:but|aber|sondern|ma|però)\b")
+
+
+# "2 adults and 2 kids": the passengers count leaves the kids out
+_ADULTS = re.compile(r"\b(?:adults|erwachsene|adulti)\b")
+
+
+def _count(word: str) -> Optional[int]:
+    return int(word) if word.isdigit() else _NUMBER_WORDS.get(word)
+
+
+def _negated(text: str, start: int) -> bool:
+    clause = _CLAUSE_BREAK.split(text[:start])[-1]
+    return any(word in _NEGATIONS for word in clause.split()[-NEGATION_WINDOW:])
+
+
+def _value(i: int, match: re.Match) -> Any:
+    value = RULES[i][1]
+    if value == NUM:
+        raw = match.groupdict().get(f"v{i}")
+        if raw is None:
+            # "zu dritt"
+            return next((n for word, n in _GROUP_WORDS.items() if word in match[f"r{i}"]), None)
+        return _count(raw)
+    if value == AMOUNT:
+        raw = match.groupdict().get(f"v{i}")
+        return None if raw is None else float(raw.replace(",", "."))
+    return value
+
+
+class Extraction:
+    def __init__(self, slots: Dict[str, Any], language: str, coverage: float, conflicts: List[str], question: bool,
+                 negated: List[str] = (), uncounted: List[str] = ()):
+        self.slots = slots
+        self.language = language
+        self.coverage = coverage
+        self.conflicts = conflicts
+        self.question = question
+        self.negated = list(negated)
+        # Fields only partly known ("2 adults with kids")
+        self.uncounted = list(uncounted)
+
+    @property
+    def confident(self) -> bool:
+        return (bool(self.slots) and not self.conflicts and not self.negated and not self.uncounted
+                and not self.question
+                and self.coverage >= MIN_COVERAGE)
+
+    def __repr__(self):
+        return f"Extraction({self.slots}, {self.language!r}, coverage={self.coverage:.2f}, confident={self.confident})"
+
+
+def extract(message: str) -> Extraction:
+    text = " ".join(message.lower().split())
+    slots: Dict[str, Any] = {}
+    conflicts: List[str] = []
+    negated: List[str] = []
+    uncounted: List[str] = []
+    adults = False
+    kids: List[Optional[int]] = []
+    votes = {"en": 0, "de": 0, "it": 0}
+    spans = []
+
+    for match in _PATTERN.finditer(text):
+        i = int(match.lastgroup[1:])
+        field, _, language, _ = RULES[i]
+        if _negated(text, match.start()):
+            negated.append(field)
+            continue
+        value = _value(i, match)
+        if value is None:
+            # No number to read: not a match (and not covered)
+            continue
+        if field in slots and slots[field] != value:
+            conflicts.append(field)
+        slots[field] = value
+        if field == "passengers" and _ADULTS.search(match.group()):
+            adults = True
+        elif field == "kids" and value is True:
+            kids.append(_count(match.group().split()[0]))
+        if language:
+            votes[language] += 1
+        spans.append(match.span())
+
+    if adults and kids and "passengers" not in conflicts:
+        if None in kids:
+            # How many kids is not said: no count rather than too few, the model asks
+            uncounted.append("passengers")
+            del slots["passengers"]
+        else:
+            slots["passengers"] += sum(kids)
+
+    words = list(_WORD.finditer(text))
+    covered = 0
+    for word in words:
+        inside = any(start <= word.start() and word.end() <= end for start, end in spans)
+        if inside or word.group().strip("'-") in _ALL_FILLERS:
+            covered += 1
+        for language, fillers in _OWN_FILLERS.items():
+            if not inside and word.group() in fillers:
+                votes[language] += 0.1
+
+    language = max(votes, key=lambda lang: (votes[lang], lang == "en"))
+    coverage = covered / len(words) if words else 0.0
+    return Extraction(slots, language, coverage, conflicts, "?" in text, negated, uncounted)
+
+
+# Regression check at import: messages whose number sits in a second
+# alternative of a rule once raised instead of extracting
+_REGRESSIONS = {
+    "just the two of us": {"passengers": 2},
+    "the 3 of us": {"passengers": 3},
+    "300 eur": {"budget_total": 300.0},
+    "we are 2 adults and 2 kids": {"passengers": 4, "kids": True},
+}
+for _message, _expected in _REGRESSIONS.items():
+    if extract(_message).slots != _expected:
+        raise RuntimeError(f"slots.extract({_message!r}) != {_expected}")
+
+
+# -------------------------------------------------------------------------
+#  Template reply
+# -------------------------------------------------------------------------
+
+_PHRASES = {
+    "en": {
+        "passengers": "{} passengers",
+        "kids": {True: "travelling with kids", False: "no kids"},
+        "luggage": {"many": "lots of luggage", "light": "light luggage"},
+        "budget_total": "a budget of €{:.0f}",
+        "trip_type": {"family": "a family trip", "business": "a business trip", "party": "a party trip"},
+        "comfort_priority": {"high": "comfort matters"},
+        "winter_driving": {True: "winter driving"},
+        "risk_aversion": {"high": "full protection", "low": "basic protection"},
+        "preferred_transmission": {"automatic": "automatic transmission", "manual": "manual transmission"},
+        "fuel_preference": {"electric": "electric", "hybrid": "hybrid", "diesel": "diesel", "petrol": "petrol"},
+        "intro": "Got it: {}. I've updated the suggestions below.",
+        "ask": {
+            "passengers": "How many people are travelling?",
+            "luggage": "How much luggage will you bring?",
+            "trip_type": "What kind of trip is it?",
+        },
+        "done": "Anything else I should keep in mind?",
+        "and": " and ",
+    },
+    "de": {
+        "passengers": "{} Personen",
+        "kids": {True: "mit Kindern", False: "ohne Kinder"},
+        "luggage": {"many": "viel Gepäck", "light": "wenig Gepäck"},
+        "budget_total": "ein Budget von {:.0f} €",
+        "trip_type": {"family": "eine Familienreise", "business": "eine Geschäftsreise", "party": "eine Party-Reise"},
+        "comfort_priority": {"high": "Komfort ist wichtig"},
+        "winter_driving": {True: "Fahrten im Winter"},
+        "risk_aversion": {"high": "volle Absicherung", "low": "Basisschutz"},
+        "preferred_transmission": {"automatic": "Automatik", "manual": "Schaltgetriebe"},
+        "fuel_preference": {"electric": "Elektro", "hybrid": "Hybrid", "diesel": "Diesel", "petrol": "Benzin"},
+        "intro": "Alles klar: {}. Ich habe die Vorschläge unten angepasst.",
+        "ask": {
+            "passengers": "Wie viele Personen reisen mit?",
+            "luggage": "Wie viel Gepäck nehmen Sie mit?",
+            "trip_type": "Was für eine Reise ist es?",
+        },
+        "done": "Gibt es sonst noch etwas, das ich berücksichtigen soll?",
+        "and": " und ",
+    },
+    "it": {
+        "passengers": "{} persone",
+        "kids": {True: "con bambini", False: "senza bambini"},
+        "luggage": {"many": "molti bagagli", "light": "pochi bagagli"},
+        "budget_total": "un budget di {:.0f} €",
+        "trip_type": {"family": "un viaggio in famiglia", "business": "un viaggio di lavoro", "party": "una festa"},
+        "comfort_priority": {"high": "il comfort è importante"},
+        "winter_driving": {True: "guida invernale"},
+        "risk_aversion": {"high": "protezione completa", "low": "protezione base"},
+        "preferred_transmission": {"automatic": "cambio automatico", "manual": "cambio manuale"},
+        "fuel_preference": {"electric": "elettrica", "hybrid": "ibrida", "diesel": "diesel", "petrol": "benzina"},
+        "intro": "Perfetto: {}. Ho aggiornato i suggerimenti qui sotto.",
+        "ask": {
+            "passengers": "Quante persone viaggiano?",
+            "luggage": "Quanti bagagli portate?",
+            "trip_type": "Che tipo di viaggio è?",
+        },
+        "done": "C'è altro di cui devo tenere conto?",
+        "and": " e ",
+    },
+}
+
+
+def _phrase(phrases: Dict[str, Any], field: str, value: Any) -> Optional[str]:
+    phrase = phrases.get(field)
+    if isinstance(phrase, dict):
+        return phrase.get(value)
+    return phrase.format(value) if phrase else None
+
+
+def reply(extraction: Extraction, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Agent result (same shape as SalesAgent.run) for a confident extraction."""
+    phrases = _PHRASES[extraction.language]
+    parts = [p for p in (_phrase(phrases, f, v) for f, v in extraction.slots.items()) if p]
+    summary = ", ".join(parts[:-1]) + phrases["and"] + parts[-1] if len(parts) > 1 else parts[0]
+
+    known = {**(state or {}), **extraction.slots}
+    missing = next((field for field in phrases["ask"] if known.get(field) in (None, "")), None)
+    follow_up = phrases["ask"][missing] if missing else phrases["done"]
+
+    return {
+        "assistant_message": f"{phrases['intro'].format(summary)} {follow_up}",
+        "state_update": dict(extraction.slots),
+        "needs": {"protections": [], "addons": []},
+    }
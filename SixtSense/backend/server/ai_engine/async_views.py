@@ -0,0 +1,249 @@
+# ai_engine/async_views.py
+"""
+Async-native versions of the chat endpoints, routed instead of the DRF
+views when settings.ASYNC_VIEWS is on (deploy under an ASGI server, see
+core/asgi.py). While the LLM or SIXT is being awaited the request holds no
+thread, so one process can keep many chats in flight.
+
+Same URLs, payloads and responses as ai_engine.views.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from core.async_views import AsyncAPIView
+
+from .models import BookingContext, ChatSession, ChatMessage
+from .serializers import StartChatSerializer, ChatMessageSerializer, WhatIfSerializer
+from .prefetch import start_prefetch, await_prefetch
+from .opening import start_opening
+from .tasks import enqueue
+from .deadline import Deadline
+from .degradation import tracked
+
+from .ai.agent import SalesAgent
+from .ai.ranking_session import get_session
+from .recommendations import ChatRecommender, afind_comparison
+
+from sixtbridge.sixt_api import aget_booking, aget_vehicles_with_meta
+
+
+def _start_session_work(chat_session: ChatSession):
+    # Both only touch the DB / cache and hand the rest to the background pool
+    start_prefetch(chat_session)
+    return start_opening(chat_session)
+
+
+# -------------------------------------------------------------------------
+#  START CHAT  (creates BookingContext + ChatSession)
+# -------------------------------------------------------------------------
+class StartChatAPIView(AsyncAPIView):
+
+    async def post(self, request):
+        data = self.validate(request, StartChatSerializer)
+        booking_id = data["booking_id"]
+
+        # --- Fetch real booking from SIXT ---
+        try:
+            booking_data = await aget_booking(booking_id)
+        except Exception:
+            return self.respond(
+                {"error": "Invalid booking_id or SIXT API unavailable"},
+                status=400,
+            )
+
+        # --- Store booking context ---
+        booking_context, created = await BookingContext.objects.aget_or_create(
+            booking_id=booking_id,
+            defaults={"data": booking_data}
+        )
+
+        # If booking exists: refresh data
+        if not created:
+            booking_context.data = booking_data
+            await booking_context.asave()
+
+        # --- Create chat session ---
+        chat_session = await ChatSession.objects.acreate(
+            booking=booking_context,
+            state={},
+            user=None,  # no auth for now
+        )
+
+        # --- Prefetch + opening pitch (see views.StartChatAPIView) ---
+        opening = await sync_to_async(_start_session_work)(chat_session)
+
+        return self.respond({
+            "chat_session_id": str(chat_session.id),
+            "booking": booking_context.data,
+            "prefetch": chat_session.prefetch["status"],
+            "opening": "ready" if opening else "pending",
+            "messages": [
+                {
+                    "role": opening.role,
+                    "content": opening.content,
+                    "created_at": opening.created_at.isoformat(),
+                }
+            ] if opening else [],
+        })
+
+
+# -------------------------------------------------------------------------
+#  MAIN CHAT BOT ENDPOINT (AI + recommendations)
+# -------------------------------------------------------------------------
+class ChatAPIView(AsyncAPIView):
+
+    @tracked
+    async def post(self, request):
+        started = time.perf_counter()
+        deadline = Deadline.for_turn(started)
+        data = self.validate(request, ChatMessageSerializer)
+
+        chat_session = await ChatSession.objects.select_related("booking").aget(
+            id=data["chat_session_id"]
+        )
+        user_message = data["message"]
+
+        prefetch = await await_prefetch(chat_session)
+
+        # 1) Save user message
+        await ChatMessage.objects.acreate(
+            chat_session=chat_session,
+            role="user",
+            content=user_message,
+        )
+
+        booking_data = chat_session.booking.data
+        profile_data = {}
+        current_state = chat_session.state or {}
+
+        # Last 8 messages (fewer while degraded), in chronological order
+        history_msgs = [
+            m async for m in chat_session.messages.order_by("-created_at")[:deadline.history_size(8)]
+        ][::-1]
+        history_text = "\n".join(
+            f"{'User' if m.role == 'user' else 'Assistant'}: {m.content}"
+            for m in history_msgs
+        )
+
+        booking_id = chat_session.booking.booking_id
+        session_id = str(chat_session.id)
+        ranking = get_session(session_id)
+
+        # "Like the BMW but automatic": look the cars up before the agent answers
+        comparison = await afind_comparison(booking_id, user_message, ranking)
+
+        # 2) Run AI Agent (LangChain), awaited
+        agent = SalesAgent.for_turn(deadline)
+        result = await agent.arun(
+            booking=booking_data,
+            profile=profile_data,
+            state=current_state if comparison is None else {**current_state, "comparison": comparison.summary()},
+            message=user_message,
+            history=history_text,
+            catalog=prefetch.get("catalog"),
+        )
+
+        assistant_message = result["assistant_message"]
+        state_update = result.get("state_update", {}) or {}
+        needs = result.get("needs", {}) or {}
+
+        new_state = {**current_state, **state_update}
+        chat_session.state = new_state
+        await chat_session.asave(update_fields=["state", "updated_at"])
+
+        # Written now: its created_at orders the transcript and the next
+        # turn's history. Only the analytics below are deferred.
+        reply = await ChatMessage.objects.acreate(
+            chat_session=chat_session,
+            role=ChatMessage.ROLE_ASSISTANT,
+            content=assistant_message,
+        )
+
+        if data["text_only"]:
+            await sync_to_async(enqueue)(
+                "compute_session_recommendations", session_id=session_id, needs=needs, message=user_message,
+            )
+            recommendations = {"cars": [], "protections": [], "addons": [], "bundles": [], "upstream": {}}
+        else:
+            recommender = ChatRecommender(booking_id, prefetch, deadline, ranking=ranking, comparison=comparison)
+            recommendations = await recommender.abuild(new_state, needs)
+
+        await sync_to_async(enqueue)(
+            "annotate_chat_message",
+            message_id=reply.id,
+            metadata={
+                "cars": [c["id"] for c in recommendations["cars"]],
+                "state_update": state_update,
+                "needs": needs,
+                "upstream_sources": {k: v["source"] for k, v in recommendations["upstream"].items()},
+                "ranking": recommendations.pop("ranking", None),
+                "comparison": comparison.summary() if comparison is not None else None,
+                "turn_seconds": round(time.perf_counter() - started, 3),
+                "latency_paths": deadline.paths,
+                "degraded": deadline.degraded_stages(),
+                "async": True,
+            },
+        )
+
+        messages = [
+            {
+                "role": m.role,
+                "content": m.content,
+                "created_at": m.created_at.isoformat()
+            }
+            async for m in chat_session.messages.all()
+        ]
+
+        return self.respond({
+            "chat_session_id": session_id,
+            "messages": messages,
+            "cars": recommendations["cars"],
+            "protections": recommendations["protections"],
+            "addons": recommendations["addons"],
+            "bundles": recommendations["bundles"],
+            "state": new_state,
+            "upstream": recommendations["upstream"],
+            "recommendations_pending": data["text_only"],
+            "latency": deadline.summary(),
+        })
+
+
+class ChatRecommendationsAPIView(AsyncAPIView):
+    """
+    GET /api/ai-engine/chat/<chat_session_id>/recommendations/
+    """
+
+    async def get(self, request, chat_session_id):
+        try:
+            chat_session = await ChatSession.objects.aget(id=chat_session_id)
+        except ChatSession.DoesNotExist:
+            raise Http404
+        return self.respond({
+            "chat_session_id": str(chat_session.id),
+            "ready": bool(chat_session.recommendations),
+            **chat_session.recommendations,
+        })
+
+
+class WhatIfRankingAPIView(AsyncAPIView):
+    """
+    POST /api/ai-engine/what-if/
+    """
+
+    async def post(self, request):
+        data = self.validate(request, WhatIfSerializer)
+
+        try:
+            deals = (await aget_vehicles_with_meta(data["booking_id"]))[0].get("deals", [])
+        except Exception:
+            return self.respond({"error": "Invalid booking_id or SIXT API unavailable"}, status=400)
+
+        from .ai.batch_scoring import what_if
+
+        # A few milliseconds of NumPy even for thousands of profiles: run inline
+        return self.respond({
+            "booking_id": data["booking_id"],
+            **what_if(deals, data["profiles"], data["k"], data["include_scores"]),
+        })
@@ -0,0 +1,37 @@
+# ai_engine/background.py
+"""
+Thread pool for work that should not hold up the HTTP response
+(catalog prefetch, cache warming, ...).
+
+Jobs run at background priority for LLM admission (ai.admission), so
+interactive chat turns are served first when the model is busy.
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .ai import admission
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_BACKGROUND_WORKERS", "4")),
+    thread_name_prefix="ai-background",
+)
+
+
+def _run(fn, *args, **kwargs):
+    # Worker threads get their own DB connection; make sure it is usable
+    # before and released after each job.
+    close_old_connections()
+    try:
+        with admission.priority(admission.BACKGROUND):
+            return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"[ai_engine] background job {getattr(fn, '__name__', fn)} failed: {e}")
+        raise
+    finally:
+        close_old_connections()
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    return _executor.submit(_run, fn, *args, **kwargs)
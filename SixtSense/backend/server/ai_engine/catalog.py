@@ -0,0 +1,38 @@
+# ai_engine/catalog.py
+"""
+Helpers to identify a booking's catalog independently of the booking id.
+
+Two bookings at the same branch usually get the exact same deals; the
+fingerprint lets us share work (opening pitch, rendered prompts, ...)
+between them.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List
+
+
+def _digest(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def catalog_fingerprint(deals: List[Dict[str, Any]]) -> str:
+    """
+    Stable hash of what matters for recommendations: which vehicles are
+    offered, at which price, and which one is the booked category.
+    """
+    rows = sorted(
+        (
+            d["vehicle"]["id"],
+            d["pricing"]["totalPrice"]["amount"],
+            d["pricing"]["displayPrice"]["amount"],
+            d.get("dealInfo") or "",
+        )
+        for d in deals
+    )
+    return _digest(rows)
+
+
+def payload_fingerprint(payload: Any) -> str:
+    """Hash of a whole SIXT payload (protections, addons, ...)."""
+    return _digest(payload)
@@ -0,0 +1,77 @@
+# ai_engine/deadline.py
+"""
+Per-turn latency budget.
+
+The chat views start a Deadline when the request arrives and pass it down
+the pipeline (ChatRecommender -> hybrid_rank_deals). Optional stages such
+as the LLM re-rank only get the budget that is left, fall back to the
+cheap path when it runs out, and record which path they took. The record is
+returned with the turn and stored in the assistant message metadata.
+
+A turn's Deadline also carries the stages the degradation controller
+switched off when it started (see degradation.py).
+"""
+import os
+import time
+from typing import Dict, FrozenSet, List, Optional
+
+from core import metrics
+
+from . import degradation
+
+# Wall-clock budget for one chat turn (agent + recommendations)
+TURN_BUDGET = float(os.getenv("AI_TURN_BUDGET", "6.0"))
+
+# Below this much remaining budget the LLM re-rank is not attempted at all
+RERANK_MIN_BUDGET = float(os.getenv("AI_RERANK_MIN_BUDGET", "0.5"))
+
+# Upper bound for a single re-rank call, whatever budget is left
+RERANK_MAX_SECONDS = float(os.getenv("AI_RERANK_MAX_SECONDS", "2.5"))
+
+
+class Deadline:
+    def __init__(self, budget: float, started: Optional[float] = None, degraded: FrozenSet[str] = frozenset()):
+        self.budget = budget
+        # time.perf_counter() of when the turn started
+        self.started = time.perf_counter() if started is None else started
+        self.paths: Dict[str, str] = {}
+        self.degraded = degraded
+
+    @classmethod
+    def for_turn(cls, started: Optional[float] = None) -> "Deadline":
+        degraded = degradation.controller.stages()
+        for stage in degraded:
+            metrics.incr(f"degradation.skipped.{stage}")
+        return cls(TURN_BUDGET, started, degraded)
+
+    def is_degraded(self, stage: str) -> bool:
+        return stage in self.degraded
+
+    def history_size(self, full: int) -> int:
+        """Messages of history to send to the agent this turn."""
+        return min(full, degradation.SHORT_HISTORY) if self.is_degraded("history") else full
+
+    def degraded_stages(self) -> List[str]:
+        return [stage for stage in degradation.STAGES if stage in self.degraded]
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget - self.elapsed())
+
+    def timeout_for(self, cap: float) -> float:
+        """Seconds a stage may take: the remaining budget, at most `cap`."""
+        return min(cap, self.remaining())
+
+    def record(self, stage: str, path: str):
+        self.paths[stage] = path
+        metrics.incr(f"deadline.{stage}.{path}")
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "budget_seconds": self.budget,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "paths": dict(self.paths),
+            "degraded": self.degraded_stages(),
+        }
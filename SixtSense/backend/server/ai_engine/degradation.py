@@ -0,0 +1,150 @@
+# ai_engine/degradation.py
+"""
+Load-driven degradation of the chat pipeline.
+
+The controller watches this worker's recent chat turns: the p95 turn
+latency over the last WINDOW_SECONDS and how many turns are in flight.
+When either goes above its target it switches off the next optional stage,
+in this order:
+
+    rerank   LLM re-rank of the cars (rule ranking only)
+    history  conversation history sent to the agent (last 2 messages)
+    extras   protections / addons recommendations
+    model    agent runs on the cheaper AI_DEGRADED_MODEL
+
+and turns them back on one at a time once the load is clearly lower.
+Hysteresis keeps it from flapping: stepping up needs pressure above
+PRESSURE_HIGH, stepping down needs it below PRESSURE_LOW, and every level
+is held for at least HOLD_UP_SECONDS / HOLD_DOWN_SECONDS.
+
+The stages of a turn are fixed when it starts (Deadline.for_turn) and are
+returned with the turn's latency summary and stored in the message metadata.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import FrozenSet
+
+from core import metrics
+
+ENABLED = os.getenv("AI_DEGRADATION", "true").lower() in ("1", "true", "yes")
+
+# Switched off in this order, switched back on in reverse
+STAGES = ("rerank", "history", "extras", "model")
+
+TARGET_P95 = float(os.getenv("AI_DEGRADE_TARGET_P95", "4.0"))
+MAX_IN_FLIGHT = int(os.getenv("AI_DEGRADE_MAX_IN_FLIGHT", "16"))
+
+# Load relative to the targets (the larger of latency and in-flight)
+PRESSURE_HIGH = float(os.getenv("AI_DEGRADE_PRESSURE_HIGH", "1.0"))
+PRESSURE_LOW = float(os.getenv("AI_DEGRADE_PRESSURE_LOW", "0.6"))
+
+HOLD_UP_SECONDS = float(os.getenv("AI_DEGRADE_HOLD_UP", "2.0"))
+HOLD_DOWN_SECONDS = float(os.getenv("AI_DEGRADE_HOLD_DOWN", "15.0"))
+
+WINDOW_SECONDS = float(os.getenv("AI_DEGRADE_WINDOW", "30.0"))
+# Fewer recent turns than this: latency is not used
+MIN_SAMPLES = 5
+
+# History kept when "history" is degraded
+SHORT_HISTORY = 2
+
+
+class DegradationController:
+    def __init__(
+        self,
+        target_p95: float = TARGET_P95,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        high: float = PRESSURE_HIGH,
+        low: float = PRESSURE_LOW,
+        hold_up: float = HOLD_UP_SECONDS,
+        hold_down: float = HOLD_DOWN_SECONDS,
+        window: float = WINDOW_SECONDS,
+    ):
+        self.target_p95 = target_p95
+        self.max_in_flight = max_in_flight
+        self.high = high
+        self.low = low
+        self.hold_up = hold_up
+        self.hold_down = hold_down
+        self.window = window
+
+        self.level = 0
+        self._in_flight = 0
+        # (finished at, seconds) of recent turns
+        self._turns = deque()
+        self._changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _p95(self, now: float) -> float:
+        while self._turns and self._turns[0][0] < now - self.window:
+            self._turns.popleft()
+        if len(self._turns) < MIN_SAMPLES:
+            return 0.0
+        samples = sorted(seconds for _, seconds in self._turns)
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def pressure(self, now: float) -> float:
+        return max(self._p95(now) / self.target_p95, self._in_flight / self.max_in_flight)
+
+    def _update(self, now: float):
+        pressure = self.pressure(now)
+        held = now - self._changed_at
+        if pressure > self.high and self.level < len(STAGES) and held >= self.hold_up:
+            self.level += 1
+            metrics.incr("degradation.step_up")
+        elif pressure < self.low and self.level > 0 and held >= self.hold_down:
+            self.level -= 1
+            metrics.incr("degradation.step_down")
+        else:
+            return
+        self._changed_at = now
+        metrics.gauge("degradation.level", self.level)
+        print(f"[ai_engine] degradation level {self.level} (pressure {pressure:.2f}): {STAGES[:self.level]}")
+
+    def stages(self) -> FrozenSet[str]:
+        """Stages to skip for a turn starting now."""
+        if not ENABLED:
+            return frozenset()
+        with self._lock:
+            self._update(time.monotonic())
+            return frozenset(STAGES[:self.level])
+
+    @contextmanager
+    def turn(self):
+        """Count a chat turn as in flight and record how long it took."""
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+            metrics.gauge("degradation.in_flight", self._in_flight)
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self._in_flight -= 1
+                self._turns.append((now, now - started))
+                metrics.gauge("degradation.in_flight", self._in_flight)
+
+
+controller = DegradationController()
+
+
+def tracked(view_method):
+    """Run a (sync or async) chat view method inside controller.turn()."""
+    if asyncio.iscoroutinefunction(view_method):
+        @functools.wraps(view_method)
+        async def async_wrapper(*args, **kwargs):
+            with controller.turn():
+                return await view_method(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view_method)
+    def wrapper(*args, **kwargs):
+        with controller.turn():
+            return view_method(*args, **kwargs)
+    return wrapper
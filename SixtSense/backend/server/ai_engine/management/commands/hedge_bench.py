@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+from ai_engine.ai.agent import SalesAgent
+from ai_engine.ai.fake_llm import FakeChatModel, latency_distribution
+from ai_engine.ai.hedging import Hedger
+
+# Not a template turn (ai.router), so every call reaches the model
+MESSAGE = "We are four with two kids, which car fits our luggage?"
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))]
+
+    return f"p50 {pct(0.50):.3f}s  p95 {pct(0.95):.3f}s  p99 {pct(0.99):.3f}s  max {latencies[-1]:.3f}s"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run SalesAgent against the fake model with an injected latency "
+        "distribution, without and with hedging, and compare tail latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--calls", type=int, default=300)
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--median", type=float, default=0.05, help="Median model latency (s).")
+        parser.add_argument("--sigma", type=float, default=0.3)
+        parser.add_argument("--outlier-rate", type=float, default=0.03)
+        parser.add_argument("--outlier-seconds", type=float, default=1.0)
+        parser.add_argument("--percentile", type=float, default=0.95, help="Hedge after this latency percentile.")
+        parser.add_argument("--max-rate", type=float, default=0.1, help="Max fraction of hedged calls.")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def run_round(self, agent: SalesAgent, options) -> list:
+        async def one(semaphore, latencies):
+            async with semaphore:
+                started = time.perf_counter()
+                await agent.arun(booking={}, profile={}, state={}, message=MESSAGE)
+                latencies.append(time.perf_counter() - started)
+
+        async def main():
+            semaphore = asyncio.Semaphore(options["concurrency"])
+            latencies = []
+            await asyncio.gather(*(one(semaphore, latencies) for _ in range(options["calls"])))
+            return latencies
+
+        return asyncio.run(main())
+
+    def handle(self, *args, **options):
+        llm = FakeChatModel(latency=latency_distribution(
+            median=options["median"],
+            sigma=options["sigma"],
+            outlier_rate=options["outlier_rate"],
+            outlier_seconds=options["outlier_seconds"],
+            seed=options["seed"],
+        ))
+
+        baseline = self.run_round(SalesAgent(llm=llm), options)
+        self.stdout.write(f"no hedging : {_summary(baseline)}")
+
+        hedger = Hedger(
+            "hedge_bench",
+            percentile=options["percentile"],
+            min_samples=20,
+            default_delay=options["median"] * 4,
+            max_rate=options["max_rate"],
+        )
+        hedged = self.run_round(SalesAgent(llm=llm, hedger=hedger), options)
+        self.stdout.write(f"hedging    : {_summary(hedged)}")
+
+        calls = metrics.get_counter("llm.hedge.calls.hedge_bench")
+        fired = metrics.get_counter("llm.hedge.fired.hedge_bench")
+        won = metrics.get_counter("llm.hedge.won.hedge_bench")
+        capped = metrics.get_counter("llm.hedge.capped.hedge_bench")
+        self.stdout.write(
+            f"hedge rate {fired / calls:.1%} (cap {options['max_rate']:.0%}), "
+            f"backup won {won / fired if fired else 0:.1%} of hedges, capped {int(capped)}"
+        )
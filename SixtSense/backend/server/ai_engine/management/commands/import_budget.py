@@ -0,0 +1,102 @@
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Startup-time regression budget, per entry point (cumulative import time in
+# ms, measured after django.setup()). Generous on purpose: the hard check is
+# that none of these import LangChain/OpenAI, which alone costs ~800 ms.
+BUDGETS_MS = {
+    "core.urls": 400,
+    "core.wsgi": 400,
+    "accounts.views": 250,
+    "booking.views": 250,
+    "ai_engine.views": 300,
+    "ai_engine.management.commands.run_outbox": 250,
+}
+
+# Heavy AI dependencies that must only be imported on first use
+FORBIDDEN_PREFIXES = ("langchain", "langchain_core", "langchain_openai", "openai", "tiktoken")
+
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(module: str):
+    """
+    Run `python -X importtime` in a fresh interpreter and return
+    (cumulative_us_of_module, {top_level_package: self_us}, imported_modules).
+    """
+    code = (
+        "import os, django;"
+        f"os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings.SETTINGS_MODULE!r});"
+        "django.setup();"
+        "import sys; print('--- setup done ---', file=sys.stderr, flush=True);"
+        f"import {module}"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(settings.BASE_DIR),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise CommandError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    after_setup = proc.stderr.split("--- setup done ---", 1)[-1]
+
+    cumulative_us = 0
+    per_package = defaultdict(int)
+    imported = []
+    for line in after_setup.splitlines():
+        m = LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        imported.append(name)
+        per_package[name.split(".")[0]] += self_us
+        if len(indent) == 1:
+            # top-level imports triggered by `import module`
+            cumulative_us += cum_us
+    return cumulative_us, per_package, imported
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure import time (python -X importtime) of the app entry points and "
+        "fail if one exceeds its budget or imports LangChain eagerly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=8, help="Packages to list per entry point.")
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="Multiply all budgets (slow CI machines).",
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+
+        for module, budget_ms in BUDGETS_MS.items():
+            cumulative_us, per_package, imported = measure(module)
+            total_ms = cumulative_us / 1000
+            budget_ms = budget_ms * options["scale"]
+
+            self.stdout.write(f"{module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+            top = sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[: options["top"]]
+            for package, self_us in top:
+                self.stdout.write(f"    {package:<30} {self_us / 1000:8.1f} ms")
+
+            heavy = sorted({m for m in imported if m.split(".")[0] in FORBIDDEN_PREFIXES})
+            if heavy:
+                failures.append(f"{module} imports {', '.join(heavy[:5])}")
+            if total_ms > budget_ms:
+                failures.append(f"{module} took {total_ms:.1f} ms > {budget_ms:.0f} ms")
+
+        if failures:
+            raise CommandError("Import budget exceeded:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All entry points within budget."))
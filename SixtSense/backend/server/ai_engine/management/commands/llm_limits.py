@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_engine.ai import admission
+
+
+class Command(BaseCommand):
+    help = (
+        "Show or change the LLM rate limits shared by every worker on the "
+        "host (the llm_limits table of AI_LLM_LIMITS_DB, also read by the "
+        "FastAPI prototype)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", help='Model to change, or "*" for models without a row of their own.')
+        parser.add_argument("--rpm", type=float, help="Requests per minute.")
+        parser.add_argument("--tpm", type=float, help="Tokens per minute.")
+
+    def handle(self, *args, **options):
+        store = admission.get_store()
+        if options["model"]:
+            if options["rpm"] is None and options["tpm"] is None:
+                raise CommandError("--model needs --rpm and/or --tpm")
+            rpm, tpm = store.limits(options["model"])
+            store.set_limits(
+                options["model"],
+                rpm if options["rpm"] is None else options["rpm"],
+                tpm if options["tpm"] is None else options["tpm"],
+            )
+
+        self.stdout.write(f"{store.path}")
+        for model, (rpm, tpm) in store.all_limits().items():
+            self.stdout.write(f"  {model:20} {rpm:10.0f} rpm {tpm:12.0f} tpm")
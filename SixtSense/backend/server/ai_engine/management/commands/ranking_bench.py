@@ -0,0 +1,119 @@
+import json
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from ai_engine.ai.car_scoring import get_original_price, score_deal, score_row
+from ai_engine.ai.deal_row import deal_rows
+from sixtbridge.sixt_api import get_vehicles
+
+GROUPS = ("SEDAN", "SUV", "COUPE", "MINIVAN", "PREMIUM SEDAN", "CONVERTIBLE")
+
+
+def _deal(rng: random.Random, i: int) -> dict:
+    """A deal shaped like SIXT's /vehicles payload (images, attributes, ...)."""
+    price = round(rng.uniform(150, 900), 2)
+    return {
+        "vehicle": {
+            "id": f"bench-{i}",
+            "brand": rng.choice(("BMW", "VW", "MERCEDES", "SKODA", "AUDI")),
+            "model": f"Model {i}",
+            "acrissCode": "CDAR",
+            "images": [f"https://img.example/{i}/{n}.png" for n in range(3)],
+            "bagsCount": rng.randint(1, 6),
+            "passengersCount": rng.choice((2, 4, 5, 5, 7, 9)),
+            "groupType": rng.choice(GROUPS),
+            "tyreType": "ALL_SEASON",
+            "transmissionType": rng.choice(("Automatic", "Manual")),
+            "fuelType": rng.choice(("Petrol", "Diesel", "Electric")),
+            "isNewCar": rng.random() < 0.3,
+            "isRecommended": rng.random() < 0.2,
+            "isMoreLuxury": rng.random() < 0.2,
+            "attributes": [
+                {"key": key, "title": key.title(), "value": str(rng.randint(1, 9)), "attributeType": "DETAIL"}
+                for key in ("seats", "doors", "bags", "ac")
+            ],
+            "upsellReasons": [{"title": "More space", "description": "Room for everyone"}],
+        },
+        "pricing": {
+            "discountPercentage": 0,
+            "displayPrice": {"currency": "EUR", "amount": round(price / 5, 2), "prefix": "+", "suffix": "/day"},
+            "totalPrice": {"currency": "EUR", "amount": price, "suffix": "total"},
+        },
+        "dealInfo": "BOOKED_CATEGORY" if i == 0 else None,
+        "tags": [],
+    }
+
+
+def _profile(rng: random.Random) -> dict:
+    return {
+        "passengers": rng.choice((None, 2, 4, 5, 7)),
+        "luggage": rng.choice((None, "few", "many")),
+        "comfort_priority": rng.choice((None, "low", "high")),
+        "trip_type": rng.choice((None, "family", "business", "party")),
+        "budget_total": rng.choice((None, 400, 800)),
+    }
+
+
+def _allocated(build):
+    """(result, bytes allocated by build())."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the nested deal dicts with DealRow for car scoring: memory "
+        "per deal and scoring throughput over random profiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--deals", type=int, default=40, help="Size of the synthetic catalog.")
+        parser.add_argument("--booking", help="Use this booking's deals from SIXT instead.")
+        parser.add_argument("--profiles", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def payload(self, rng, options) -> str:
+        if options["booking"]:
+            return json.dumps(get_vehicles(options["booking"]))
+        return json.dumps({"deals": [_deal(rng, i) for i in range(options["deals"])]})
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        raw = self.payload(rng, options)
+
+        # Memory: the upstream dicts as parsed, and what the rows add on top
+        deals, dict_bytes = _allocated(lambda: json.loads(raw)["deals"])
+        rows, row_bytes = _allocated(lambda: deal_rows(deals))
+        n = len(deals)
+        if not n:
+            self.stderr.write("No deals to score.")
+            return
+        self.stdout.write(f"deals: {n}")
+        self.stdout.write(f"memory  dict    : {dict_bytes / n:8.0f} B/deal (upstream payload)")
+        self.stdout.write(f"memory  DealRow : {row_bytes / n:8.0f} B/deal (on top of the payload)")
+
+        profiles = [_profile(rng) for _ in range(options["profiles"])]
+        original_price = get_original_price(deals)
+        calls = len(profiles) * n
+
+        started = time.perf_counter()
+        by_dict = [[score_deal(d, p, original_price) for d in deals] for p in profiles]
+        dict_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        by_row = [[score_row(r, p, original_price) for r in rows] for p in profiles]
+        row_seconds = time.perf_counter() - started
+
+        if by_dict != by_row:
+            self.stderr.write(self.style.ERROR("score_row and score_deal disagree"))
+        self.stdout.write(f"scoring dict    : {calls / dict_seconds:10.0f} deals/s (score_deal, flattens every call)")
+        self.stdout.write(f"scoring DealRow : {calls / row_seconds:10.0f} deals/s (score_row, rows built once)")
+        self.stdout.write(f"speed-up {dict_seconds / row_seconds:.2f}x over {calls} scorings")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai_engine.models import BackgroundTask
+from ai_engine.tasks import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Replay pending background tasks left in the outbox (e.g. after a restart)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wait",
+            type=float,
+            default=30.0,
+            help="Seconds to wait for the replayed tasks to finish.",
+        )
+
+    def handle(self, *args, **options):
+        submitted = drain_outbox()
+        self.stdout.write(f"Submitted {submitted} pending task(s).")
+
+        deadline = time.monotonic() + options["wait"]
+        while time.monotonic() < deadline:
+            if not BackgroundTask.objects.filter(
+                status__in=[BackgroundTask.STATUS_PENDING, BackgroundTask.STATUS_RUNNING]
+            ).exists():
+                break
+            time.sleep(0.5)
+
+        for status, _ in BackgroundTask.STATUS_CHOICES:
+            count = BackgroundTask.objects.filter(status=status).count()
+            self.stdout.write(f"{status}: {count}")
@@ -0,0 +1,96 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_engine.ai import learned_ranker
+from ai_engine.models import BookingContext, ChatMessage
+from sixtbridge.sixt_api import get_booking
+
+
+def _chosen_vehicle(booking: dict):
+    selected = (booking or {}).get("selectedVehicle") or {}
+    return (selected.get("vehicle") or {}).get("id")
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the learned car re-ranker on logged chat turns (message metadata "
+        "\"ranking\") labelled with the vehicle each booking ended up with, "
+        "compare it with the rule ranking on held-out sessions and save it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=learned_ranker.MODEL_PATH)
+        parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of sessions held out.")
+        parser.add_argument("--all-turns", action="store_true",
+                            help="One example per turn instead of the last turn of each session.")
+        parser.add_argument("--offline", action="store_true",
+                            help="Only use the stored booking payloads, never call SIXT.")
+        parser.add_argument("--epochs", type=int, default=300)
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--dry-run", action="store_true", help="Report the metrics, do not save.")
+
+    def chosen_vehicle(self, booking: BookingContext, options):
+        if not options["offline"]:
+            try:
+                return _chosen_vehicle(get_booking(booking.booking_id))
+            except Exception as e:
+                self.stderr.write(f"{booking.booking_id}: {e}; using the stored payload")
+        return _chosen_vehicle(booking.data)
+
+    def sessions(self, options):
+        """{session id: [examples]} of the sessions whose booking has a chosen car."""
+        turns = (
+            ChatMessage.objects
+            .filter(role=ChatMessage.ROLE_ASSISTANT, metadata__has_key="ranking")
+            .select_related("chat_session__booking")
+            .order_by("created_at")
+        )
+        chosen_by_booking = {}
+        sessions = {}
+        for message in turns.iterator():
+            ranking = message.metadata.get("ranking")
+            if not ranking or len(ranking.get("candidates", [])) < 2:
+                continue
+            booking = message.chat_session.booking
+            if booking.pk not in chosen_by_booking:
+                chosen_by_booking[booking.pk] = self.chosen_vehicle(booking, options)
+            ids = [row["id"] for row in ranking["candidates"]]
+            chosen = chosen_by_booking[booking.pk]
+            if chosen not in ids:
+                continue
+            example = (ranking["candidates"], ranking["profile"], ranking["original_price"], ids.index(chosen))
+            examples = sessions.setdefault(message.chat_session_id, [])
+            if options["all_turns"]:
+                examples.append(example)
+            else:
+                examples[:] = [example]
+        return sessions
+
+    def handle(self, *args, **options):
+        sessions = self.sessions(options)
+        if len(sessions) < 2:
+            raise CommandError(f"Not enough labelled sessions to train on ({len(sessions)}).")
+
+        # Split by session: turns of one conversation never end up on both sides
+        keys = sorted(sessions, key=str)
+        random.Random(options["seed"]).shuffle(keys)
+        cut = max(1, int(len(keys) * options["holdout"]))
+        test = [e for key in keys[:cut] for e in sessions[key]]
+        train = [e for key in keys[cut:] for e in sessions[key]]
+        self.stdout.write(f"sessions: {len(keys)}  train examples: {len(train)}  held out: {len(test)}")
+
+        ranker = learned_ranker.train(train, epochs=options["epochs"])
+        rules = learned_ranker.evaluate(learned_ranker.rule_order, test)
+        learned = learned_ranker.evaluate(learned_ranker.model_order(ranker), test)
+        ranker.metrics = {"holdout": learned, "rules": rules}
+
+        self.stdout.write(f"rules   : top1 {rules['top1']:.3f}  mrr {rules['mrr']:.3f}")
+        self.stdout.write(f"learned : top1 {learned['top1']:.3f}  mrr {learned['mrr']:.3f}")
+        for name, weight in sorted(zip(learned_ranker.FEATURES, ranker.weights), key=lambda x: -abs(x[1])):
+            self.stdout.write(f"  {name:<16} {weight:+.3f}")
+
+        if options["dry_run"]:
+            return
+        ranker.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(f"ranker {ranker.version} saved to {options['output']}"))
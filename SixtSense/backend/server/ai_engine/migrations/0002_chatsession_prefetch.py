@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='prefetch',
+            field=models.JSONField(blank=True, default=dict, help_text='Background catalog prefetch and initial rule-based shortlist.'),
+        ),
+    ]
@@ -69,6 +69,28 @@ class ChatSession(models.Model):
         help_text="Evolving conversation state: preferences, dislikes, etc."
     )
 
+    # Filled in the background right after start-chat (see ai_engine.prefetch):
+    # {
+    #   "status": "pending" | "ready" | "failed",
+    #   "catalog": "9f2c1e0a7b3d4c5e",   (ai_engine.catalog.catalog_fingerprint)
+    #   "original_price": 312.5,
+    #   "shortlist": ["vehicle-id-1", "vehicle-id-2", "vehicle-id-3"],
+    #   "finished_at": "2025-11-23T10:00:00+00:00"
+    # }
+    prefetch = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Background catalog prefetch and initial rule-based shortlist."
+    )
+
+    # Latest cars / protections / addons when they were computed after the
+    # response (text-only turns, see ai_engine.tasks)
+    recommendations = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Latest recommendations computed in the background."
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -118,3 +140,50 @@ class ChatMessage(models.Model):
 
     def __str__(self):
         return f"[{self.role}] {self.content[:40]}..."
+
+
+class BackgroundTask(models.Model):
+    """
+    Outbox row for a deferred job (see ai_engine.tasks).
+    Written before the job is handed to the thread pool, so work that was
+    pending when a worker died can be replayed with `manage.py run_outbox`.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=100, help_text="Registered task name.")
+
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Keyword arguments for the task function."
+    )
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+    )
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"BackgroundTask({self.name}, {self.status})"
@@ -0,0 +1,171 @@
+# ai_engine/opening.py
+"""
+Pre-generated opening pitch.
+
+The greeting + first upgrade pitch only depends on the booked category and
+the catalog, so we generate it with SalesAgent in the background (at
+booking-link creation or start-chat) and cache it by
+(bookedCategory, catalog fingerprint). Identical bookings reuse the same
+opening, and the first visible message is ready before the user types.
+
+Start-chat never waits for SIXT or the LLM here: it only attaches an
+opening the cache already knows for this booking (remembered for as long
+as the catalog counts as fresh) and leaves the lookup and generation to
+the background pool. Concurrent generations of the same opening are
+coalesced, across processes too when SIXT_SINGLEFLIGHT_LOCK_DIR is set.
+
+A stand-in reply (the busy message, or the fallback after an unparseable
+answer) is neither cached nor attached: the agent greets in its first
+normal reply instead.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+
+from sixtbridge.resilience import FRESH_TTL, SINGLEFLIGHT_LOCK_DIR
+from sixtbridge.singleflight import SingleFlight
+from sixtbridge.sixt_api import get_booking, get_vehicles
+
+from . import background
+from .ai.agent import SalesAgent, is_stand_in
+from .ai.car_scoring import hybrid_rank_deals, get_original_price
+from .catalog import catalog_fingerprint
+from .models import ChatMessage, ChatSession
+
+OPENING_TTL = int(os.getenv("AI_OPENING_TTL", str(6 * 3600)))
+
+# What the agent "hears" instead of a user message
+OPENING_TRIGGER = "(The customer just opened the chat and has not written anything yet.)"
+
+_flight = SingleFlight("opening.singleflight", lock_dir=SINGLEFLIGHT_LOCK_DIR)
+
+
+def _opening_context(booking_data: Dict[str, Any], deals) -> Dict[str, Any]:
+    """
+    Booking info given to the agent. Only the fields shared by all bookings
+    with the same category and catalog, so the result is safe to reuse.
+    """
+    original_price = get_original_price(deals)
+    top = hybrid_rank_deals(deals, {}, original_price, k=3, use_llm=False)
+    return {
+        "bookedCategory": booking_data.get("bookedCategory"),
+        "upgrade_options": [
+            {
+                "vehicle": f"{d['vehicle']['brand']} {d['vehicle']['model']}",
+                "groupType": d["vehicle"].get("groupType"),
+                "extra_total": round(d["pricing"]["totalPrice"]["amount"] - original_price, 2),
+                "currency": d["pricing"]["totalPrice"].get("currency"),
+            }
+            for d in top
+        ],
+    }
+
+
+def opening_cache_key(booking_data: Dict[str, Any], deals) -> str:
+    return f"opening:{booking_data.get('bookedCategory')}:{catalog_fingerprint(deals)}"
+
+
+def _booking_key(booking_id: str) -> str:
+    return f"opening:booking:{booking_id}"
+
+
+def get_cached_opening(booking_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The opening last used for this booking, from the cache only (no SIXT
+    call). The pointer expires with the catalog's fresh TTL, so a changed
+    catalog is picked up by the background lookup instead.
+    """
+    key = cache.get(_booking_key(booking_id))
+    return cache.get(key) if key else None
+
+
+def get_or_generate_opening(booking_id: str) -> Optional[Dict[str, Any]]:
+    """The opening for this booking; None when the agent gave no real answer."""
+    booking_data = get_booking(booking_id)
+    deals = get_vehicles(booking_id).get("deals", [])
+    key = opening_cache_key(booking_data, deals)
+
+    def generate():
+        # Leaders queued on the cross-process lock find the first one's opening
+        opening = cache.get(key)
+        if opening is None:
+            result = SalesAgent().run(
+                booking=_opening_context(booking_data, deals),
+                profile={},
+                state={},
+                message=OPENING_TRIGGER,
+                history="",
+            )
+            if is_stand_in(result["assistant_message"]):
+                return None
+            opening = {"assistant_message": result["assistant_message"], "cache_key": key}
+            cache.set(key, opening, timeout=OPENING_TTL)
+        return opening
+
+    opening = cache.get(key)
+    if opening is None:
+        opening = _flight.do(key, generate, metric="opening")
+    if opening is not None:
+        cache.set(_booking_key(booking_id), key, timeout=FRESH_TTL["vehicles"])
+    return opening
+
+
+def attach_opening(chat_session: ChatSession, opening: Dict[str, Any]) -> Optional[ChatMessage]:
+    """
+    Store the opening as the session's first message. Skipped if the user
+    already wrote something (the agent then greets in its normal reply) or
+    the opening is a stand-in reply.
+
+    Check and insert run in one transaction with the session row locked, so
+    the user's first message cannot land in between: on PostgreSQL its
+    foreign-key check waits for the FOR UPDATE lock, on SQLite the write
+    lock serializes the two and the loser of a race gets OperationalError.
+    """
+    if opening is None or is_stand_in(opening["assistant_message"]):
+        return None
+    try:
+        with transaction.atomic():
+            list(ChatSession.objects.select_for_update().filter(id=chat_session.id).values_list("id"))
+            if ChatMessage.objects.filter(chat_session_id=chat_session.id).exists():
+                return None
+            message = ChatMessage.objects.create(
+                chat_session_id=chat_session.id,
+                role=ChatMessage.ROLE_ASSISTANT,
+                content=opening["assistant_message"],
+                metadata={"opening": True, "cache_key": opening["cache_key"]},
+            )
+            # The opening comes before anything the user writes, even one
+            # whose created_at was taken while it waited for the lock
+            message.created_at = chat_session.created_at
+            ChatMessage.objects.filter(pk=message.pk).update(created_at=message.created_at)
+            return message
+    except OperationalError as e:
+        print(f"[ai_engine] opening not attached to {chat_session.id}: {e}")
+        return None
+
+
+def prepare_opening(session_id: str):
+    chat_session = ChatSession.objects.select_related("booking").get(id=session_id)
+    opening = get_or_generate_opening(chat_session.booking.booking_id)
+    attach_opening(chat_session, opening)
+
+
+def warm_opening(booking_id: str):
+    """Generate (and cache) the opening in the background, no session yet."""
+    background.submit(get_or_generate_opening, booking_id)
+
+
+def start_opening(chat_session: ChatSession) -> Optional[ChatMessage]:
+    """
+    Attach the opening right away when the cache already has it for this
+    booking, otherwise look it up / generate it in the background. Returns
+    the message if it was attached synchronously.
+    """
+    opening = get_cached_opening(chat_session.booking.booking_id)
+    if opening is not None:
+        return attach_opening(chat_session, opening)
+
+    background.submit(prepare_opening, str(chat_session.id))
+    return None
@@ -0,0 +1,186 @@
+# ai_engine/prefetch.py
+"""
+Speculative prefetch started by StartChatAPIView.
+
+While the user is still reading the greeting we fetch vehicles, protections
+and addons (which warms the sixtbridge cache) and rank the deals against the
+empty profile. The result is stored in ChatSession.prefetch so the first
+ChatAPIView turn can start from warm data and an already-ranked shortlist.
+
+Completion is observable in two ways:
+- ChatSession.prefetch["status"] goes from "pending" to "ready"/"failed"
+- in the process that started it, wait_for_prefetch() blocks on an Event
+  (await_prefetch() polls it from async views)
+
+A "pending" status whose worker died never finishes. Without an Event in
+this process, a pending prefetch older than AI_PREFETCH_MAX_AGE seconds,
+or one still pending after a full wait, is marked failed, so at most one
+turn waits for it.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+from sixtbridge.sixt_api import get_vehicles, get_protections, get_addons
+
+from . import background
+from .ai.car_scoring import hybrid_rank_deals, get_original_price
+from .catalog import catalog_fingerprint
+from .models import ChatSession
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+SHORTLIST_SIZE = 3
+
+PREFETCH_MAX_AGE = float(os.getenv("AI_PREFETCH_MAX_AGE", "30"))
+
+_events: Dict[str, threading.Event] = {}
+_events_lock = threading.Lock()
+
+
+def run_prefetch(session_id: str, booking_id: str) -> dict:
+    prefetch = {"status": STATUS_FAILED}
+    try:
+        deals = get_vehicles(booking_id).get("deals", [])
+        get_protections(booking_id)
+        get_addons(booking_id)
+
+        original_price = get_original_price(deals)
+        shortlist = hybrid_rank_deals(
+            deals=deals,
+            profile={},
+            original_total_price=original_price,
+            k=SHORTLIST_SIZE,
+            use_llm=False,
+        )
+        prefetch = {
+            "status": STATUS_READY,
+            "catalog": catalog_fingerprint(deals),
+            "original_price": original_price,
+            "shortlist": [d["vehicle"]["id"] for d in shortlist],
+        }
+    except Exception as e:
+        print(f"[ai_engine] prefetch for booking {booking_id} failed: {e}")
+        prefetch["error"] = str(e)
+    finally:
+        prefetch["finished_at"] = _now()
+        ChatSession.objects.filter(id=session_id).update(prefetch=prefetch)
+        with _events_lock:
+            event = _events.pop(str(session_id), None)
+        if event:
+            event.set()
+    return prefetch
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _expired(prefetch: dict) -> bool:
+    started_at = prefetch.get("started_at")
+    if not started_at:
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(started_at)
+    return age.total_seconds() > PREFETCH_MAX_AGE
+
+
+def _abandoned(reason: str) -> dict:
+    return {"status": STATUS_FAILED, "error": reason, "finished_at": _now()}
+
+
+def _give_up(chat_session: ChatSession, reason: str) -> dict:
+    """Mark a pending prefetch nobody finishes as failed (unless it finished meanwhile)."""
+    prefetch = _abandoned(reason)
+    if ChatSession.objects.filter(id=chat_session.id, prefetch__status=STATUS_PENDING).update(prefetch=prefetch):
+        chat_session.prefetch = prefetch
+        return prefetch
+    chat_session.refresh_from_db(fields=["prefetch"])
+    return chat_session.prefetch
+
+
+async def _agive_up(chat_session: ChatSession, reason: str) -> dict:
+    prefetch = _abandoned(reason)
+    if await ChatSession.objects.filter(id=chat_session.id, prefetch__status=STATUS_PENDING).aupdate(prefetch=prefetch):
+        chat_session.prefetch = prefetch
+        return prefetch
+    await chat_session.arefresh_from_db(fields=["prefetch"])
+    return chat_session.prefetch
+
+
+def start_prefetch(chat_session: ChatSession):
+    """
+    Mark the session as pending and run the prefetch in the background.
+    """
+    session_id = str(chat_session.id)
+    chat_session.prefetch = {"status": STATUS_PENDING, "started_at": _now()}
+    ChatSession.objects.filter(id=session_id).update(prefetch=chat_session.prefetch)
+
+    with _events_lock:
+        _events[session_id] = threading.Event()
+    background.submit(run_prefetch, session_id, chat_session.booking.booking_id)
+
+
+def wait_for_prefetch(chat_session: ChatSession, timeout: float = 3.0) -> dict:
+    """
+    Return the session's prefetch, waiting up to `timeout` seconds if it is
+    still running. Falls back to polling the DB when it was started by
+    another worker process.
+    """
+    if (chat_session.prefetch or {}).get("status") != STATUS_PENDING:
+        return chat_session.prefetch or {}
+
+    with _events_lock:
+        event = _events.get(str(chat_session.id))
+
+    if event is not None:
+        event.wait(timeout)
+    else:
+        if _expired(chat_session.prefetch):
+            return _give_up(chat_session, "expired")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            chat_session.refresh_from_db(fields=["prefetch"])
+            if chat_session.prefetch.get("status") != STATUS_PENDING:
+                return chat_session.prefetch
+            time.sleep(0.1)
+        return _give_up(chat_session, "timed out")
+
+    chat_session.refresh_from_db(fields=["prefetch"])
+    return chat_session.prefetch
+
+
+async def await_prefetch(chat_session: ChatSession, timeout: float = 3.0) -> dict:
+    """
+    Async version of wait_for_prefetch(): polls the Event (or the DB) with
+    asyncio.sleep instead of blocking the event loop.
+    """
+    if (chat_session.prefetch or {}).get("status") != STATUS_PENDING:
+        return chat_session.prefetch or {}
+
+    with _events_lock:
+        event = _events.get(str(chat_session.id))
+
+    if event is None and _expired(chat_session.prefetch):
+        return await _agive_up(chat_session, "expired")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if event is not None:
+            if event.is_set():
+                break
+            await asyncio.sleep(0.02)
+        else:
+            await chat_session.arefresh_from_db(fields=["prefetch"])
+            if chat_session.prefetch.get("status") != STATUS_PENDING:
+                return chat_session.prefetch
+            await asyncio.sleep(0.1)
+    else:
+        if event is None:
+            return await _agive_up(chat_session, "timed out")
+
+    await chat_session.arefresh_from_db(fields=["prefetch"])
+    return chat_session.prefetch
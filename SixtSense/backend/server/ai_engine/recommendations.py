@@ -0,0 +1,339 @@
+# ai_engine/recommendations.py
+"""
+Turns the evolving chat state into concrete cars / protections / addons.
+
+Used inline by ChatAPIView and, for text-only turns, by the
+compute_session_recommendations background task. The async chat view uses
+abuild(), which fetches the three catalogs concurrently.
+
+When the turn's "extras" stage is degraded (see degradation.py) only the
+cars are computed; protections, addons and bundles come back empty.
+
+"bundles" are the best protection + addon combinations for what
+budget_total leaves after the top car (ai.bundles); none without a
+budget_total.
+
+The result also carries "ranking": the profile and the candidate cars of
+the re-rank. The views keep it in the message metadata (not in the
+response); manage.py train_ranker learns from it.
+
+For "something like the BMW but automatic" turns the views look the cars
+up first (find_comparison(), ai.similarity) so the agent can talk about
+them; the recommender then shows those cars instead of the ranking.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from sixtbridge.sixt_api import (
+    get_vehicles_with_meta,
+    get_protections_with_meta,
+    get_addons_with_meta,
+    aget_vehicles_with_meta,
+    aget_protections_with_meta,
+    aget_addons_with_meta,
+)
+from sixtbridge.resilience import unavailable_meta
+
+from .ai.car_scoring import (
+    hybrid_rank_deals,
+    ahybrid_rank_deals,
+    get_original_price,
+    rerank_candidates,
+    candidate_row,
+)
+from .ai.protection_engine import recommend_protections, recommend_addons
+from .ai.bundles import best_bundles
+from .ai.ranking_session import RankingSession
+from .ai import similarity
+from .deadline import Deadline
+from .prefetch import STATUS_READY
+
+
+def find_comparison(booking_id: str, message: str,
+                    ranking: Optional[RankingSession] = None) -> Optional[similarity.Comparison]:
+    """The similarity lookup of a "like X but ..." message; None for any other message."""
+    request = similarity.parse(message)
+    if request is None:
+        return None
+    try:
+        deals = get_vehicles_with_meta(booking_id)[0].get("deals", [])
+    except Exception as e:
+        print("Error fetching vehicles:", e)
+        return None
+    return similarity.compare(deals, request, ranking.shown if ranking is not None else ())
+
+
+async def afind_comparison(booking_id: str, message: str,
+                           ranking: Optional[RankingSession] = None) -> Optional[similarity.Comparison]:
+    request = similarity.parse(message)
+    if request is None:
+        return None
+    try:
+        deals = (await aget_vehicles_with_meta(booking_id))[0].get("deals", [])
+    except Exception as e:
+        print("Error fetching vehicles:", e)
+        return None
+    return similarity.compare(deals, request, ranking.shown if ranking is not None else ())
+
+
+class ChatRecommender:
+    def __init__(self, booking_id: str, prefetch: Dict[str, Any] = None, deadline: Optional[Deadline] = None,
+                 ranking: Optional[RankingSession] = None, comparison: Optional[similarity.Comparison] = None):
+        self.booking_id = booking_id
+        self.prefetch = prefetch or {}
+        # Turn budget of the interactive views; None for background work
+        self.deadline = deadline
+        # The chat's ranking from the previous turns (ai.ranking_session)
+        self.ranking = ranking
+        # This turn's "like X but ..." lookup (find_comparison)
+        self.comparison = comparison
+        # Freshness of every SIXT payload used, returned to the client
+        self.upstream: Dict[str, Any] = {}
+
+    def build(self, state: Dict[str, Any], needs: Dict[str, Any]) -> Dict[str, Any]:
+        deals = self.fetch_deals()
+        if self.skip_extras():
+            protections_raw, addons_raw = {"protectionPackages": []}, {"addons": []}
+        else:
+            protections_raw = self.fetch_protections()
+            addons_raw = self.fetch_addons()
+
+        original_price = self.get_original_price(deals)
+
+        if self.ranking is not None:
+            self.ranking.update(deals, state, original_price)
+
+        similar = self.comparison_deals(deals)
+        if similar:
+            top_deals = similar
+        elif self.use_shortlist(state):
+            top_deals = self.shortlist_deals(deals, self.prefetch["shortlist"])
+        elif self.ranking is not None:
+            top_deals = self.ranking.rank(k=3, use_llm=True, deadline=self.deadline)
+        else:
+            top_deals = hybrid_rank_deals(
+                deals=deals,
+                profile=state,
+                original_total_price=original_price,
+                k=3,
+                use_llm=True,
+                deadline=self.deadline,
+            )
+
+        result = self.assemble(top_deals, original_price, protections_raw, addons_raw, state, needs)
+        result["ranking"] = self.ranking_log(deals, state, original_price)
+        return result
+
+    async def abuild(self, state: Dict[str, Any], needs: Dict[str, Any]) -> Dict[str, Any]:
+        if self.skip_extras():
+            deals = await self.afetch_deals()
+            protections_raw, addons_raw = {"protectionPackages": []}, {"addons": []}
+        else:
+            deals, protections_raw, addons_raw = await asyncio.gather(
+                self.afetch_deals(),
+                self.afetch_protections(),
+                self.afetch_addons(),
+            )
+
+        original_price = self.get_original_price(deals)
+
+        if self.ranking is not None:
+            self.ranking.update(deals, state, original_price)
+
+        similar = self.comparison_deals(deals)
+        if similar:
+            top_deals = similar
+        elif self.use_shortlist(state):
+            top_deals = self.shortlist_deals(deals, self.prefetch["shortlist"])
+        elif self.ranking is not None:
+            top_deals = await self.ranking.arank(k=3, use_llm=True, deadline=self.deadline)
+        else:
+            top_deals = await ahybrid_rank_deals(
+                deals=deals,
+                profile=state,
+                original_total_price=original_price,
+                k=3,
+                use_llm=True,
+                deadline=self.deadline,
+            )
+
+        result = self.assemble(top_deals, original_price, protections_raw, addons_raw, state, needs)
+        result["ranking"] = self.ranking_log(deals, state, original_price)
+        return result
+
+    def skip_extras(self) -> bool:
+        return self.deadline is not None and self.deadline.is_degraded("extras")
+
+    def comparison_deals(self, deals) -> List[Dict[str, Any]]:
+        # The cars the similarity lookup found, as this turn's deal objects
+        if self.comparison is None:
+            return []
+        top = self.shortlist_deals(deals, self.comparison.vehicle_ids)
+        if not top:
+            return []
+        if self.deadline is not None:
+            self.deadline.record("rerank", "similarity")
+        if self.ranking is not None:
+            self.ranking.show(top)
+        return top
+
+    def use_shortlist(self, state: Dict[str, Any]) -> bool:
+        # Nothing learned about the customer yet: reuse the shortlist
+        # ranked for the empty profile during prefetch
+        if state or self.prefetch.get("status") != STATUS_READY:
+            return False
+        if self.deadline is not None:
+            self.deadline.record("rerank", "prefetch_shortlist")
+        return True
+
+    def assemble(self, top_deals, original_price, protections_raw, addons_raw, state, needs) -> Dict[str, Any]:
+        cars = [self.compact_car(d, original_price) for d in top_deals]
+
+        protections = recommend_protections(
+            protections_raw.get("protectionPackages", []),
+            state,
+            needs.get("protections", []),
+        )
+
+        addons = recommend_addons(
+            addons_raw.get("addons", []),
+            state,
+            needs.get("addons", []),
+        )
+
+        bundles = best_bundles(
+            protections_raw.get("protectionPackages", []),
+            addons_raw.get("addons", []),
+            state,
+            needs,
+            budget=self.extras_budget(state, top_deals, original_price),
+        )
+
+        return {
+            "cars": cars,
+            "protections": protections,
+            "addons": addons,
+            "bundles": bundles,
+            "upstream": self.upstream,
+        }
+
+    def extras_budget(self, state, top_deals, original_price) -> Optional[float]:
+        # What budget_total leaves for protection + addons after the best car
+        budget = state.get("budget_total")
+        if not budget:
+            return None
+        car_price = top_deals[0]["pricing"]["totalPrice"]["amount"] if top_deals else original_price
+        return max(budget - car_price, 0.0)
+
+    # ---------------------------------------------------------------------
+    # Fetch helpers (each one records the freshness of what it got)
+    # ---------------------------------------------------------------------
+
+    def fetch_deals(self) -> List[Dict[str, Any]]:
+        try:
+            response, self.upstream["vehicles"] = get_vehicles_with_meta(self.booking_id)
+            return response.get("deals", [])
+        except Exception as e:
+            print("Error fetching vehicles:", e)
+            self.upstream["vehicles"] = unavailable_meta("vehicles", e)
+            return []
+
+    def fetch_protections(self) -> Dict[str, Any]:
+        try:
+            response, self.upstream["protections"] = get_protections_with_meta(self.booking_id)
+            return response
+        except Exception as e:
+            print("Error fetching protections:", e)
+            self.upstream["protections"] = unavailable_meta("protections", e)
+            return {"protectionPackages": []}
+
+    def fetch_addons(self) -> Dict[str, Any]:
+        try:
+            response, self.upstream["addons"] = get_addons_with_meta(self.booking_id)
+            return response
+        except Exception as e:
+            print("Error fetching addons:", e)
+            self.upstream["addons"] = unavailable_meta("addons", e)
+            return {"addons": []}
+
+    async def afetch_deals(self) -> List[Dict[str, Any]]:
+        try:
+            response, self.upstream["vehicles"] = await aget_vehicles_with_meta(self.booking_id)
+            return response.get("deals", [])
+        except Exception as e:
+            print("Error fetching vehicles:", e)
+            self.upstream["vehicles"] = unavailable_meta("vehicles", e)
+            return []
+
+    async def afetch_protections(self) -> Dict[str, Any]:
+        try:
+            response, self.upstream["protections"] = await aget_protections_with_meta(self.booking_id)
+            return response
+        except Exception as e:
+            print("Error fetching protections:", e)
+            self.upstream["protections"] = unavailable_meta("protections", e)
+            return {"protectionPackages": []}
+
+    async def afetch_addons(self) -> Dict[str, Any]:
+        try:
+            response, self.upstream["addons"] = await aget_addons_with_meta(self.booking_id)
+            return response
+        except Exception as e:
+            print("Error fetching addons:", e)
+            self.upstream["addons"] = unavailable_meta("addons", e)
+            return {"addons": []}
+
+    def ranking_log(self, deals, state, original_price) -> Optional[Dict[str, Any]]:
+        if not deals:
+            return None
+        if self.ranking is not None:
+            candidates = self.ranking.candidates()
+        else:
+            candidates = rerank_candidates(deals, state, original_price)
+        return {
+            "profile": dict(state),
+            "original_price": original_price,
+            "candidates": [candidate_row(d) for d in candidates],
+        }
+
+    # --- Pricing helpers ---
+
+    def get_original_price(self, deals):
+        return get_original_price(deals)
+
+    def shortlist_deals(self, deals, vehicle_ids):
+        by_id = {d["vehicle"]["id"]: d for d in deals}
+        return [by_id[vid] for vid in vehicle_ids if vid in by_id]
+
+    # --- Format compact car card ---
+
+    def compact_car(self, deal, original_price):
+        v = deal["vehicle"]
+        p = deal["pricing"]
+
+        tags = []
+        if v.get("isRecommended"):
+            tags.append("Recommended")
+        if v.get("isNewCar"):
+            tags.append("New")
+        if v.get("isMoreLuxury"):
+            tags.append("Luxury")
+        if p.get("discountPercentage", 0) > 0:
+            tags.append(f"{p['discountPercentage']}% off")
+
+        return {
+            "id": v["id"],
+            "name": f"{v['brand']} {v['model']}",
+            "brand": v["brand"],
+            "model": v["model"],
+            "image": v["images"][0] if v.get("images") else None,
+            "groupType": v["groupType"],
+            "passengers": v["passengersCount"],
+            "bags": v["bagsCount"],
+            "transmission": v["transmissionType"],
+            "fuelType": v["fuelType"],
+            "daily_price": p["displayPrice"]["amount"],
+            "total_price": p["totalPrice"]["amount"],
+            "currency": p["displayPrice"]["currency"],
+            "tags": tags,
+        }
@@ -1,5 +1,9 @@
+import os
+
 from rest_framework import serializers
 
+WHATIF_MAX_PROFILES = int(os.getenv("AI_WHATIF_MAX_PROFILES", "10000"))
+
 
 class StartChatSerializer(serializers.Serializer):
     booking_id = serializers.CharField()
@@ -8,4 +12,24 @@ class StartChatSerializer(serializers.Serializer):
 class ChatMessageSerializer(serializers.Serializer):
     chat_session_id = serializers.UUIDField()
     message = serializers.CharField()
+    # Reply with the assistant text only; cars/protections/addons are computed
+    # in the background and served by the recommendations endpoint
+    text_only = serializers.BooleanField(required=False, default=False)
+
+
+
+class WhatIfSerializer(serializers.Serializer):
+    booking_id = serializers.CharField()
+    # Same keys as the chat state (passengers, luggage, comfort_priority,
+    # trip_type, ...); unknown keys are returned unchanged
+    profiles = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=WHATIF_MAX_PROFILES)
+    k = serializers.IntegerField(required=False, default=3, min_value=1, max_value=20)
+    # Also return the full profiles x vehicles score matrix
+    include_scores = serializers.BooleanField(required=False, default=False)
 
+    def validate_profiles(self, profiles):
+        for i, profile in enumerate(profiles):
+            passengers = profile.get("passengers")
+            if passengers is not None and (type(passengers) is not int or passengers < 0):
+                raise serializers.ValidationError(f"profiles[{i}].passengers must be a non-negative integer.")
+        return profiles
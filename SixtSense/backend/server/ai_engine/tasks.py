@@ -0,0 +1,163 @@
+# ai_engine/tasks.py
+"""
+In-process task runner for non-critical chat work.
+
+    @task("my_task")
+    def my_task(**kwargs): ...
+
+    enqueue("my_task", session_id="...")
+
+enqueue() writes a BackgroundTask outbox row and hands its id to the
+ai_engine.background thread pool once the surrounding transaction commits.
+No external broker: if the process dies, pending rows stay in the DB and
+`manage.py run_outbox` replays them.
+
+Queue depth and task latency (enqueue -> finished) are reported to
+core.metrics and show up at /api/metrics/.
+"""
+import os
+import threading
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import metrics
+
+from sixtbridge.sixt_api import get_vehicles, get_protections, get_addons
+
+from . import background
+from .models import BackgroundTask, ChatMessage, ChatSession
+from .ai.ranking_session import get_session
+from .recommendations import ChatRecommender, find_comparison
+
+MAX_ATTEMPTS = int(os.getenv("AI_TASK_MAX_ATTEMPTS", "3"))
+
+_registry: Dict[str, Callable] = {}
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def task(name: str):
+    def decorator(fn):
+        _registry[name] = fn
+        return fn
+    return decorator
+
+
+def _track(delta: int):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+        metrics.gauge("tasks.queue_depth", _in_flight)
+
+
+def _submit(task_id: int):
+    _track(+1)
+    transaction.on_commit(lambda: background.submit(_execute, task_id))
+
+
+def enqueue(name: str, **payload) -> BackgroundTask:
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+    row = BackgroundTask.objects.create(name=name, payload=payload)
+    metrics.incr(f"tasks.enqueued.{name}")
+    _submit(row.id)
+    return row
+
+
+def _execute(task_id: int):
+    try:
+        # Claim the row; another worker replaying the outbox may have been faster
+        claimed = BackgroundTask.objects.filter(
+            id=task_id, status=BackgroundTask.STATUS_PENDING
+        ).update(
+            status=BackgroundTask.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if not claimed:
+            return
+
+        row = BackgroundTask.objects.get(id=task_id)
+        try:
+            with metrics.timer(f"tasks.run.{row.name}"):
+                _registry[row.name](**row.payload)
+        except Exception as e:
+            retry = row.attempts < MAX_ATTEMPTS
+            BackgroundTask.objects.filter(id=task_id).update(
+                status=BackgroundTask.STATUS_PENDING if retry else BackgroundTask.STATUS_FAILED,
+                error="".join(traceback.format_exception(e))[-4000:],
+                finished_at=None if retry else timezone.now(),
+            )
+            metrics.incr(f"tasks.failed.{row.name}")
+            print(f"[ai_engine] task {row.name} ({task_id}) failed: {e}")
+            if retry:
+                _submit(task_id)
+            return
+
+        finished_at = timezone.now()
+        BackgroundTask.objects.filter(id=task_id).update(
+            status=BackgroundTask.STATUS_DONE, finished_at=finished_at, error=""
+        )
+        metrics.observe(f"tasks.latency.{row.name}", (finished_at - row.created_at).total_seconds())
+    finally:
+        _track(-1)
+
+
+def drain_outbox(stale_after: timedelta = timedelta(minutes=10)) -> int:
+    """
+    Re-submit pending tasks, and running tasks whose worker apparently died.
+    Returns how many were submitted.
+    """
+    BackgroundTask.objects.filter(
+        status=BackgroundTask.STATUS_RUNNING,
+        started_at__lt=timezone.now() - stale_after,
+    ).update(status=BackgroundTask.STATUS_PENDING)
+
+    ids = list(
+        BackgroundTask.objects.filter(status=BackgroundTask.STATUS_PENDING).values_list("id", flat=True)
+    )
+    for task_id in ids:
+        _submit(task_id)
+    return len(ids)
+
+
+# -------------------------------------------------------------------------
+#  Chat tasks
+# -------------------------------------------------------------------------
+
+@task("annotate_chat_message")
+def annotate_chat_message(message_id: int, metadata: dict):
+    # The reply itself is written inline by the chat views, so it keeps its
+    # place in the transcript; only the turn analytics arrive later.
+    message = ChatMessage.objects.get(id=message_id)
+    message.metadata = {**message.metadata, **metadata}
+    message.save(update_fields=["metadata"])
+
+
+@task("compute_session_recommendations")
+def compute_session_recommendations(session_id: str, needs: dict = None, message: str = ""):
+    chat_session = ChatSession.objects.select_related("booking").get(id=session_id)
+    booking_id = chat_session.booking.booking_id
+    ranking = get_session(session_id)
+    recommender = ChatRecommender(
+        booking_id, chat_session.prefetch, ranking=ranking,
+        comparison=find_comparison(booking_id, message, ranking) if message else None,
+    )
+    result = recommender.build(chat_session.state or {}, needs or {})
+    # Training data of the chat turns only (manage.py train_ranker)
+    result.pop("ranking", None)
+    result["computed_at"] = timezone.now().isoformat()
+    ChatSession.objects.filter(id=session_id).update(recommendations=result)
+
+
+@task("warm_booking_catalog")
+def warm_booking_catalog(booking_id: str):
+    get_vehicles(booking_id)
+    get_protections(booking_id)
+    get_addons(booking_id)
@@ -1,8 +1,19 @@
+from django.conf import settings
 from django.urls import path
-from .views import StartChatAPIView, ChatAPIView
+
+if settings.ASYNC_VIEWS:
+    from .async_views import StartChatAPIView, ChatAPIView, ChatRecommendationsAPIView, WhatIfRankingAPIView
+else:
+    from .views import StartChatAPIView, ChatAPIView, ChatRecommendationsAPIView, WhatIfRankingAPIView
 
 
 urlpatterns = [
     path("start/", StartChatAPIView.as_view(), name="assistant-start"),
     path("chat/", ChatAPIView.as_view(), name="assistant-chat"),
+    path(
+        "chat/<uuid:chat_session_id>/recommendations/",
+        ChatRecommendationsAPIView.as_view(),
+        name="assistant-chat-recommendations",
+    ),
+    path("what-if/", WhatIfRankingAPIView.as_view(), name="assistant-what-if"),
 ]
\ No newline at end of file
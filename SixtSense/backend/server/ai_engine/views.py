@@ -1,24 +1,27 @@
 # ai_engine/views.py
 
+import time
+
+from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
 from .models import BookingContext, ChatSession, ChatMessage
-from .serializers import StartChatSerializer, ChatMessageSerializer
+from .serializers import StartChatSerializer, ChatMessageSerializer, WhatIfSerializer
+from .prefetch import start_prefetch, wait_for_prefetch
+from .opening import start_opening
+from .tasks import enqueue
+from .deadline import Deadline
+from .degradation import tracked
 
 # LangChain AI + recommendation engines
 from .ai.agent import SalesAgent
-from .ai.car_scoring import hybrid_rank_deals
-from .ai.protection_engine import recommend_protections, recommend_addons
+from .ai.ranking_session import get_session
+from .recommendations import ChatRecommender, find_comparison
 
 # Real integration with SIXT HackaTUM API
-from sixtbridge.sixt_api import (
-    get_booking,
-    get_vehicles,
-    get_protections,
-    get_addons,
-)
+from sixtbridge.sixt_api import get_booking, get_vehicles
 
 
 # -------------------------------------------------------------------------
@@ -61,9 +64,24 @@ class StartChatAPIView(APIView):
             user=None,  # no auth for now
         )
 
+        # --- Warm up catalogs + initial shortlist for the first turn ---
+        start_prefetch(chat_session)
+
+        # --- Opening pitch: attached now if cached, else generated in background ---
+        opening = start_opening(chat_session)
+
         return Response({
             "chat_session_id": str(chat_session.id),
-            "booking": booking_context.data
+            "booking": booking_context.data,
+            "prefetch": chat_session.prefetch["status"],
+            "opening": "ready" if opening else "pending",
+            "messages": [
+                {
+                    "role": opening.role,
+                    "content": opening.content,
+                    "created_at": opening.created_at.isoformat(),
+                }
+            ] if opening else [],
         })
         
 
@@ -74,7 +92,10 @@ class ChatAPIView(APIView):
     permission_classes = [AllowAny]
     authentication_classes = []
 
+    @tracked
     def post(self, request):
+        started = time.perf_counter()
+        deadline = Deadline.for_turn(started)
         serializer = ChatMessageSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -83,6 +104,10 @@ class ChatAPIView(APIView):
         )
         user_message = serializer.validated_data["message"]
 
+        # Started by StartChatAPIView; usually done by now, otherwise wait for
+        # it instead of fetching/ranking the same catalog a second time
+        prefetch = wait_for_prefetch(chat_session)
+
         # 1) Save user message
         ChatMessage.objects.create(
             chat_session=chat_session,
@@ -98,7 +123,8 @@ class ChatAPIView(APIView):
         # Include both user and assistant messages, but keep it short
         # ---- NEW: build conversation history (last few turns) ----
         # Get last 8 messages by created_at DESC, then reverse into chronological order
-        history_qs = chat_session.messages.order_by("-created_at")[:8]
+        # (fewer while the "history" stage is degraded)
+        history_qs = chat_session.messages.order_by("-created_at")[:deadline.history_size(8)]
         history_msgs = list(history_qs)[::-1]
 
         history_lines = []
@@ -109,60 +135,64 @@ class ChatAPIView(APIView):
         history_text = "\n".join(history_lines)
         # ----------------------------------------------------------
 
+        booking_id = chat_session.booking.booking_id
+        session_id = str(chat_session.id)
+        ranking = get_session(session_id)
+
+        # "Like the BMW but automatic": look the cars up before the agent answers
+        comparison = find_comparison(booking_id, user_message, ranking)
+
         # 2) Run AI Agent (LangChain)
-        agent = SalesAgent()
+        agent = SalesAgent.for_turn(deadline)
         result = agent.run(
             booking=booking_data,
             profile=profile_data,
-            state=current_state,
+            state=current_state if comparison is None else {**current_state, "comparison": comparison.summary()},
             message=user_message,
             history=history_text,
+            catalog=prefetch.get("catalog"),
         )
 
         assistant_message = result["assistant_message"]
         state_update = result.get("state_update", {}) or {}
         needs = result.get("needs", {}) or {}
-        protection_needs = needs.get("protections", [])
-        addon_needs = needs.get("addons", [])
 
         new_state = {**current_state, **state_update}
         chat_session.state = new_state
         chat_session.save()
 
-        deals = self.fetch_deals(booking_data)
-        protections_raw = self.fetch_protections(booking_data)
-        addons_raw = self.fetch_addons(booking_data)
-
-        original_price = self.get_original_price(deals)
-
-        top_deals = hybrid_rank_deals(
-            deals=deals,
-            profile=new_state,
-            original_total_price=original_price,
-            k=3,
-            use_llm=True,
-        )
-
-        cars = [self.compact_car(d, original_price) for d in top_deals]
-
-        protections = recommend_protections(
-            protections_raw.get("protectionPackages", []),
-            new_state,
-            protection_needs,
-        )
-
-        addons = recommend_addons(
-            addons_raw.get("addons", []),
-            new_state,
-            addon_needs,
-        )
-
-        ChatMessage.objects.create(
+        # Written now: its created_at orders the transcript and the next
+        # turn's history. Only the analytics below are deferred.
+        reply = ChatMessage.objects.create(
             chat_session=chat_session,
-            role="assistant",
+            role=ChatMessage.ROLE_ASSISTANT,
             content=assistant_message,
         )
 
+        if serializer.validated_data["text_only"]:
+            enqueue("compute_session_recommendations", session_id=session_id, needs=needs, message=user_message)
+            recommendations = {"cars": [], "protections": [], "addons": [], "bundles": [], "upstream": {}}
+        else:
+            recommender = ChatRecommender(booking_id, prefetch, deadline, ranking=ranking, comparison=comparison)
+            recommendations = recommender.build(new_state, needs)
+
+        # Turn analytics do not need to delay the response
+        enqueue(
+            "annotate_chat_message",
+            message_id=reply.id,
+            metadata={
+                "cars": [c["id"] for c in recommendations["cars"]],
+                "state_update": state_update,
+                "needs": needs,
+                "upstream_sources": {k: v["source"] for k, v in recommendations["upstream"].items()},
+                "ranking": recommendations.pop("ranking", None),
+                "comparison": comparison.summary() if comparison is not None else None,
+                "turn_seconds": round(time.perf_counter() - started, 3),
+                "latency_paths": deadline.paths,
+                "degraded": deadline.degraded_stages(),
+            },
+        )
+
         messages = [
             {
                 "role": m.role,
@@ -173,78 +203,63 @@ class ChatAPIView(APIView):
         ]
 
         return Response({
-            "chat_session_id": str(chat_session.id),
+            "chat_session_id": session_id,
             "messages": messages,
-            "cars": cars,
-            "protections": protections,
-            "addons": addons,
+            "cars": recommendations["cars"],
+            "protections": recommendations["protections"],
+            "addons": recommendations["addons"],
+            "bundles": recommendations["bundles"],
             "state": new_state,
+            "upstream": recommendations["upstream"],
+            "recommendations_pending": serializer.validated_data["text_only"],
+            "latency": deadline.summary(),
         })
-    # ---------------------------------------------------------------------
-    # Helper Methods
-    # ---------------------------------------------------------------------
 
-    def fetch_deals(self, booking_id: str):
-        try:
-            response = get_vehicles(booking_id)
-            return response.get("deals", [])
-        except Exception as e:
-            print("Error fetching vehicles:", e)
-            return []
 
-    def fetch_protections(self, booking_id: str):
-        try:
-            return get_protections(booking_id)
-        except Exception as e:
-            print("Error fetching protections:", e)
-            return {"protectionPackages": []}
+class ChatRecommendationsAPIView(APIView):
+    """
+    GET /api/ai-engine/chat/<chat_session_id>/recommendations/
+    -> cars / protections / addons / bundles computed in the background for a
+       text-only turn (empty until the task has finished)
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, chat_session_id):
+        chat_session = get_object_or_404(ChatSession, id=chat_session_id)
+        return Response({
+            "chat_session_id": str(chat_session.id),
+            "ready": bool(chat_session.recommendations),
+            **chat_session.recommendations,
+        })
+
+
+# -------------------------------------------------------------------------
+#  WHAT-IF RANKING  (many hypothetical profiles, one booking's deals)
+# -------------------------------------------------------------------------
+class WhatIfRankingAPIView(APIView):
+    """
+    POST /api/ai-engine/what-if/
+    {"booking_id": ..., "profiles": [{"trip_type": "family", "passengers": 5}, ...], "k": 3}
+    -> top-k cars per profile, scored with the car_scoring rules in one pass
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        serializer = WhatIfSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
-    def fetch_addons(self, booking_id: str):
         try:
-            return get_addons(booking_id)
-        except Exception as e:
-            print("Error fetching addons:", e)
-            return {"addons": []}
-
-    # --- Pricing helpers ---
-
-    def get_original_price(self, deals):
-        for d in deals:
-            if d.get("dealInfo") == "BOOKED_CATEGORY":
-                return d["pricing"]["totalPrice"]["amount"]
-        if deals:
-            return deals[0]["pricing"]["totalPrice"]["amount"]
-        return 0.0
-
-    # --- Format compact car card ---
-
-    def compact_car(self, deal, original_price):
-        v = deal["vehicle"]
-        p = deal["pricing"]
-
-        tags = []
-        if v.get("isRecommended"):
-            tags.append("Recommended")
-        if v.get("isNewCar"):
-            tags.append("New")
-        if v.get("isMoreLuxury"):
-            tags.append("Luxury")
-        if p.get("discountPercentage", 0) > 0:
-            tags.append(f"{p['discountPercentage']}% off")
-
-        return {
-            "id": v["id"],
-            "name": f"{v['brand']} {v['model']}",
-            "brand": v["brand"],
-            "model": v["model"],
-            "image": v["images"][0] if v.get("images") else None,
-            "groupType": v["groupType"],
-            "passengers": v["passengersCount"],
-            "bags": v["bagsCount"],
-            "transmission": v["transmissionType"],
-            "fuelType": v["fuelType"],
-            "daily_price": p["displayPrice"]["amount"],
-            "total_price": p["totalPrice"]["amount"],
-            "currency": p["displayPrice"]["currency"],
-            "tags": tags,
-        }
\ No newline at end of file
+            deals = get_vehicles(data["booking_id"]).get("deals", [])
+        except Exception:
+            return Response({"error": "Invalid booking_id or SIXT API unavailable"}, status=400)
+
+        # NumPy is only loaded by this endpoint
+        from .ai.batch_scoring import what_if
+
+        return Response({
+            "booking_id": data["booking_id"],
+            **what_if(deals, data["profiles"], data["k"], data["include_scores"]),
+        })
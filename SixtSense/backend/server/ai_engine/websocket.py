@@ -0,0 +1,278 @@
+# ai_engine/websocket.py
+"""
+WebSocket chat channel, one connection per chat session:
+
+    ws://<host>/ws/ai-engine/chat/<chat_session_id>/
+
+Plain ASGI (routed in core/asgi.py, needs an ASGI server such as uvicorn).
+The session, booking and recent history are loaded once when the socket
+opens and kept in memory for the connection's lifetime, so a turn only
+writes to the DB. The reply is streamed token by token and the
+recommendations follow as separate frames, only for the parts that changed.
+
+Client -> server (JSON text frames):
+    {"type": "message", "message": "..."}
+    {"type": "ping"}
+
+Server -> client:
+    {"type": "session", "chat_session_id", "state", "messages"}   on connect
+    {"type": "token", "text": "..."}                               reply chunks
+    {"type": "message", "role", "content", "created_at"}           full reply
+    {"type": "state", "state": {...}}                              if changed
+    {"type": "cars" | "protections" | "addons" | "bundles",
+     "items": [...], "added": [ids], "removed": [ids]}             if changed
+    {"type": "upstream", "upstream": {...}}
+    {"type": "done", "turn_seconds": 1.23, "latency": {...}}
+    {"type": "error", "detail": "..."}
+    {"type": "pong"}
+
+While the "extras" stage is degraded (degradation.py) no protections /
+addons / bundles frames are sent; the client keeps what it shows.
+"""
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core import metrics
+
+from .ai.agent import SalesAgent
+from .ai.ranking_session import get_session
+from .deadline import Deadline
+from .degradation import controller as degradation
+from .models import ChatMessage, ChatSession
+from .prefetch import await_prefetch
+from .recommendations import ChatRecommender, afind_comparison
+from .tasks import enqueue
+
+SESSION_PATH = re.compile(r"^/ws/ai-engine/chat/(?P<chat_session_id>[0-9a-fA-F-]{36})/?$")
+
+# Same window as ChatAPIView: last 8 messages
+HISTORY_SIZE = 8
+
+# Application close code for an unknown chat session
+CLOSE_NOT_FOUND = 4404
+
+RECOMMENDATION_KINDS = ("cars", "protections", "addons", "bundles")
+
+_open_connections = 0
+_open_connections_lock = threading.Lock()
+
+
+def _track_connection(delta: int):
+    global _open_connections
+    with _open_connections_lock:
+        _open_connections += delta
+        metrics.gauge("ws.connections", _open_connections)
+
+
+def _message_frame(role: str, content: str, created_at) -> Dict[str, Any]:
+    return {"type": "message", "role": role, "content": content, "created_at": created_at.isoformat()}
+
+
+class ChatConnection:
+    def __init__(self, send, chat_session: ChatSession, messages: List[ChatMessage]):
+        self._send = send
+        self.chat_session = chat_session
+        self.session_id = str(chat_session.id)
+        self.booking_id = chat_session.booking.booking_id
+        self.booking_data = chat_session.booking.data
+        self.state: Dict[str, Any] = chat_session.state or {}
+        self.messages = messages
+        self.history = deque(((m.role, m.content) for m in messages[-HISTORY_SIZE:]), maxlen=HISTORY_SIZE)
+        # What the client currently shows, to only push what changed
+        self.sent: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in RECOMMENDATION_KINDS}
+
+    @classmethod
+    async def open(cls, send, chat_session_id: str) -> Optional["ChatConnection"]:
+        try:
+            chat_session = await ChatSession.objects.select_related("booking").aget(id=chat_session_id)
+        except (ChatSession.DoesNotExist, ValidationError):
+            return None
+        messages = [m async for m in chat_session.messages.order_by("created_at")]
+        return cls(send, chat_session, messages)
+
+    async def send_json(self, data: Dict[str, Any]):
+        await self._send({"type": "websocket.send", "text": json.dumps(data, cls=DjangoJSONEncoder)})
+
+    async def greet(self):
+        await self.send_json({
+            "type": "session",
+            "chat_session_id": self.session_id,
+            "state": self.state,
+            "messages": [
+                {"role": m.role, "content": m.content, "created_at": m.created_at.isoformat()}
+                for m in self.messages
+            ],
+        })
+
+    async def handle(self, data: Dict[str, Any]):
+        kind = data.get("type")
+        if kind == "ping":
+            await self.send_json({"type": "pong"})
+            return
+        message = data.get("message")
+        if kind != "message" or not isinstance(message, str) or not message.strip():
+            await self.send_json({"type": "error", "detail": 'Expected {"type": "message", "message": "..."}'})
+            return
+
+        try:
+            with metrics.timer("ws.turn"), degradation.turn():
+                await self.turn(message)
+        except Exception as e:
+            print(f"[ai_engine] websocket turn failed for session {self.session_id}: {e}")
+            await self.send_json({"type": "error", "detail": str(e)})
+        finally:
+            # No request_finished signal on a long-lived socket
+            await sync_to_async(close_old_connections)()
+
+    async def turn(self, user_message: str):
+        started = time.perf_counter()
+        deadline = Deadline.for_turn(started)
+        prefetch = await await_prefetch(self.chat_session)
+
+        await ChatMessage.objects.acreate(
+            chat_session_id=self.session_id,
+            role=ChatMessage.ROLE_USER,
+            content=user_message,
+        )
+        self.history.append((ChatMessage.ROLE_USER, user_message))
+        history_text = "\n".join(
+            f"{'User' if role == ChatMessage.ROLE_USER else 'Assistant'}: {content}"
+            for role, content in list(self.history)[-deadline.history_size(HISTORY_SIZE):]
+        )
+
+        # "Like the BMW but automatic": look the cars up before the agent answers
+        ranking = get_session(self.session_id)
+        comparison = await afind_comparison(self.booking_id, user_message, ranking)
+
+        # 1) Stream the reply
+        streamed = ""
+        result: Dict[str, Any] = {}
+        async for partial in SalesAgent.for_turn(deadline).astream(
+            booking=self.booking_data,
+            profile={},
+            state=self.state if comparison is None else {**self.state, "comparison": comparison.summary()},
+            message=user_message,
+            history=history_text,
+            catalog=prefetch.get("catalog"),
+        ):
+            result = partial
+            text = partial.get("assistant_message")
+            if isinstance(text, str) and len(text) > len(streamed) and text.startswith(streamed):
+                if not streamed:
+                    metrics.observe("ws.first_token", time.perf_counter() - started)
+                await self.send_json({"type": "token", "text": text[len(streamed):]})
+                streamed = text
+
+        if "assistant_message" not in result:
+            raise ValueError("Agent returned no assistant_message")
+
+        assistant_message = result["assistant_message"]
+        state_update = result.get("state_update", {}) or {}
+        needs = result.get("needs", {}) or {}
+
+        reply = await ChatMessage.objects.acreate(
+            chat_session_id=self.session_id,
+            role=ChatMessage.ROLE_ASSISTANT,
+            content=assistant_message,
+        )
+        self.history.append((ChatMessage.ROLE_ASSISTANT, assistant_message))
+        await self.send_json(_message_frame(ChatMessage.ROLE_ASSISTANT, assistant_message, reply.created_at))
+
+        new_state = {**self.state, **state_update}
+        if new_state != self.state:
+            self.state = new_state
+            self.chat_session.state = new_state
+            await ChatSession.objects.filter(id=self.session_id).aupdate(state=new_state, updated_at=timezone.now())
+            await self.send_json({"type": "state", "state": new_state})
+
+        # 2) Recommendations, pushed only where they changed
+        recommendations = await ChatRecommender(
+            self.booking_id, prefetch, deadline, ranking=ranking, comparison=comparison,
+        ).abuild(new_state, needs)
+        for kind in RECOMMENDATION_KINDS:
+            if kind != "cars" and deadline.is_degraded("extras"):
+                continue
+            frame = self.delta(kind, recommendations[kind])
+            if frame:
+                await self.send_json(frame)
+        await self.send_json({"type": "upstream", "upstream": recommendations["upstream"]})
+
+        turn_seconds = round(time.perf_counter() - started, 3)
+        await sync_to_async(enqueue)(
+            "annotate_chat_message",
+            message_id=reply.id,
+            metadata={
+                "cars": [c["id"] for c in recommendations["cars"]],
+                "state_update": state_update,
+                "needs": needs,
+                "upstream_sources": {k: v["source"] for k, v in recommendations["upstream"].items()},
+                "ranking": recommendations.pop("ranking", None),
+                "comparison": comparison.summary() if comparison is not None else None,
+                "turn_seconds": turn_seconds,
+                "latency_paths": deadline.paths,
+                "degraded": deadline.degraded_stages(),
+                "websocket": True,
+            },
+        )
+        await self.send_json({"type": "done", "turn_seconds": turn_seconds, "latency": deadline.summary()})
+
+    def delta(self, kind: str, items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        previous = self.sent[kind]
+        if items == previous:
+            metrics.incr(f"ws.unchanged.{kind}")
+            return None
+        self.sent[kind] = items
+        previous_ids = [i["id"] for i in previous]
+        ids = [i["id"] for i in items]
+        return {
+            "type": kind,
+            "items": items,
+            "added": [i for i in ids if i not in previous_ids],
+            "removed": [i for i in previous_ids if i not in ids],
+        }
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI app for scope["type"] == "websocket" (see core/asgi.py)."""
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+
+    match = SESSION_PATH.match(scope["path"])
+    connection = await ChatConnection.open(send, match["chat_session_id"]) if match else None
+    if connection is None:
+        await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+
+    await send({"type": "websocket.accept"})
+    _track_connection(+1)
+    try:
+        await connection.greet()
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                break
+            if event["type"] != "websocket.receive":
+                continue
+            text = event.get("text") or (event.get("bytes") or b"").decode("utf-8", "replace")
+            try:
+                data = json.loads(text)
+            except ValueError:
+                await connection.send_json({"type": "error", "detail": "Frames must be JSON"})
+                continue
+            if not isinstance(data, dict):
+                await connection.send_json({"type": "error", "detail": "Frames must be JSON objects"})
+                continue
+            await connection.handle(data)
+    finally:
+        _track_connection(-1)
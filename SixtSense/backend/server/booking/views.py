@@ -3,6 +3,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 
+from sixtbridge.sixt_api import get_booking_with_meta
+from ai_engine.opening import warm_opening
+from ai_engine.tasks import enqueue
+from sixtbridge.resilience import unavailable_meta
+
 from .models import BookingLink
 from .serializers import (
     BookingLinkSerializer,
@@ -17,6 +22,8 @@ class BookingLinkCreateAPIView(APIView):
 
     Creates a BookingLink.
     No authentication required.
+    Also starts generating the chat opening pitch for this booking in the
+    background, so it is ready when the user opens the chat.
     """
     permission_classes = [permissions.AllowAny]
 
@@ -24,6 +31,8 @@ class BookingLinkCreateAPIView(APIView):
         serializer = BookingLinkSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
             booking = serializer.save()
+            enqueue("warm_booking_catalog", booking_id=booking.booking_id)
+            warm_opening(booking.booking_id)
             return Response(BookingLinkSerializer(booking).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -77,7 +86,8 @@ class BookingLinkFullDetailAPIView(APIView):
     - BookingLink fields (id, booking_id, extra_data)
     - user
     - profile
-    - booking (live data from SIXT API)
+    - booking (live data from SIXT API, possibly served from cache)
+    - booking_freshness (where the booking came from and how old it is)
     """
     permission_classes = [permissions.AllowAny]
 
@@ -88,12 +98,14 @@ class BookingLinkFullDetailAPIView(APIView):
         )
 
         try:
-            sixt_booking = get_booking(booking_id)
+            sixt_booking, freshness = get_booking_with_meta(booking_id)
         except Exception as e:
-            sixt_booking = None
+            sixt_booking, freshness = None, unavailable_meta("booking", e)
 
         serializer = BookingLinkWithProfileSerializer(
             booking_link,
             context={"booking": sixt_booking},
         )
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        data = serializer.data
+        data["booking_freshness"] = freshness
+        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
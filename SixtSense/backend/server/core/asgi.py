@@ -3,6 +3,14 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve with an ASGI server and ASYNC_VIEWS=True so the chat and SIXT proxy
+endpoints run as async views (no thread held while waiting on the LLM/SIXT):
+
+    ASYNC_VIEWS=True uvicorn core.asgi:application --host 0.0.0.0 --port 8000 --workers 2
+
+WebSocket connections (ws/ai-engine/chat/<chat_session_id>/) are handled by
+ai_engine.websocket; everything else goes to Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +21,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the app registry loaded by get_asgi_application()
+from ai_engine.websocket import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
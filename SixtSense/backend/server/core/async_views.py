@@ -0,0 +1,46 @@
+# core/async_views.py
+"""
+Base class for async-native JSON endpoints.
+
+DRF's APIView is synchronous: under ASGI every request holds a thread for
+the whole view, including the multi-second LLM wait. AsyncAPIView is a plain
+Django async view that keeps the contract of our DRF views (JSON in, JSON
+out, serializer errors as 400, no auth/CSRF like the AllowAny views).
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import ParseError, ValidationError
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except ParseError as e:
+            return self.respond({"detail": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return self.respond(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_data(self, request) -> dict:
+        if not request.body:
+            return {}
+        try:
+            return json.loads(request.body)
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {e}")
+
+    def validate(self, request, serializer_class) -> dict:
+        serializer = serializer_class(data=self.get_data(request))
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def respond(self, data, status: int = status.HTTP_200_OK, headers: dict = None) -> JsonResponse:
+        return JsonResponse(data, status=status, headers=headers, encoder=DjangoJSONEncoder, safe=False)
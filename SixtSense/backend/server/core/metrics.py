@@ -0,0 +1,94 @@
+# core/metrics.py
+"""
+Tiny in-process metrics registry: counters, gauges and timings.
+
+Each worker process keeps its own numbers; they are exposed as JSON at
+/api/metrics/ (see core.views.MetricsAPIView).
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Number of most recent samples kept per timing for percentiles
+TIMING_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+_timing_counts: Dict[str, int] = defaultdict(int)
+
+
+def incr(name: str, value: float = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        _timings[name].append(seconds)
+        _timing_counts[name] += 1
+
+
+@contextmanager
+def timer(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def _percentile(sorted_samples, q: float) -> float:
+    idx = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[idx]
+
+
+def percentile(name: str, q: float) -> Optional[float]:
+    """q in [0, 1]; None when nothing was observed yet."""
+    with _lock:
+        samples = sorted(_timings.get(name, ()))
+    if not samples:
+        return None
+    return _percentile(samples, q)
+
+
+def get_counter(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def get_timing_count(name: str) -> int:
+    """Samples currently in the window of a timing."""
+    with _lock:
+        return len(_timings.get(name, ()))
+
+
+def snapshot() -> Dict[str, dict]:
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: (sorted(samples), _timing_counts[name]) for name, samples in _timings.items()}
+
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "timings": {
+            name: {
+                "count": count,
+                "mean": round(sum(samples) / len(samples), 6),
+                "p50": round(_percentile(samples, 0.50), 6),
+                "p95": round(_percentile(samples, 0.95), 6),
+                "p99": round(_percentile(samples, 0.99), 6),
+            }
+            for name, (samples, count) in timings.items()
+            if samples
+        },
+    }
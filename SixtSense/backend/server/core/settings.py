@@ -107,6 +107,29 @@ DATABASES = {
 }
 
 
+# Cache
+# Backs the stale-while-revalidate layer in sixtbridge.resilience. Point it at a
+# shared backend (e.g. FileBasedCache) to share SIXT payloads between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='sixtsense'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    }
+}
+
+
+# Async views
+# Route the chat and SIXT proxy endpoints to their async-native versions
+# (ai_engine.async_views / sixtbridge.async_views). Turn on when serving
+# core.asgi:application, e.g. `uvicorn core.asgi:application --workers 2`.
+
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
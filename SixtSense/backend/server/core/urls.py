@@ -17,12 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import MetricsAPIView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/accounts/", include("accounts.urls")),
     path("api/booking/", include("booking.urls")),
     path("api/sixt/", include("sixtbridge.urls")),
     path("api/ai-engine/", include("ai_engine.urls")),
+    path("api/metrics/", MetricsAPIView.as_view(), name="metrics"),
 
     # Djoser + JWT auth
     path("api/auth/", include("djoser.urls")),
@@ -0,0 +1,17 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+
+from . import metrics
+
+
+class MetricsAPIView(APIView):
+    """
+    GET /api/metrics/
+    -> counters, gauges and timing percentiles of this worker process
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        return Response(metrics.snapshot())
@@ -0,0 +1,129 @@
+# sixtbridge/async_views.py
+"""
+Async-native versions of the SIXT proxy views (settings.ASYNC_VIEWS).
+Same URLs, status codes and freshness headers as sixtbridge.views; SIXT is
+called through httpx.AsyncClient instead of requests.
+"""
+from rest_framework import status
+
+from core.async_views import AsyncAPIView
+
+from .resilience import UpstreamUnavailable, BREAKER_RESET_TIMEOUT
+from .views import freshness_headers
+from .sixt_api import (
+    acreate_booking,
+    aget_booking_with_meta,
+    aget_vehicles_with_meta,
+    aget_protections_with_meta,
+    aget_addons_with_meta,
+    aassign_vehicle,
+    aassign_protection,
+    acomplete_booking,
+    acar_lock,
+    acar_unlock,
+    acar_blink,
+)
+
+
+class SixtProxyView(AsyncAPIView):
+    """
+    Awaits one SIXT call and maps errors like the sync views do:
+    open circuit -> 503 + Retry-After, anything else -> 502.
+    """
+    action = ""
+
+    async def proxy(self, call, success_status=status.HTTP_200_OK, with_meta=False):
+        try:
+            result = await call
+        except UpstreamUnavailable as e:
+            return self.respond(
+                {"detail": f"SIXT is currently unavailable: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(int(BREAKER_RESET_TIMEOUT))},
+            )
+        except Exception as e:
+            return self.respond(
+                {"detail": f"Error talking to SIXT ({self.action}): {str(e)}"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        if with_meta:
+            sixt_data, meta = result
+            return self.respond(sixt_data, status=success_status, headers=freshness_headers(meta))
+        return self.respond(result, status=success_status)
+
+
+class SixtCreateBookingAPIView(SixtProxyView):
+    action = "create booking"
+
+    async def post(self, request, *args, **kwargs):
+        return await self.proxy(acreate_booking(self.get_data(request)), status.HTTP_201_CREATED)
+
+
+class SixtBookingDetailAPIView(SixtProxyView):
+    action = "get booking"
+
+    async def get(self, request, booking_id, *args, **kwargs):
+        return await self.proxy(aget_booking_with_meta(booking_id), with_meta=True)
+
+
+class SixtBookingVehiclesAPIView(SixtProxyView):
+    action = "get vehicles"
+
+    async def get(self, request, booking_id, *args, **kwargs):
+        return await self.proxy(aget_vehicles_with_meta(booking_id), with_meta=True)
+
+
+class SixtBookingProtectionsAPIView(SixtProxyView):
+    action = "get protections"
+
+    async def get(self, request, booking_id, *args, **kwargs):
+        return await self.proxy(aget_protections_with_meta(booking_id), with_meta=True)
+
+
+class SixtBookingAddonsAPIView(SixtProxyView):
+    action = "get addons"
+
+    async def get(self, request, booking_id, *args, **kwargs):
+        return await self.proxy(aget_addons_with_meta(booking_id), with_meta=True)
+
+
+class SixtAssignVehicleAPIView(SixtProxyView):
+    action = "assign vehicle"
+
+    async def post(self, request, booking_id, vehicle_id, *args, **kwargs):
+        return await self.proxy(aassign_vehicle(booking_id, vehicle_id))
+
+
+class SixtAssignProtectionAPIView(SixtProxyView):
+    action = "assign protection"
+
+    async def post(self, request, booking_id, package_id, *args, **kwargs):
+        return await self.proxy(aassign_protection(booking_id, package_id))
+
+
+class SixtCompleteBookingAPIView(SixtProxyView):
+    action = "complete booking"
+
+    async def post(self, request, booking_id, *args, **kwargs):
+        return await self.proxy(acomplete_booking(booking_id))
+
+
+class CarLockAPIView(SixtProxyView):
+    action = "car lock"
+
+    async def post(self, request, *args, **kwargs):
+        return await self.proxy(acar_lock())
+
+
+class CarUnlockAPIView(SixtProxyView):
+    action = "car unlock"
+
+    async def post(self, request, *args, **kwargs):
+        return await self.proxy(acar_unlock())
+
+
+class CarBlinkAPIView(SixtProxyView):
+    action = "car blink"
+
+    async def post(self, request, *args, **kwargs):
+        return await self.proxy(acar_blink())
@@ -0,0 +1,327 @@
+# sixtbridge/resilience.py
+"""
+Resilience layer in front of the SIXT HackaTUM API.
+
+- stale-while-revalidate: GET payloads are cached; once they are older than
+  the endpoint's fresh TTL we still serve them immediately and refresh them
+  in a background thread.
+- circuit breaker (one per endpoint): after N consecutive upstream failures
+  the circuit opens and calls fail fast instead of waiting for the timeout.
+- single-flight: concurrent misses/refreshes for the same path share one
+  upstream request (optionally across processes, see SIXT_SINGLEFLIGHT_LOCK_DIR).
+
+Every fetch returns (data, meta) where meta describes how fresh the data is,
+so views can surface it to the client.
+
+acall()/afetch() are the asyncio counterparts used by the async views. They
+share the breakers, the cache entries and the background refresh pool with
+the sync functions.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from django.core.cache import cache
+
+from core import metrics
+from .singleflight import SingleFlight
+
+
+# Seconds a cached payload is served without touching SIXT at all
+FRESH_TTL = {
+    "booking": float(os.getenv("SIXT_FRESH_TTL_BOOKING", "15")),
+    "vehicles": float(os.getenv("SIXT_FRESH_TTL_CATALOG", "120")),
+    "protections": float(os.getenv("SIXT_FRESH_TTL_CATALOG", "120")),
+    "addons": float(os.getenv("SIXT_FRESH_TTL_CATALOG", "120")),
+}
+
+# Seconds a payload may still be served (stale) while SIXT is slow or down
+STALE_TTL = float(os.getenv("SIXT_STALE_TTL", "3600"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("SIXT_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("SIXT_BREAKER_RESET", "30"))
+
+CACHE_PREFIX = "sixt:"
+
+# Set to a directory shared by all workers to coalesce fetches across processes
+# (only useful together with a shared CACHES backend)
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SIXT_SINGLEFLIGHT_LOCK_DIR") or None
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when the circuit is open and there is nothing cached to serve."""
+
+
+# -------------------------------------------------------------------------
+#  Circuit breaker
+# -------------------------------------------------------------------------
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Closed: always. Open: never, until reset_timeout has passed; then a
+        single probe call is let through (half-open).
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            if self._state == self.HALF_OPEN:
+                # a probe is already in flight
+                return False
+            self._state = self.HALF_OPEN
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """
+        The caller gave up on the call (deadline, cancellation, shutdown).
+        That says nothing about SIXT, except that a half-open probe did not
+        prove it recovered: reopen, so the next probe is let through after
+        reset_timeout instead of never.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """
+    Only timeouts, connection errors and 5xx count against the breaker.
+    A 404 for an unknown booking id means SIXT is alive and answering.
+    """
+    # requests.HTTPError and httpx.HTTPStatusError both carry the response
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return response.status_code >= 500
+    return True
+
+
+def _record(breaker: CircuitBreaker, exc: Exception):
+    if is_upstream_failure(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _admit(endpoint: str) -> CircuitBreaker:
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"SIXT {endpoint} circuit is open")
+    metrics.incr(f"sixt.upstream_calls.{endpoint}")
+    return breaker
+
+
+def call(endpoint: str, fn: Callable[[], Any]) -> Any:
+    """
+    Run an upstream call through the endpoint's circuit breaker.
+    Used directly for POSTs (never cached) and by fetch() for GETs.
+    """
+    breaker = _admit(endpoint)
+    try:
+        with metrics.timer(f"sixt.latency.{endpoint}"):
+            result = fn()
+    except Exception as e:
+        _record(breaker, e)
+        raise
+    except BaseException:
+        breaker.record_abandoned()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def acall(endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Async version of call(): fn returns a coroutine."""
+    breaker = _admit(endpoint)
+    try:
+        with metrics.timer(f"sixt.latency.{endpoint}"):
+            result = await fn()
+    except Exception as e:
+        _record(breaker, e)
+        raise
+    except BaseException:
+        # asyncio.CancelledError: the turn's deadline cancelled the call
+        breaker.record_abandoned()
+        raise
+    breaker.record_success()
+    return result
+
+
+# -------------------------------------------------------------------------
+#  Stale-while-revalidate cache
+# -------------------------------------------------------------------------
+_refresh_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SIXT_REFRESH_WORKERS", "4")),
+    thread_name_prefix="sixt-refresh",
+)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_flight = SingleFlight("sixt.singleflight", lock_dir=SINGLEFLIGHT_LOCK_DIR)
+
+
+def _store(key: str, data: Any) -> Dict[str, Any]:
+    entry = {"data": data, "fetched_at": time.time()}
+    cache.set(CACHE_PREFIX + key, entry, timeout=STALE_TTL)
+    return entry
+
+
+def _is_fresh(endpoint: str, entry: Dict[str, Any]) -> bool:
+    return time.time() - entry["fetched_at"] <= FRESH_TTL.get(endpoint, 0)
+
+
+def _load(endpoint: str, key: str, loader: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    Fetch + store, coalesced per key. When leaders of several processes queue
+    up on the cross-process lock, the later ones find the fresh entry the
+    first one stored and skip the upstream call.
+    """
+    def run():
+        if SINGLEFLIGHT_LOCK_DIR:
+            entry = cache.get(CACHE_PREFIX + key)
+            if entry is not None and _is_fresh(endpoint, entry):
+                return entry
+        return _store(key, call(endpoint, loader))
+
+    return _flight.do(key, run, metric=endpoint)
+
+
+def _meta(source: str, endpoint: str, entry: Dict[str, Any] = None) -> Dict[str, Any]:
+    meta = {"source": source, "circuit": get_breaker(endpoint).state}
+    if entry:
+        meta["fetched_at"] = datetime.fromtimestamp(entry["fetched_at"], tz=timezone.utc).isoformat()
+        meta["age_seconds"] = round(time.time() - entry["fetched_at"], 1)
+    return meta
+
+
+def _refresh(endpoint: str, key: str, loader: Callable[[], Any]):
+    try:
+        _load(endpoint, key, loader)
+    except Exception as e:
+        print(f"[sixtbridge] background refresh of {key} failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(endpoint: str, key: str, loader: Callable[[], Any]):
+    if get_breaker(endpoint).state == CircuitBreaker.OPEN:
+        return
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresh_pool.submit(_refresh, endpoint, key, loader)
+
+
+def fetch(endpoint: str, key: str, loader: Callable[[], Any]) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Return (data, meta) for a cached GET.
+
+    meta["source"] is one of:
+    - "cache": younger than the endpoint's fresh TTL, SIXT not contacted
+    - "stale": older than the fresh TTL, served as-is while a background
+               refresh runs (or because SIXT just failed)
+    - "live":  fetched synchronously because nothing was cached
+    """
+    entry = cache.get(CACHE_PREFIX + key)
+    if entry is not None:
+        if _is_fresh(endpoint, entry):
+            return entry["data"], _meta("cache", endpoint, entry)
+        _refresh_in_background(endpoint, key, loader)
+        return entry["data"], _meta("stale", endpoint, entry)
+
+    entry = _load(endpoint, key, loader)
+    return entry["data"], _meta("live", endpoint, entry)
+
+
+async def _aload(endpoint: str, key: str, loader: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+    async def run():
+        data = await acall(endpoint, loader)
+        entry = {"data": data, "fetched_at": time.time()}
+        await cache.aset(CACHE_PREFIX + key, entry, timeout=STALE_TTL)
+        return entry
+
+    return await _flight.ado(key, run, metric=endpoint)
+
+
+async def afetch(endpoint: str, key: str,
+                 loader: Callable[[], Awaitable[Any]],
+                 refresh_loader: Callable[[], Any]) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Async version of fetch(). Misses are loaded with the async `loader`;
+    stale entries are refreshed by the shared background pool with the sync
+    `refresh_loader`, so the refresh outlives the request's event loop and
+    is deduplicated with refreshes started by sync callers.
+    """
+    entry = await cache.aget(CACHE_PREFIX + key)
+    if entry is not None:
+        if _is_fresh(endpoint, entry):
+            return entry["data"], _meta("cache", endpoint, entry)
+        _refresh_in_background(endpoint, key, refresh_loader)
+        return entry["data"], _meta("stale", endpoint, entry)
+
+    entry = await _aload(endpoint, key, loader)
+    return entry["data"], _meta("live", endpoint, entry)
+
+
+def invalidate(*keys: str):
+    cache.delete_many([CACHE_PREFIX + k for k in keys])
+
+
+async def ainvalidate(*keys: str):
+    await cache.adelete_many([CACHE_PREFIX + k for k in keys])
+
+
+def unavailable_meta(endpoint: str, error: Exception) -> Dict[str, Any]:
+    meta = _meta("unavailable", endpoint)
+    meta["error"] = str(error)
+    return meta
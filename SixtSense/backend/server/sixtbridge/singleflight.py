@@ -0,0 +1,110 @@
+# sixtbridge/singleflight.py
+"""
+Request coalescing: concurrent calls for the same key share one execution.
+
+The first caller ("leader") runs the function; everybody else arriving while
+it is in flight waits for the leader and gets the same result (or exception).
+
+With lock_dir set, the leader additionally takes an flock on a per-key file,
+so leaders in different worker processes run one after another; the function
+passed in is expected to re-check a shared cache first (see resilience).
+
+ado() is the asyncio flavour used by the async views: callers on the same
+event loop share one task instead of one thread.
+"""
+import asyncio
+import fcntl
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, lock_dir: Optional[str] = None):
+        self.name = name
+        self.lock_dir = lock_dir
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def _process_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        path = os.path.join(self.lock_dir, f"{self.name}-{digest}.lock")
+        with open(path, "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _count_coalesced(self, metric: str = None):
+        metrics.incr(f"{self.name}.coalesced")
+        if metric:
+            metrics.incr(f"{self.name}.coalesced.{metric}")
+
+    def do(self, key: str, fn: Callable[[], Any], metric: str = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count_coalesced(metric)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(key):
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], metric: str = None) -> Any:
+        """
+        Coalesce concurrent awaits of fn() per (event loop, key). A caller
+        being cancelled does not cancel the shared task for the others.
+        The cross-process lock is not taken here (flock would block the loop).
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+
+        task = self._tasks.get(flight_key)
+        if task is None:
+            task = loop.create_task(fn())
+            self._tasks[flight_key] = task
+
+            def forget(done_task, flight_key=flight_key):
+                if self._tasks.get(flight_key) is done_task:
+                    del self._tasks[flight_key]
+
+            task.add_done_callback(forget)
+        else:
+            self._count_coalesced(metric)
+
+        return await asyncio.shield(task)
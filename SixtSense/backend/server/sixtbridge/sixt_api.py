@@ -1,82 +1,220 @@
+import asyncio
 import os
+import weakref
+
 import requests
 
+from . import resilience
+
 # You can move this to settings or env var if needed
 SIXT_BASE_URL = os.getenv("SIXT_BASE_URL", "https://hackatum25.sixt.io")
 
+# (connect, read) – a dead host should not hold a worker for the full read timeout
+SIXT_TIMEOUT = (
+    float(os.getenv("SIXT_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("SIXT_READ_TIMEOUT", "10")),
+)
 
-def create_booking(payload: dict) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking"
-    response = requests.post(url, json=payload, timeout=10)
+
+def _get_json(path: str) -> dict:
+    response = requests.get(f"{SIXT_BASE_URL}{path}", timeout=SIXT_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
-def get_booking(booking_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}"
-    response = requests.get(url, timeout=10)
+def _post_json(path: str, payload: dict = None) -> dict:
+    response = requests.post(f"{SIXT_BASE_URL}{path}", json=payload, timeout=SIXT_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
-def get_vehicles(booking_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/vehicles"
-    response = requests.get(url, timeout=10)
+# One httpx.AsyncClient (connection pool) per event loop: under an ASGI server
+# that is a single client per process; async views served through WSGI get a
+# short-lived loop per request and a client that is dropped along with it.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _async_client():
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=SIXT_BASE_URL,
+            timeout=httpx.Timeout(SIXT_TIMEOUT[1], connect=SIXT_TIMEOUT[0]),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SIXT_ASYNC_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=20,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def _aget_json(path: str) -> dict:
+    response = await _async_client().get(path)
     response.raise_for_status()
     return response.json()
 
 
-def get_protections(booking_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/protections"
-    response = requests.get(url, timeout=10)
+async def _apost_json(path: str, payload: dict = None) -> dict:
+    response = await _async_client().post(path, json=payload)
     response.raise_for_status()
     return response.json()
 
 
+def _booking_keys(booking_id: str) -> list:
+    base = f"/api/booking/{booking_id}"
+    return [base, f"{base}/vehicles", f"{base}/protections", f"{base}/addons"]
+
+
+# -------------------------------------------------------------------------
+#  Cached GETs: *_with_meta returns (data, freshness meta)
+# -------------------------------------------------------------------------
+
+def get_booking_with_meta(booking_id: str):
+    path = f"/api/booking/{booking_id}"
+    return resilience.fetch("booking", path, lambda: _get_json(path))
+
+
+def get_vehicles_with_meta(booking_id: str):
+    path = f"/api/booking/{booking_id}/vehicles"
+    return resilience.fetch("vehicles", path, lambda: _get_json(path))
+
+
+def get_protections_with_meta(booking_id: str):
+    path = f"/api/booking/{booking_id}/protections"
+    return resilience.fetch("protections", path, lambda: _get_json(path))
+
+
+def get_addons_with_meta(booking_id: str):
+    path = f"/api/booking/{booking_id}/addons"
+    return resilience.fetch("addons", path, lambda: _get_json(path))
+
+
+def get_booking(booking_id: str) -> dict:
+    return get_booking_with_meta(booking_id)[0]
+
+
+def get_vehicles(booking_id: str) -> dict:
+    return get_vehicles_with_meta(booking_id)[0]
+
+
+def get_protections(booking_id: str) -> dict:
+    return get_protections_with_meta(booking_id)[0]
+
+
 def get_addons(booking_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/addons"
-    response = requests.get(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    return get_addons_with_meta(booking_id)[0]
+
+
+# -------------------------------------------------------------------------
+#  Async GETs (async views), sharing the cache with the sync ones
+# -------------------------------------------------------------------------
+
+def _afetch(endpoint: str, path: str):
+    return resilience.afetch(endpoint, path, lambda: _aget_json(path), lambda: _get_json(path))
+
+
+async def aget_booking_with_meta(booking_id: str):
+    return await _afetch("booking", f"/api/booking/{booking_id}")
+
+
+async def aget_vehicles_with_meta(booking_id: str):
+    return await _afetch("vehicles", f"/api/booking/{booking_id}/vehicles")
+
+
+async def aget_protections_with_meta(booking_id: str):
+    return await _afetch("protections", f"/api/booking/{booking_id}/protections")
+
+
+async def aget_addons_with_meta(booking_id: str):
+    return await _afetch("addons", f"/api/booking/{booking_id}/addons")
+
+
+async def aget_booking(booking_id: str) -> dict:
+    return (await aget_booking_with_meta(booking_id))[0]
+
+
+# -------------------------------------------------------------------------
+#  Writes: never cached, but guarded by the breaker and they invalidate
+#  whatever we cached for the booking
+# -------------------------------------------------------------------------
+
+def create_booking(payload: dict) -> dict:
+    return resilience.call("create_booking", lambda: _post_json("/api/booking", payload))
 
 
 def assign_vehicle(booking_id: str, vehicle_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/vehicles/{vehicle_id}"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    path = f"/api/booking/{booking_id}/vehicles/{vehicle_id}"
+    data = resilience.call("assign_vehicle", lambda: _post_json(path))
+    resilience.invalidate(*_booking_keys(booking_id))
+    return data
 
 
 def assign_protection(booking_id: str, package_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/protections/{package_id}"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    path = f"/api/booking/{booking_id}/protections/{package_id}"
+    data = resilience.call("assign_protection", lambda: _post_json(path))
+    resilience.invalidate(*_booking_keys(booking_id))
+    return data
 
 
 def complete_booking(booking_id: str) -> dict:
-    url = f"{SIXT_BASE_URL}/api/booking/{booking_id}/complete"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    path = f"/api/booking/{booking_id}/complete"
+    data = resilience.call("complete_booking", lambda: _post_json(path))
+    resilience.invalidate(*_booking_keys(booking_id))
+    return data
 
 
 def car_lock() -> dict:
-    url = f"{SIXT_BASE_URL}/api/car/lock"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    return resilience.call("car", lambda: _post_json("/api/car/lock"))
 
 
 def car_unlock() -> dict:
-    url = f"{SIXT_BASE_URL}/api/car/unlock"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    return resilience.call("car", lambda: _post_json("/api/car/unlock"))
 
 
 def car_blink() -> dict:
-    url = f"{SIXT_BASE_URL}/api/car/blink"
-    response = requests.post(url, timeout=10)
-    response.raise_for_status()
-    return response.json()
+    return resilience.call("car", lambda: _post_json("/api/car/blink"))
+
+
+# -------------------------------------------------------------------------
+#  Async writes
+# -------------------------------------------------------------------------
+
+async def acreate_booking(payload: dict) -> dict:
+    return await resilience.acall("create_booking", lambda: _apost_json("/api/booking", payload))
+
+
+async def aassign_vehicle(booking_id: str, vehicle_id: str) -> dict:
+    path = f"/api/booking/{booking_id}/vehicles/{vehicle_id}"
+    data = await resilience.acall("assign_vehicle", lambda: _apost_json(path))
+    await resilience.ainvalidate(*_booking_keys(booking_id))
+    return data
+
+
+async def aassign_protection(booking_id: str, package_id: str) -> dict:
+    path = f"/api/booking/{booking_id}/protections/{package_id}"
+    data = await resilience.acall("assign_protection", lambda: _apost_json(path))
+    await resilience.ainvalidate(*_booking_keys(booking_id))
+    return data
+
+
+async def acomplete_booking(booking_id: str) -> dict:
+    path = f"/api/booking/{booking_id}/complete"
+    data = await resilience.acall("complete_booking", lambda: _apost_json(path))
+    await resilience.ainvalidate(*_booking_keys(booking_id))
+    return data
+
+
+async def acar_lock() -> dict:
+    return await resilience.acall("car", lambda: _apost_json("/api/car/lock"))
+
+
+async def acar_unlock() -> dict:
+    return await resilience.acall("car", lambda: _apost_json("/api/car/unlock"))
+
+
+async def acar_blink() -> dict:
+    return await resilience.acall("car", lambda: _apost_json("/api/car/blink"))
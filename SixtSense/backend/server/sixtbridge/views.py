@@ -4,12 +4,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 
+from .resilience import UpstreamUnavailable, BREAKER_RESET_TIMEOUT
 from .sixt_api import (
     create_booking,
-    get_booking,
-    get_vehicles,
-    get_protections,
-    get_addons,
+    get_booking_with_meta,
+    get_vehicles_with_meta,
+    get_protections_with_meta,
+    get_addons_with_meta,
     assign_vehicle,
     assign_protection,
     complete_booking,
@@ -19,6 +20,27 @@ from .sixt_api import (
 )
 
 
+def freshness_headers(meta: dict) -> dict:
+    """
+    Surface how fresh a cached SIXT payload is without touching its body.
+    """
+    headers = {
+        "X-Upstream-Source": meta["source"],
+        "X-Upstream-Circuit": meta["circuit"],
+    }
+    if "age_seconds" in meta:
+        headers["X-Upstream-Age"] = str(meta["age_seconds"])
+    return headers
+
+
+def upstream_unavailable_response(e: UpstreamUnavailable) -> Response:
+    return Response(
+        {"detail": f"SIXT is currently unavailable: {str(e)}"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(int(BREAKER_RESET_TIMEOUT))},
+    )
+
+
 class SixtCreateBookingAPIView(APIView):
     """
     POST /sixt/booking/
@@ -29,6 +51,8 @@ class SixtCreateBookingAPIView(APIView):
     def post(self, request, *args, **kwargs):
         try:
             sixt_data = create_booking(request.data)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (create booking): {str(e)}"},
@@ -46,13 +70,15 @@ class SixtBookingDetailAPIView(APIView):
 
     def get(self, request, booking_id, *args, **kwargs):
         try:
-            sixt_data = get_booking(booking_id)
+            sixt_data, meta = get_booking_with_meta(booking_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (get booking): {str(e)}"},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
-        return Response(sixt_data, status=status.HTTP_200_OK)
+        return Response(sixt_data, status=status.HTTP_200_OK, headers=freshness_headers(meta))
 
 
 class SixtBookingVehiclesAPIView(APIView):
@@ -64,13 +90,15 @@ class SixtBookingVehiclesAPIView(APIView):
 
     def get(self, request, booking_id, *args, **kwargs):
         try:
-            sixt_data = get_vehicles(booking_id)
+            sixt_data, meta = get_vehicles_with_meta(booking_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (get vehicles): {str(e)}"},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
-        return Response(sixt_data, status=status.HTTP_200_OK)
+        return Response(sixt_data, status=status.HTTP_200_OK, headers=freshness_headers(meta))
 
 
 class SixtBookingProtectionsAPIView(APIView):
@@ -82,13 +110,15 @@ class SixtBookingProtectionsAPIView(APIView):
 
     def get(self, request, booking_id, *args, **kwargs):
         try:
-            sixt_data = get_protections(booking_id)
+            sixt_data, meta = get_protections_with_meta(booking_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (get protections): {str(e)}"},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
-        return Response(sixt_data, status=status.HTTP_200_OK)
+        return Response(sixt_data, status=status.HTTP_200_OK, headers=freshness_headers(meta))
 
 
 class SixtBookingAddonsAPIView(APIView):
@@ -100,13 +130,15 @@ class SixtBookingAddonsAPIView(APIView):
 
     def get(self, request, booking_id, *args, **kwargs):
         try:
-            sixt_data = get_addons(booking_id)
+            sixt_data, meta = get_addons_with_meta(booking_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (get addons): {str(e)}"},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
-        return Response(sixt_data, status=status.HTTP_200_OK)
+        return Response(sixt_data, status=status.HTTP_200_OK, headers=freshness_headers(meta))
 
 
 class SixtAssignVehicleAPIView(APIView):
@@ -119,6 +151,8 @@ class SixtAssignVehicleAPIView(APIView):
     def post(self, request, booking_id, vehicle_id, *args, **kwargs):
         try:
             sixt_data = assign_vehicle(booking_id, vehicle_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (assign vehicle): {str(e)}"},
@@ -137,6 +171,8 @@ class SixtAssignProtectionAPIView(APIView):
     def post(self, request, booking_id, package_id, *args, **kwargs):
         try:
             sixt_data = assign_protection(booking_id, package_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (assign protection): {str(e)}"},
@@ -155,6 +191,8 @@ class SixtCompleteBookingAPIView(APIView):
     def post(self, request, booking_id, *args, **kwargs):
         try:
             sixt_data = complete_booking(booking_id)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (complete booking): {str(e)}"},
@@ -173,6 +211,8 @@ class CarLockAPIView(APIView):
     def post(self, request, *args, **kwargs):
         try:
             sixt_data = car_lock()
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (car lock): {str(e)}"},
@@ -191,6 +231,8 @@ class CarUnlockAPIView(APIView):
     def post(self, request, *args, **kwargs):
         try:
             sixt_data = car_unlock()
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (car unlock): {str(e)}"},
@@ -209,6 +251,8 @@ class CarBlinkAPIView(APIView):
     def post(self, request, *args, **kwargs):
         try:
             sixt_data = car_blink()
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
         except Exception as e:
             return Response(
                 {"detail": f"Error talking to SIXT (car blink): {str(e)}"},
@@ -0,0 +1,165 @@
+# admission.py
+"""
+Admission control per le chiamate OpenAI, condiviso tra i worker.
+
+Per ogni modello due token bucket (richieste/min e token/min) in un file
+SQLite (LLM_LIMITS_DB): tutti i worker uvicorn, e di default anche il
+backend Django, pescano dallo stesso budget invece di prendersi i 429
+ognuno per conto suo. Schema identico a ai_engine/ai/admission.py.
+
+Anche i limiti per modello stanno nel file (tabella llm_limits, riga "*"
+per i modelli senza riga propria), così backend e prototipo dimensionano
+i bucket allo stesso modo; LLM_RPM / LLM_TPM / LLM_LIMITS inizializzano
+solo un file nuovo.
+
+Nel processo le chiamate aspettano in una coda limitata (LLM_QUEUE_SIZE);
+se la coda è piena o il budget non arriva entro LLM_MAX_WAIT la chiamata
+viene scartata subito con LLMOverloaded e il chiamante usa il fallback
+(rank_rows, risposta "occupato") invece di andare in timeout.
+
+    acquire("gpt-4o", estimate_tokens(prompt))
+    resp = llm.invoke(prompt)
+"""
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from config import LLM_ADMISSION, LLM_LIMITS, LLM_LIMITS_DB, LLM_RPM, LLM_TPM, LLM_QUEUE_SIZE, LLM_MAX_WAIT
+
+# Token del completamento se il chiamante non li conosce
+DEFAULT_COMPLETION_TOKENS = 512
+
+POLL_INTERVAL = 0.05
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, model: str, reason: str):
+        super().__init__(f"LLM calls to {model} are shed ({reason})")
+        self.model = model
+        self.reason = reason
+
+
+def estimate_tokens(*texts, max_tokens: Optional[int] = None) -> int:
+    # ~4 caratteri per token, più il budget di risposta: meglio sovrastimare
+    return sum(len(str(t)) for t in texts) // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LLM_LIMITS_DB, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_buckets ("
+            " key TEXT PRIMARY KEY,"
+            " level REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_limits ("
+            " model TEXT PRIMARY KEY,"
+            " rpm REAL NOT NULL,"
+            " tpm REAL NOT NULL)"
+        )
+        # Le righe già presenti (scritte da uno dei due) vincono sull'env
+        seed = [("*", LLM_RPM, LLM_TPM)] + [
+            (model, limits.get("rpm", LLM_RPM), limits.get("tpm", LLM_TPM)) for model, limits in LLM_LIMITS.items()
+        ]
+        conn.executemany("INSERT OR IGNORE INTO llm_limits (model, rpm, tpm) VALUES (?, ?, ?)", seed)
+        _local.conn = conn
+    return conn
+
+
+def _limits(model: str) -> Tuple[float, float]:
+    """(richieste/min, token/min) del modello, o della riga "*"."""
+    row = _connect().execute(
+        "SELECT rpm, tpm FROM llm_limits WHERE model IN (?, '*') ORDER BY model = '*' LIMIT 1", (model,)
+    ).fetchone()
+    return (row[0], row[1]) if row else (LLM_RPM, LLM_TPM)
+
+
+def _take(buckets: List[Tuple[str, float, float]]) -> float:
+    """(key, quantità, capacità/min) -> 0.0 se preso da tutti, altrimenti i secondi da aspettare."""
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        levels = {}
+        wait = 0.0
+        for key, amount, capacity in buckets:
+            row = conn.execute("SELECT level, updated_at FROM llm_buckets WHERE key = ?", (key,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+            amount = min(amount, capacity)
+            if level < amount:
+                wait = max(wait, (amount - level) * 60 / capacity)
+            levels[key] = level - amount
+        if wait == 0.0:
+            conn.executemany(
+                "INSERT OR REPLACE INTO llm_buckets (key, level, updated_at) VALUES (?, ?, ?)",
+                [(key, level, now) for key, level in levels.items()],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+
+_lock = threading.Condition()
+_waiting = deque()
+_counts = {"admitted": 0, "queue_full": 0, "rate_limited": 0, "timeout": 0}
+
+
+def _count(key: str):
+    with _lock:
+        _counts[key] += 1
+
+
+def acquire(model: Optional[str], tokens: int, max_wait: Optional[float] = None):
+    """Aspetta il proprio turno (FIFO) e il budget; LLMOverloaded se scartata."""
+    if not LLM_ADMISSION or not model:
+        return
+    max_wait = LLM_MAX_WAIT if max_wait is None else max_wait
+    ticket = object()
+    with _lock:
+        if len(_waiting) >= LLM_QUEUE_SIZE:
+            _counts["queue_full"] += 1
+            raise LLMOverloaded(model, "queue_full")
+        _waiting.append(ticket)
+
+    deadline = time.monotonic() + max_wait
+    try:
+        while True:
+            with _lock:
+                first = _waiting[0] is ticket
+            wait = None
+            if first:
+                rpm, tpm = _limits(model)
+                wait = _take([(f"{model}:rpm", 1, rpm), (f"{model}:tpm", tokens, tpm)])
+            if wait == 0.0:
+                _count("admitted")
+                return
+            left = deadline - time.monotonic()
+            if wait is not None and wait > left:
+                # Il budget non arriva in tempo: meglio scartare subito
+                _count("rate_limited")
+                raise LLMOverloaded(model, "rate_limited")
+            if left <= 0:
+                _count("timeout")
+                raise LLMOverloaded(model, "timeout")
+            with _lock:
+                _lock.wait(min(left, wait if wait is not None else POLL_INTERVAL))
+    finally:
+        with _lock:
+            _waiting.remove(ticket)
+            _lock.notify_all()
+
+
+def stats() -> dict:
+    with _lock:
+        return {"queue_depth": len(_waiting), **_counts}
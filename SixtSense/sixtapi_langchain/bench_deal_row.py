@@ -0,0 +1,134 @@
+# bench_deal_row.py
+"""
+Benchmark delle tre forme di un deal per il ranking:
+
+    dict      il JSON grezzo di SIXT (llm_engine prima di DealRow)
+    pydantic  SelectedVehicle (vehicle_store, recommendation.py)
+    DealRow   deal_row.DealRow, costruita una volta per payload
+
+Misura la memoria per deal (tracemalloc) e il throughput dello scoring
+su profili casuali. Con dict e pydantic ogni score legge i campi annidati
+(DealRow.from_raw / from_selected a ogni chiamata, le stesse letture che
+faceva score_deal); con DealRow le righe sono già pronte.
+
+    python bench_deal_row.py [--deals 40] [--profiles 2000] [--booking ID]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from deal_row import DealRow, rows, score_row
+from models import SelectedVehicle
+
+GROUPS = ("SEDAN", "SUV", "COUPE", "MINIVAN", "PREMIUM SEDAN", "CONVERTIBLE")
+
+
+def _deal(rng: random.Random, i: int) -> dict:
+    """Un deal con la forma di /vehicles (images, attributes, upsellReasons, ...)."""
+    price = round(rng.uniform(150, 900), 2)
+    return {
+        "vehicle": {
+            "id": f"bench-{i}",
+            "brand": rng.choice(("BMW", "VW", "MERCEDES", "SKODA", "AUDI")),
+            "model": f"Model {i}",
+            "acrissCode": "CDAR",
+            "images": [f"https://img.example/{i}/{n}.png" for n in range(3)],
+            "bagsCount": rng.randint(1, 6),
+            "passengersCount": rng.choice((2, 4, 5, 5, 7, 9)),
+            "groupType": rng.choice(GROUPS),
+            "tyreType": "ALL_SEASON",
+            "transmissionType": rng.choice(("Automatic", "Manual")),
+            "fuelType": rng.choice(("Petrol", "Diesel", "Electric")),
+            "isNewCar": rng.random() < 0.3,
+            "isRecommended": rng.random() < 0.2,
+            "isMoreLuxury": rng.random() < 0.2,
+            "attributes": [
+                {"key": key, "title": key.title(), "value": str(rng.randint(1, 9)), "attributeType": "DETAIL"}
+                for key in ("seats", "doors", "bags", "ac")
+            ],
+            "upsellReasons": [{"title": "More space", "description": "Room for everyone"}],
+        },
+        "pricing": {
+            "discountPercentage": 0,
+            "displayPrice": {"currency": "EUR", "amount": round(price / 5, 2), "prefix": "+", "suffix": "/day"},
+            "totalPrice": {"currency": "EUR", "amount": price, "suffix": "total"},
+        },
+        "dealInfo": "BOOKED_CATEGORY" if i == 0 else None,
+        "tags": [],
+    }
+
+
+def _profile(rng: random.Random) -> dict:
+    return {
+        "passengers": rng.choice((None, 2, 4, 5, 7)),
+        "luggage": rng.choice((None, "few", "many")),
+        "comfort_priority": rng.choice((None, "low", "high")),
+        "trip_type": rng.choice((None, "family", "business")),
+        "budget_total": rng.choice((None, 400, 800)),
+    }
+
+
+def _allocated(build):
+    """(risultato, byte allocati da build())."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def _scoring(label: str, items, score, profiles, original_price):
+    started = time.perf_counter()
+    scores = [[score(item, p, original_price) for item in items] for p in profiles]
+    seconds = time.perf_counter() - started
+    return label, scores, len(profiles) * len(items) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--deals", type=int, default=40, help="Deal sintetici nel catalogo.")
+    parser.add_argument("--booking", help="Usa i deal reali di questo booking.")
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.booking:
+        from sixt_client import SixtApiClient
+        raw = json.dumps(SixtApiClient().get_available_vehicles_raw(args.booking))
+    else:
+        raw = json.dumps({"deals": [_deal(rng, i) for i in range(args.deals)]})
+
+    deals, dict_bytes = _allocated(lambda: json.loads(raw)["deals"])
+    if not deals:
+        print("Nessun deal.")
+        return
+    selected, pydantic_bytes = _allocated(lambda: [SelectedVehicle.model_validate(d) for d in deals])
+    deal_rows, row_bytes = _allocated(lambda: rows(deals))
+
+    n = len(deals)
+    print(f"deals: {n}")
+    print(f"memoria  dict     : {dict_bytes / n:8.0f} B/deal")
+    print(f"memoria  pydantic : {pydantic_bytes / n:8.0f} B/deal")
+    print(f"memoria  DealRow  : {row_bytes / n:8.0f} B/deal (più il riferimento al deal grezzo)")
+
+    profiles = [_profile(rng) for _ in range(args.profiles)]
+    original_price = next((r.total for r in deal_rows if r.deal.get("dealInfo") == "BOOKED_CATEGORY"), deal_rows[0].total)
+    results = [
+        _scoring("dict    ", deals, lambda d, p, o: score_row(DealRow.from_raw(d), p, o), profiles, original_price),
+        _scoring("pydantic", selected, lambda s, p, o: score_row(DealRow.from_selected(s), p, o), profiles, original_price),
+        _scoring("DealRow ", deal_rows, score_row, profiles, original_price),
+    ]
+    reference = results[-1][1]
+    for label, scores, rate in results:
+        if scores != reference:
+            print(f"ATTENZIONE: score diversi fra {label.strip()} e DealRow")
+        print(f"scoring  {label} : {rate:10.0f} deal/s ({rate / results[0][2]:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
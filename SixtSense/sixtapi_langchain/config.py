@@ -1,6 +1,66 @@
 from dotenv import load_dotenv
+import json
 import os
+import tempfile
 
 load_dotenv()
 
-SIXT_BASE_URL = os.getenv("SIXT_BASE_URL", "https://hackatum25.sixt.io")
\ No newline at end of file
+SIXT_BASE_URL = os.getenv("SIXT_BASE_URL", "https://hackatum25.sixt.io")
+
+# Request coalescing for SixtApiClient GETs (see singleflight.py)
+SIXT_SINGLEFLIGHT_LINGER = float(os.getenv("SIXT_SINGLEFLIGHT_LINGER", "2.0"))
+SIXT_SINGLEFLIGHT_LOCK_DIR = os.getenv("SIXT_SINGLEFLIGHT_LOCK_DIR") or None
+
+# Budget di latenza per turno di /chat (vedi deadline.py)
+TURN_BUDGET = float(os.getenv("CHAT_TURN_BUDGET", "6.0"))
+RERANK_MIN_BUDGET = float(os.getenv("RERANK_MIN_BUDGET", "0.5"))
+RERANK_MAX_SECONDS = float(os.getenv("RERANK_MAX_SECONDS", "2.5"))
+
+# Hedging delle chiamate LLM in run_vehicle_chat (vedi hedging.py)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "4.0"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_HEDGE_BURST = float(os.getenv("LLM_HEDGE_BURST", "2"))
+LLM_HEDGE_FALLBACK_MODEL = os.getenv("LLM_HEDGE_FALLBACK_MODEL") or None
+
+# Admission control / rate limit condiviso delle chiamate LLM (vedi admission.py).
+# Stesso file SQLite del backend Django di default: il budget è per host.
+LLM_ADMISSION = os.getenv("LLM_ADMISSION", "true").lower() in ("1", "true", "yes")
+LLM_LIMITS_DB = os.getenv("LLM_LIMITS_DB") or os.path.join(tempfile.gettempdir(), "sixtsense-llm-limits.sqlite3")
+# I limiti stanno nel file stesso (tabella llm_limits, condivisa col backend):
+# questi valori servono solo a inizializzare un file nuovo, poi vale la tabella
+# (manage.py llm_limits nel backend). Stesso seed di ai_engine/ai/admission.py.
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "30000"))
+LLM_LIMITS = json.loads(os.getenv("LLM_LIMITS", '{"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}'))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "2.0"))
+
+# Routing dei messaggi semplici (vedi router.py)
+LLM_ROUTER = os.getenv("LLM_ROUTER", "true").lower() in ("1", "true", "yes")
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "gpt-4o-mini")
+
+# Slot filling senza LLM (vedi slots.py): quota di parole riconosciute
+LLM_SLOTS_MIN_COVERAGE = float(os.getenv("LLM_SLOTS_MIN_COVERAGE", "1.0"))
+
+# Step vehicle: "two_call" (re-rank LLM + risposta), "single" (una chiamata
+# strutturata che ordina la shortlist e risponde) o "ab" (split per booking)
+VEHICLE_CHAT_MODE = os.getenv("VEHICLE_CHAT_MODE", "two_call")
+VEHICLE_CHAT_AB_SHARE = float(os.getenv("VEHICLE_CHAT_AB_SHARE", "0.5"))
+VEHICLE_CHAT_SHORTLIST = int(os.getenv("VEHICLE_CHAT_SHORTLIST", "6"))
+
+# Cache semantica delle risposte degli step protection / addons (vedi semantic_cache.py)
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+
+# Contesti degli step renderizzati, per (booking, step) (vedi step_context.py)
+STEP_CONTEXT_CACHE_SIZE = int(os.getenv("STEP_CONTEXT_CACHE_SIZE", "1024"))
+
+# Store dei veicoli condiviso fra i booking, per contenuto (vedi vehicle_store.py):
+# i veicoli dei cataloghi restano sempre, in più gli ultimi VEHICLE_STORE_SIZE usati
+VEHICLE_STORE_SIZE = int(os.getenv("VEHICLE_STORE_SIZE", "5000"))
+VEHICLE_CATALOG_CACHE_SIZE = int(os.getenv("VEHICLE_CATALOG_CACHE_SIZE", "1024"))
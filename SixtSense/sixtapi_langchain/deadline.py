@@ -0,0 +1,40 @@
+# deadline.py
+"""
+Budget di latenza per un turno di /chat.
+
+main.chat() crea una Deadline all'arrivo della richiesta e la passa giù fino
+a hybrid_rank_deals: il re-rank LLM riceve solo il budget rimasto e, se non
+finisce in tempo, si usa il ranking a regole. Il percorso scelto viene
+registrato in `paths` e restituito nella risposta.
+"""
+import time
+from typing import Dict, Optional
+
+from config import TURN_BUDGET
+
+
+class Deadline:
+    def __init__(self, budget: float = TURN_BUDGET, started: Optional[float] = None):
+        self.budget = budget
+        # time.perf_counter() dell'inizio del turno
+        self.started = time.perf_counter() if started is None else started
+        self.paths: Dict[str, str] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget - self.elapsed())
+
+    def timeout_for(self, cap: float) -> float:
+        return min(cap, self.remaining())
+
+    def record(self, stage: str, path: str):
+        self.paths[stage] = path
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "budget_seconds": self.budget,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "paths": dict(self.paths),
+        }
@@ -0,0 +1,144 @@
+# deal_row.py
+"""
+Un deal "piatto" con solo quello che serve al ranking.
+
+score_deal / filter_deals leggevano a ogni turno e per ogni regola i dict
+annidati di SIXT (deal["vehicle"]["passengersCount"],
+deal["pricing"]["totalPrice"]["amount"], ...). DealRow tiene quei campi
+in __slots__ (niente __dict__ per riga) più il riferimento al deal grezzo,
+che serve per il testo (righe del prompt, reason).
+
+Le righe sono costruite una volta per payload /vehicles, insieme al
+Catalog di vehicle_store (Catalog.rows), e riusate finché la fingerprint
+del payload non cambia.
+
+bench_deal_row.py confronta memoria per deal e throughput dello scoring
+fra dict grezzi, SelectedVehicle (pydantic) e DealRow.
+"""
+from typing import Dict, List, Optional
+
+
+class DealRow:
+    __slots__ = ("deal", "id", "seats", "bags", "group_type", "luxury", "recommended", "new", "total")
+
+    def __init__(self, deal: Optional[Dict], id: str, seats: int, bags: int, group_type: str,
+                 luxury: bool, recommended: bool, new: bool, total: float):
+        self.deal = deal
+        self.id = id
+        self.seats = seats
+        self.bags = bags
+        self.group_type = group_type
+        self.luxury = luxury
+        self.recommended = recommended
+        self.new = new
+        self.total = total
+
+    @classmethod
+    def from_raw(cls, deal: Dict) -> "DealRow":
+        v = deal["vehicle"]
+        return cls(
+            deal,
+            v["id"],
+            v["passengersCount"],
+            v["bagsCount"],
+            v.get("groupType") or "",
+            bool(v.get("isMoreLuxury")),
+            bool(v.get("isRecommended")),
+            bool(v.get("isNewCar")),
+            deal["pricing"]["totalPrice"]["amount"],
+        )
+
+    @classmethod
+    def from_selected(cls, selected) -> "DealRow":
+        """Da un SelectedVehicle (pydantic); senza deal grezzo."""
+        v = selected.vehicle
+        return cls(None, v.id, v.passengersCount, v.bagsCount, v.groupType or "",
+                   bool(v.isMoreLuxury), bool(v.isRecommended), bool(v.isNewCar),
+                   selected.pricing.totalPrice.amount)
+
+    def __repr__(self):
+        return f"DealRow({self.id!r}, total={self.total!r})"
+
+
+def rows(deals: List[Dict]) -> List[DealRow]:
+    return [DealRow.from_raw(d) for d in deals]
+
+
+def score_row(row: DealRow, profile: Dict, original_total_price: float) -> float:
+    """
+    Stessa logica del teammate, ma applicata ai deals reali dal Sixt API.
+    """
+    score = 0.0
+
+    # Core needs: passengers
+    if profile.get("passengers") and row.seats >= profile["passengers"]:
+        score += 3
+
+    # Luggage
+    if profile.get("luggage") == "many" and row.bags >= 4:
+        score += 2
+
+    # Trip-type
+    if profile.get("comfort_priority") == "high":
+        if row.luxury or "premium" in row.group_type.lower():
+            score += 3
+
+    if profile.get("trip_type") == "family":
+        if row.group_type in ["SUV", "MINIVAN"] or row.seats >= 7:
+            score += 2
+
+    if profile.get("trip_type") == "business":
+        if "SEDAN" in row.group_type or row.luxury:
+            score += 2
+
+    # Quality indicators
+    if row.recommended:
+        score += 1
+    if row.new:
+        score += 1
+
+    # Prezzo
+    uplift = row.total - original_total_price
+    if uplift > 0:
+        score += min(uplift / 40, 4)
+    elif uplift == 0:
+        score += 1
+    else:
+        score += max(uplift / 100, -2)
+
+    # Luxury
+    if row.luxury:
+        score += 2
+
+    total_price = row.total
+    if total_price > original_total_price * 1.5:
+        score += 3
+    elif total_price > original_total_price * 1.2:
+        score += 2
+    elif total_price > original_total_price:
+        score += 1
+
+    return score
+
+
+def rank_rows(rows: List[DealRow], profile: Dict, original_total_price: float, k: int = 3) -> List[DealRow]:
+    scored = [(score_row(r, profile, original_total_price), r) for r in rows]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [r for s, r in scored[:k]]
+
+
+def filter_rows(rows: List[DealRow], profile: Dict) -> List[DealRow]:
+    """Scarta le auto che non vanno bene per il profilo (tutte se non resta niente)."""
+    filtered = []
+    for row in rows:
+        if profile.get("passengers") and row.seats < profile["passengers"]:
+            continue
+        if profile.get("budget_total"):
+            if row.total > profile["budget_total"] * 1.5:
+                continue
+        if profile.get("luggage") == "many" and row.bags < 3:
+            continue
+
+        filtered.append(row)
+
+    return filtered or rows
@@ -0,0 +1,119 @@
+# hedging.py
+"""
+Richieste LLM "hedged" per tagliare la coda di latenza.
+
+Parte la richiesta primaria; se dopo il percentile LLM_HEDGE_PERCENTILE
+delle latenze recenti non ha ancora risposto, ne parte una seconda (stesso
+modello o LLM_HEDGE_FALLBACK_MODEL). Vince il primo risultato valido;
+l'altra viene cancellata se non è ancora partita, altrimenti ignorata.
+
+La spesa extra è limitata: ogni chiamata "guadagna" LLM_HEDGE_MAX_RATE di
+hedge, un hedge ne costa uno (massimo LLM_HEDGE_BURST accumulati).
+
+    hedger = Hedger("vehicle_chat")
+    hedger.call(lambda: llm.invoke(msgs), lambda: backup.invoke(msgs))
+
+La funzione di latenza è iniettabile nei test (qualsiasi callable lento va bene).
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from config import (
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_DEFAULT_DELAY,
+    LLM_HEDGE_MAX_RATE,
+    LLM_HEDGE_BURST,
+)
+
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+class Hedger:
+    def __init__(self, name: str,
+                 percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 default_delay: float = LLM_HEDGE_DEFAULT_DELAY,
+                 max_rate: float = LLM_HEDGE_MAX_RATE,
+                 burst: float = LLM_HEDGE_BURST):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.max_rate = max_rate
+        self.burst = burst
+        self._budget = burst
+        self._latencies = deque(maxlen=512)
+        self._counts = {"calls": 0, "fired": 0, "won": 0, "capped": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def delay(self) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        return latencies[int(self.percentile * (len(latencies) - 1))]
+
+    def _admit_hedge(self) -> bool:
+        with self._lock:
+            if self._budget >= 1:
+                self._budget -= 1
+                return True
+            self._counts["capped"] += 1
+            return False
+
+    def _observe_primary(self, started: float):
+        # Latenza della primaria, anche quando perde: serve per la soglia
+        def observe(future):
+            if not future.cancelled() and future.exception() is None:
+                with self._lock:
+                    self._latencies.append(time.perf_counter() - started)
+        return observe
+
+    def call(self, primary: Callable[[], Any], backup: Optional[Callable[[], Any]] = None) -> Any:
+        with self._lock:
+            self._counts["calls"] += 1
+            self._budget = min(self.burst, self._budget + self.max_rate)
+        started = time.perf_counter()
+        # Nei thread del pool resta il contesto del chiamante (es. priorità di admission)
+        first = _pool.submit(contextvars.copy_context().run, primary)
+        first.add_done_callback(self._observe_primary(started))
+
+        done, _ = wait([first], timeout=self.delay())
+        if done or not self._admit_hedge():
+            return first.result()
+
+        self._count("fired")
+        second = _pool.submit(contextvars.copy_context().run, backup or primary)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is second:
+                        self._count("won")
+                    return future.result()
+                error = future.exception()
+                self._count("errors")
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        calls = counts["calls"] or 1
+        return {
+            **counts,
+            "hedge_rate": round(counts["fired"] / calls, 4),
+            "win_rate": round(counts["won"] / counts["fired"], 4) if counts["fired"] else None,
+            "delay_seconds": round(self.delay(), 3),
+        }
@@ -1,25 +1,146 @@
+import hashlib
 import json
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
-from langchain_openai import ChatOpenAI
-from langchain.tools import tool
-from langchain_core.messages import ToolMessage
+import time
 
-from sixt_client import SixtApiClient
+from config import (
+    RERANK_MIN_BUDGET, RERANK_MAX_SECONDS, LLM_HEDGE_ENABLED, LLM_HEDGE_FALLBACK_MODEL, LLM_SMALL_MODEL,
+    VEHICLE_CHAT_MODE, VEHICLE_CHAT_AB_SHARE, VEHICLE_CHAT_SHORTLIST,
+)
+from deadline import Deadline
+from hedging import Hedger
+from models import VehicleChatReply
+from admission import LLMOverloaded, acquire, estimate_tokens
+import router
+import semantic_cache
+import slots
+import step_context
+from deal_row import DealRow, filter_rows, rank_rows, score_row
+from sixt_client import SixtApiClient, parse_addons, parse_protection_packages
 profile_store: Dict[str, Dict] = {}
 
 # ------------------- LLM setup -------------------
-llm = ChatOpenAI(
-    model="gpt-4o",
-    temperature=0.4,
+# LangChain/OpenAI vengono importati solo al primo uso: l'import costa quasi
+# tutto il tempo di avvio di un worker e non serve per gli endpoint /booking.
+
+@lru_cache(maxsize=1)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model="gpt-4o",
+        temperature=0.4,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_backup_llm():
+    # Modello per le richieste duplicate dell'hedging
+    if not LLM_HEDGE_FALLBACK_MODEL:
+        return get_llm()
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=LLM_HEDGE_FALLBACK_MODEL, temperature=0.4)
+
+
+@lru_cache(maxsize=1)
+def get_small_llm():
+    # Modello per i messaggi semplici (router.py)
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=LLM_SMALL_MODEL, temperature=0.4)
+
+
+@lru_cache(maxsize=1)
+def get_vehicle_reply_llm():
+    # Chiamata unica dello step vehicle: ranking + risposta validati da pydantic
+    return get_llm().with_structured_output(VehicleChatReply)
+
+
+@lru_cache(maxsize=1)
+def get_backup_vehicle_reply_llm():
+    return get_backup_llm().with_structured_output(VehicleChatReply)
+
+
+vehicle_chat_hedger = Hedger("vehicle_chat")
+
+
+def invoke_llm(llm, messages, max_wait: Optional[float] = None, model: Optional[str] = None):
+    """
+    llm.invoke passando dall'admission control (admission.py): rate limit
+    condiviso tra i worker, LLMOverloaded se la chiamata viene scartata.
+    `model` serve per i runnable senza model_name (with_structured_output).
+    """
+    model = model or getattr(llm, "model_name", None)
+    tokens = estimate_tokens(*(m["content"] for m in messages))
+    acquire(model, tokens, max_wait)
+    return llm.invoke(messages)
+
+
+# Risposta quando l'LLM è sovraccarico: le raccomandazioni restano quelle calcolate
+BUSY_ANSWER = (
+    "Sorry, I'm handling a lot of requests right now. The options below are up to date; "
+    "please send your message again in a moment."
 )
 
+
+def _answer(messages, user_message: str, llm_call=None) -> str:
+    """
+    Risposta del modello per uno step: prima il router (template / modello
+    piccolo), poi llm_call o get_llm(); BUSY_ANSWER se l'LLM è sovraccarico.
+    """
+    started = time.perf_counter()
+    route = router.classify(user_message)
+    if route.reply is not None:
+        router.observe(route, started)
+        return route.reply
+
+    try:
+        if route.tier == "small":
+            resp = invoke_llm(get_small_llm(), messages)
+        else:
+            resp = llm_call() if llm_call else invoke_llm(get_llm(), messages)
+    except LLMOverloaded as e:
+        print(f"[Warning] {e}")
+        return BUSY_ANSWER
+    router.observe(route, started)
+    return resp.content
+
+
+def _cached_answer(step: str, context: str, messages, user_message: str) -> str:
+    """_answer() preceduto dalla cache semantica delle domande ricorrenti (semantic_cache.py)."""
+    answer = semantic_cache.lookup(step, context, user_message)
+    if answer is None:
+        answer = _answer(messages, user_message)
+        if answer != BUSY_ANSWER:
+            semantic_cache.store(step, context, user_message, answer)
+    return answer
+
+
+def get_rerank_llm(timeout: float):
+    # Per il re-rank con deadline: niente retry, e la chiamata abbandonata
+    # si chiude da sola al timeout
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model="gpt-4o", temperature=0.4, timeout=timeout, max_retries=0)
+
+
 # Prompt lungo preso dal file
 PROMPT_PATH = Path(__file__).parent / "long_prompt.txt"
-with open(PROMPT_PATH, "r", encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read()
+
+
+@lru_cache(maxsize=1)
+def get_system_prompt() -> str:
+    with open(PROMPT_PATH, "r", encoding="utf-8") as f:
+        return f.read()
 
 # ------------------- Profilo utente -------------------
 
@@ -94,109 +215,55 @@ def update_profile_from_text(profile: Dict, text: str) -> Dict:
             if otp is not None:
                 profile["budget_total"] = otp
 
+    # Slot espliciti (EN/DE/IT, vedi slots.py): vincono sulle parole chiave sopra.
+    # Anche non confident: i match negati ("no diesel") slots li ha già scartati
+    profile.update(slots.extract(text).slots)
+
     return profile
 
 
 # ------------------- Scoring e ranking (su deals reali) -------------------
 
-def score_deal(deal: Dict, profile: Dict, original_total_price: float) -> float:
-    """
-    Stessa logica del teammate, ma applicata ai deals reali dal Sixt API.
-    """
-    score = 0.0
-    vehicle = deal["vehicle"]
-    pricing = deal["pricing"]
-
-    # Core needs: passengers
-    if profile.get("passengers") and vehicle["passengersCount"] >= profile["passengers"]:
-        score += 3
-
-    # Luggage
-    if profile.get("luggage") == "many" and vehicle["bagsCount"] >= 4:
-        score += 2
-
-    # Trip-type
-    if profile.get("comfort_priority") == "high":
-        if vehicle.get("isMoreLuxury") or "premium" in (vehicle.get("groupType") or "").lower():
-            score += 3
-
-    if profile.get("trip_type") == "family":
-        if vehicle["groupType"] in ["SUV", "MINIVAN"] or vehicle["passengersCount"] >= 7:
-            score += 2
-
-    if profile.get("trip_type") == "business":
-        if "SEDAN" in (vehicle["groupType"] or "") or vehicle.get("isMoreLuxury"):
-            score += 2
-
-    # Quality indicators
-    if vehicle.get("isRecommended"):
-        score += 1
-    if vehicle.get("isNewCar"):
-        score += 1
-
-    # Prezzo
-    uplift = pricing["totalPrice"]["amount"] - original_total_price
-    if uplift > 0:
-        score += min(uplift / 40, 4)
-    elif uplift == 0:
-        score += 1
-    else:
-        score += max(uplift / 100, -2)
-
-    # Luxury
-    if vehicle.get("isMoreLuxury"):
-        score += 2
-
-    total_price = pricing["totalPrice"]["amount"]
-    if total_price > original_total_price * 1.5:
-        score += 3
-    elif total_price > original_total_price * 1.2:
-        score += 2
-    elif total_price > original_total_price:
-        score += 1
-
-    return score
-
-
-def rank_deals(deals: List[Dict], profile: Dict, original_total_price: float, k: int = 3) -> List[Dict]:
-    scored = []
-    for d in deals:
-        s = score_deal(d, profile, original_total_price)
-        scored.append((s, d))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [d for s, d in scored[:k]]
+def _vehicle_line(deal: Dict) -> str:
+    v = deal["vehicle"]
+    p = deal["pricing"]
+    tags = []
+    if v.get("isNewCar"):
+        tags.append("New")
+    if v.get("isRecommended"):
+        tags.append("Recommended")
+    if v.get("isMoreLuxury"):
+        tags.append("Luxury")
+    tags_str = f" [{', '.join(tags)}]" if tags else ""
+
+    return (
+        f"{v['brand']} {v['model']} - "
+        f"{v.get('groupType','')}, {v['passengersCount']} seats, "
+        f"{v['bagsCount']} bags, {v['transmissionType']}, "
+        f"{v['fuelType']}, €{p['displayPrice']['amount']}/day "
+        f"(€{p['totalPrice']['amount']} total){tags_str}"
+    )
 
 
 def llm_rank_all_deals_batch(
-    deals: List[Dict], profile: Dict, original_total_price: float, k: int = 3
-) -> List[Dict]:
+    deals: List[DealRow], profile: Dict, original_total_price: float, k: int = 3,
+    deadline: Optional[Deadline] = None, booking_id: Optional[str] = None,
+) -> List[DealRow]:
     """
     Opzionale: ranking via LLM; per ora lo teniamo, ma se vuoi puoi toglierlo.
+
+    Con una deadline la chiamata ha solo il budget rimasto (max
+    RERANK_MAX_SECONDS): se non risponde in tempo si usa rank_rows.
     """
     if not deals:
         return []
 
-    # Summary veicoli (testuale)
-    vehicles_summary = []
-    for i, deal in enumerate(deals):
-        v = deal["vehicle"]
-        p = deal["pricing"]
-        tags = []
-        if v.get("isNewCar"):
-            tags.append("New")
-        if v.get("isRecommended"):
-            tags.append("Recommended")
-        if v.get("isMoreLuxury"):
-            tags.append("Luxury")
-        tags_str = f" [{', '.join(tags)}]" if tags else ""
-
-        vehicles_summary.append(
-            f"{i+1}. {v['brand']} {v['model']} - "
-            f"{v.get('groupType','')}, {v['passengersCount']} seats, "
-            f"{v['bagsCount']} bags, {v['transmissionType']}, "
-            f"{v['fuelType']}, €{p['displayPrice']['amount']}/day "
-            f"(€{p['totalPrice']['amount']} total){tags_str}"
-        )
+    # Summary veicoli (testuale); le righe sono renderizzate una volta per booking
+    if booking_id is not None:
+        lines = step_context.vehicle_lines(booking_id, [row.deal for row in deals], _vehicle_line)
+    else:
+        lines = [_vehicle_line(row.deal) for row in deals]
+    vehicles_summary = [f"{i+1}. {line}" for i, line in enumerate(lines)]
 
     profile_parts = []
     if profile.get("passengers"):
@@ -230,100 +297,110 @@ Instructions:
 Respond with ONLY the top {k} vehicle numbers in order, comma-separated (e.g., "3,7,1").
 Best match first, worst of the top {k} last."""
 
+    if deadline is not None:
+        return _llm_rerank_within(deals, profile, original_total_price, k, prompt, deadline)
+
     try:
-        response = llm.invoke([{"role": "user", "content": prompt}])
-        indices = [int(x.strip()) - 1 for x in response.content.strip().split(",")]
-        result = []
-        for i in indices[:k]:
-            if 0 <= i < len(deals):
-                result.append(deals[i])
-        return result or deals[:k]
+        return _llm_rerank(deals, prompt, k, get_llm())
     except Exception:
-        return rank_deals(deals, profile, original_total_price, k)
+        return rank_rows(deals, profile, original_total_price, k)
 
 
-def hybrid_rank_deals(deals: List[Dict], profile: Dict, original_total_price: float, k: int = 3) -> List[Dict]:
-    """
-    Filtra + ranking (come nello script del teammate).
-    """
-    filtered = []
-    for deal in deals:
-        v = deal["vehicle"]
-        p = deal["pricing"]
+# Il re-rank con deadline gira qui, così possiamo smettere di aspettarlo
+_rerank_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rerank")
 
-        if profile.get("passengers") and v["passengersCount"] < profile["passengers"]:
-            continue
-        if profile.get("budget_total"):
-            if p["totalPrice"]["amount"] > profile["budget_total"] * 1.5:
-                continue
-        if profile.get("luggage") == "many" and v["bagsCount"] < 3:
-            continue
 
-        filtered.append(deal)
+def _llm_rerank_within(
+    deals: List[DealRow], profile: Dict, original_total_price: float, k: int, prompt: str, deadline: Deadline
+) -> List[DealRow]:
+    rule_result = rank_rows(deals, profile, original_total_price, k)
+    if deadline.paths.get("agent") == "template":
+        # Turno senza LLM (slot filling): niente re-rank
+        deadline.record("rerank", "rules_template")
+        return rule_result
+    if deadline.remaining() < RERANK_MIN_BUDGET:
+        deadline.record("rerank", "rules_no_budget")
+        return rule_result
 
-    if not filtered:
-        filtered = deals
+    timeout = deadline.timeout_for(RERANK_MAX_SECONDS)
+    future = _rerank_pool.submit(_llm_rerank, deals, prompt, k, get_rerank_llm(timeout), timeout)
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        deadline.record("rerank", "rules_timeout")
+        return rule_result
+    except LLMOverloaded:
+        deadline.record("rerank", "rules_shed")
+        return rule_result
+    except Exception:
+        deadline.record("rerank", "rules_error")
+        return rule_result
+
+    deadline.record("rerank", "llm")
+    return result
+
+
+def _llm_rerank(deals: List[DealRow], prompt: str, k: int, llm, max_wait: Optional[float] = None) -> List[DealRow]:
+    response = invoke_llm(llm, [{"role": "user", "content": prompt}], max_wait)
+    indices = [int(x.strip()) - 1 for x in response.content.strip().split(",")]
+    result = []
+    for i in indices[:k]:
+        if 0 <= i < len(deals):
+            result.append(deals[i])
+    return result or deals[:k]
+
+
+def hybrid_rank_deals(
+    deals: List[DealRow], profile: Dict, original_total_price: float, k: int = 3,
+    deadline: Optional[Deadline] = None, booking_id: Optional[str] = None,
+) -> List[DealRow]:
+    """
+    Filtra + ranking (come nello script del teammate).
+    """
+    filtered = filter_rows(deals, profile)
 
     if len(filtered) <= 5:
-        return llm_rank_all_deals_batch(filtered, profile, original_total_price, k)
+        return llm_rank_all_deals_batch(filtered, profile, original_total_price, k, deadline, booking_id)
     elif len(filtered) <= 15:
-        rule_top = rank_deals(filtered, profile, original_total_price, k=10)
-        return llm_rank_all_deals_batch(rule_top, profile, original_total_price, k)
+        rule_top = rank_rows(filtered, profile, original_total_price, k=10)
+        return llm_rank_all_deals_batch(rule_top, profile, original_total_price, k, deadline, booking_id)
     else:
-        return rank_deals(filtered, profile, original_total_price, k)
+        if deadline is not None:
+            deadline.record("rerank", "rules_large_set")
+        return rank_rows(filtered, profile, original_total_price, k)
 
 # ------------------- TOOL: get_top_upsell_deals -------------------
 
-@tool("get_top_upsell_deals")
-def get_top_upsell_deals(booking_id: str, user_message: str) -> str:
-    """
-    Tool chiamato dall'LLM per ottenere le top 3 offerte reali (deals) da SIXT
-    per quella prenotazione e quel messaggio utente.
-
-    Ritorna una lista JSON di oggetti:
-    [
-      {
-        "vehicle_id": "...",
-        "score": 6.5,
-        "reason": "SKODA ENYAQ (SUV) · 5 seats · automatic ...",
-      },
-      ...
-    ]
-    """
+def _vehicle_context(booking_id: str, user_message: str) -> Tuple[List[DealRow], Dict, float]:
+    """(deals come DealRow, profilo aggiornato col messaggio, prezzo originale); deals vuoto se non ce ne sono."""
     client = SixtApiClient()
 
-    # Prendiamo i deals GREZZI dalla Sixt API (non pydantic)
-    url = client._url(f"/api/booking/{booking_id}/vehicles")
-    import requests
-    resp = requests.get(url, timeout=5)
-    resp.raise_for_status()
-    data = resp.json()
-    deals = data.get("deals", [])
+    # Le righe sono costruite una volta per payload /vehicles (vehicle_store);
+    # passa dal single-flight del client, quindi /chat riusa la stessa risposta
+    deals = client.get_vehicle_catalog(booking_id).rows
 
     if not deals:
-        return json.dumps([])
+        return [], {}, 0.0
 
     original_total_price = next(
-        (
-            d["pricing"]["totalPrice"]["amount"]
-            for d in deals
-            if d.get("dealInfo") == "BOOKED_CATEGORY"
-        ),
-        deals[0]["pricing"]["totalPrice"]["amount"],
+        (row.total for row in deals if row.deal.get("dealInfo") == "BOOKED_CATEGORY"),
+        deals[0].total,
     )
 
     # Profilo CUMULATIVO per questo booking
     profile = get_profile_for_booking(booking_id, original_total_price)
     profile = update_profile_from_text(profile, user_message)
     print(f"[Profile for {booking_id}] {profile}") # Just for debugging
+    return deals, profile, original_total_price
 
-    top_deals = hybrid_rank_deals(deals, profile, original_total_price, k=3)
 
+def _recommendations(top_deals: List[DealRow], profile: Dict, original_total_price: float) -> List[Dict]:
+    """Deals -> [{"vehicle_id", "score", "reason"}], il formato di get_top_upsell_deals."""
     results = []
-    for d in top_deals:
-        v = d["vehicle"]
-        p = d["pricing"]
-        score = score_deal(d, profile, original_total_price)
+    for row in top_deals:
+        v = row.deal["vehicle"]
+        p = row.deal["pricing"]
+        score = score_row(row, profile, original_total_price)
 
         parts = [f"{v['brand']} {v['model']} ({v.get('groupType','')})"]
         parts.append(f"{v['passengersCount']} seats")
@@ -351,37 +428,156 @@ def get_top_upsell_deals(booking_id: str, user_message: str) -> str:
                 "reason": reason,
             }
         )
+    return results
+
+
+def _top_upsell_deals(booking_id: str, user_message: str, deadline: Optional[Deadline] = None) -> str:
+    """
+    Corpo di get_top_upsell_deals; run_vehicle_chat lo chiama direttamente
+    per passare la deadline del turno.
+    """
+    deals, profile, original_total_price = _vehicle_context(booking_id, user_message)
+    if not deals:
+        return json.dumps([])
 
-    return json.dumps(results, indent=2)
+    top_deals = hybrid_rank_deals(deals, profile, original_total_price, k=3, deadline=deadline, booking_id=booking_id)
+    return json.dumps(_recommendations(top_deals, profile, original_total_price), indent=2)
 
 
-# LLM con tool associato
-llm_with_tools = llm.bind_tools([get_top_upsell_deals])
+def get_top_upsell_deals(booking_id: str, user_message: str) -> str:
+    """
+    Tool chiamato dall'LLM per ottenere le top 3 offerte reali (deals) da SIXT
+    per quella prenotazione e quel messaggio utente.
+
+    Ritorna una lista JSON di oggetti:
+    [
+      {
+        "vehicle_id": "...",
+        "score": 6.5,
+        "reason": "SKODA ENYAQ (SUV) · 5 seats · automatic ...",
+      },
+      ...
+    ]
+    """
+    return _top_upsell_deals(booking_id, user_message)
+
+
+# LLM con tool associato (costruito al primo uso)
+@lru_cache(maxsize=1)
+def get_llm_with_tools():
+    from langchain_core.tools import StructuredTool
+
+    upsell_tool = StructuredTool.from_function(get_top_upsell_deals, name="get_top_upsell_deals")
+    return get_llm().bind_tools([upsell_tool])
 
 # ------------------- Funzione principale da usare nel backend -------------------
 
 # ------------------- VEHICLE STEP -------------------
 
 
-def run_vehicle_chat(booking_id: str, user_message: str) -> dict:
+def vehicle_chat_mode(booking_id: str) -> str:
+    """
+    "two_call" o "single" per questo turno. Con VEHICLE_CHAT_MODE=ab lo split
+    è per booking (hash stabile), così un cliente resta sempre nello stesso ramo.
+    """
+    if VEHICLE_CHAT_MODE != "ab":
+        return VEHICLE_CHAT_MODE
+    bucket = int(hashlib.sha1(booking_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return "single" if bucket < VEHICLE_CHAT_AB_SHARE else "two_call"
+
+
+_vehicle_chat_lock = threading.Lock()
+_vehicle_chat_stats = {
+    mode: {"turns": 0, "fallbacks": 0, "reordered": 0, "latencies": deque(maxlen=256)}
+    for mode in ("two_call", "single")
+}
+
+
+def _observe_vehicle_chat(mode: str, started: float, fallback: bool = False, reordered: bool = False):
+    with _vehicle_chat_lock:
+        stats = _vehicle_chat_stats[mode]
+        stats["turns"] += 1
+        stats["fallbacks"] += fallback
+        stats["reordered"] += reordered
+        stats["latencies"].append(time.perf_counter() - started)
+
+
+def vehicle_chat_stats() -> dict:
+    """Confronto A/B dei due modi, esposto su /metrics."""
+    with _vehicle_chat_lock:
+        out = {}
+        for mode, stats in _vehicle_chat_stats.items():
+            latencies = sorted(stats["latencies"])
+            out[mode] = {
+                "turns": stats["turns"],
+                "fallbacks": stats["fallbacks"],
+                # Quante volte il modello ha cambiato l'ordine della shortlist a regole
+                "reordered": stats["reordered"],
+                "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+            }
+        return {"mode": VEHICLE_CHAT_MODE, **out}
+
+
+def _vehicle_messages(step_context: str, user_message: str) -> List[Dict]:
+    # Prompt per il modello: prompt lungo + contesto dello step + messaggio utente
+    return [
+        {"role": "system", "content": get_system_prompt()},
+        {"role": "system", "content": "You are currently in the VEHICLE SELECTION / UPGRADE step.\n" + step_context},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def _vehicle_answer(messages, user_message: str) -> str:
+    if LLM_HEDGE_ENABLED:
+        # L'hedge parte solo se ammesso subito
+        return _answer(messages, user_message, lambda: vehicle_chat_hedger.call(
+            lambda: invoke_llm(get_llm(), messages),
+            lambda: invoke_llm(get_backup_llm(), messages, max_wait=0),
+        ))
+    return _answer(messages, user_message)
+
+
+def run_vehicle_chat(booking_id: str, user_message: str, deadline: Optional[Deadline] = None) -> dict:
     """
-    Step auto (vehicle):
-    - Calcola SEMPRE le top offerte (via get_top_upsell_deals)
-    - Passa il risultato al modello come contesto
-    - Ritorna un dict:
+    Step auto (vehicle), in uno dei due modi (vehicle_chat_mode):
+    - two_call: top offerte via get_top_upsell_deals (con re-rank LLM), poi
+      una seconda chiamata per la risposta
+    - single:   shortlist a regole, poi UNA chiamata strutturata
+      (VehicleChatReply) che ordina la shortlist e scrive la risposta
+    Ritorna un dict:
         {
           "step": "vehicle",
           "answer": str,
-          "vehicle_recommendations": [ { "vehicle_id", "score", "reason" }, ... ]
+          "vehicle_recommendations": [ { "vehicle_id", "score", "reason" }, ... ],
+          "mode": "two_call" | "single",
         }
     """
+    started = time.perf_counter()
+    mode = vehicle_chat_mode(booking_id)
+    if deadline is not None:
+        deadline.record("vehicle_chat", mode)
+
+    # Messaggio con sole preferenze (slots.py): risposta template, quindi
+    # anche il re-rank resta a regole
+    extraction = slots.extract(user_message)
+    if extraction.confident and deadline is not None:
+        deadline.record("agent", "template")
+
+    if mode == "single":
+        result = _run_vehicle_chat_single(booking_id, user_message, extraction, deadline, started)
+    else:
+        result = _run_vehicle_chat_two_call(booking_id, user_message, extraction, deadline, started)
+        _observe_vehicle_chat("two_call", started)
+    return {**result, "mode": mode}
+
 
+def _run_vehicle_chat_two_call(
+    booking_id: str, user_message: str, extraction: slots.Extraction, deadline: Optional[Deadline], started: float
+) -> dict:
     # 1) Calcola SEMPRE le top deals usando il tool (ma lo chiamiamo noi)
     try:
-        tool_output_str = get_top_upsell_deals.invoke({
-            "booking_id": booking_id,
-            "user_message": user_message,
-        })
+        tool_output_str = _top_upsell_deals(booking_id, user_message, deadline)
     except Exception as e:
         print(f"[Warning] get_top_upsell_deals failed: {e}")
         tool_output_str = "[]"
@@ -392,7 +588,21 @@ def run_vehicle_chat(booking_id: str, user_message: str) -> dict:
         print(f"[Warning] failed to parse tool output as JSON: {e}")
         recs_data = []
 
-    # 2) Riassunto testuale delle raccomandazioni per il modello
+    if extraction.confident:
+        answer = slots.reply(extraction, profile_store.get(booking_id))
+        router.observe(router.Route("template", answer, "slots"), started)
+    else:
+        answer = _vehicle_answer(_vehicle_messages(_recs_context(recs_data), user_message), user_message)
+
+    return {
+        "step": "vehicle",
+        "answer": answer,
+        "vehicle_recommendations": recs_data,
+    }
+
+
+def _recs_context(recs_data: List[Dict]) -> str:
+    # Riassunto testuale delle raccomandazioni per il modello
     if recs_data:
         lines = ["Here are the top upgrade options for this customer:"]
         for i, r in enumerate(recs_data, start=1):
@@ -400,29 +610,94 @@ def run_vehicle_chat(booking_id: str, user_message: str) -> dict:
         recs_text = "\n".join(lines)
     else:
         recs_text = "No clear upgrade options could be determined for this booking."
+    return (
+        "The system has pre-computed the best matching upgrade options for this customer.\n"
+        "Use them to give concrete, honest recommendations.\n\n"
+        + recs_text
+    )
 
-    # 3) Prompt per il modello: prompt lungo + contesto + messaggio utente
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {
-            "role": "system",
-            "content": (
-                "You are currently in the VEHICLE SELECTION / UPGRADE step.\n"
-                "The system has pre-computed the best matching upgrade options for this customer.\n"
-                "Use them to give concrete, honest recommendations.\n\n"
-                + recs_text
-            ),
-        },
-        {"role": "user", "content": user_message},
+
+def _shortlist_context(shortlist_recs: List[Dict], k: int) -> str:
+    lines = [
+        "The system has pre-selected these upgrade options for this customer:",
+        "",
+    ]
+    for i, r in enumerate(shortlist_recs, start=1):
+        lines.append(f"{i}. {r['reason']}")
+    lines += [
+        "",
+        f"Pick the best {k} for this customer, best first, and put their numbers in `ranking`.",
+        "Write your reply in `answer`: concrete, honest recommendations of those options, in that order.",
     ]
+    return "\n".join(lines)
+
+
+def _pick(ranking: List[int], shortlist: List[DealRow], k: int) -> List[DealRow]:
+    """Ordine del modello (numeri 1-based), ripulito e completato con l'ordine a regole."""
+    picked = []
+    for n in ranking:
+        if 1 <= n <= len(shortlist) and n - 1 not in picked:
+            picked.append(n - 1)
+    picked += [i for i in range(len(shortlist)) if i not in picked]
+    return [shortlist[i] for i in picked[:k]]
+
 
-    resp = llm.invoke(messages)
-    answer = resp.content
+def _run_vehicle_chat_single(
+    booking_id: str, user_message: str, extraction: slots.Extraction, deadline: Optional[Deadline], started: float,
+    k: int = 3,
+) -> dict:
+    try:
+        deals, profile, original_total_price = _vehicle_context(booking_id, user_message)
+    except Exception as e:
+        print(f"[Warning] vehicle context failed: {e}")
+        deals, profile, original_total_price = [], {}, 0.0
+
+    shortlist = rank_rows(filter_rows(deals, profile), profile, original_total_price, k=VEHICLE_CHAT_SHORTLIST)
+    rule_top = _recommendations(shortlist[:k], profile, original_total_price)
 
+    if extraction.confident:
+        answer = slots.reply(extraction, profile_store.get(booking_id))
+        router.observe(router.Route("template", answer, "slots"), started)
+        _observe_vehicle_chat("single", started)
+        return {"step": "vehicle", "answer": answer, "vehicle_recommendations": rule_top}
+
+    shortlist_recs = _recommendations(shortlist, profile, original_total_price)
+    messages = _vehicle_messages(_shortlist_context(shortlist_recs, k), user_message)
+    model = getattr(get_llm(), "model_name", None)
+    try:
+        if not shortlist:
+            raise ValueError("no deals")
+        if LLM_HEDGE_ENABLED:
+            backup_model = getattr(get_backup_llm(), "model_name", None)
+            reply = vehicle_chat_hedger.call(
+                lambda: invoke_llm(get_vehicle_reply_llm(), messages, model=model),
+                lambda: invoke_llm(get_backup_vehicle_reply_llm(), messages, max_wait=0, model=backup_model),
+            )
+        else:
+            reply = invoke_llm(get_vehicle_reply_llm(), messages, model=model)
+    except LLMOverloaded as e:
+        print(f"[Warning] {e}")
+        if deadline is not None:
+            deadline.record("rerank", "rules_shed")
+        _observe_vehicle_chat("single", started, fallback=True)
+        return {"step": "vehicle", "answer": BUSY_ANSWER, "vehicle_recommendations": rule_top}
+    except Exception as e:
+        # Output non valido (o nessun deal): ranking a regole + risposta normale
+        print(f"[Warning] single-call vehicle chat failed: {e}")
+        if deadline is not None:
+            deadline.record("rerank", "rules_error")
+        answer = _vehicle_answer(_vehicle_messages(_recs_context(rule_top), user_message), user_message)
+        _observe_vehicle_chat("single", started, fallback=True)
+        return {"step": "vehicle", "answer": answer, "vehicle_recommendations": rule_top}
+
+    top = _pick(reply.ranking, shortlist, k)
+    if deadline is not None:
+        deadline.record("rerank", "single_call")
+    _observe_vehicle_chat("single", started, reordered=top != shortlist[:k])
     return {
         "step": "vehicle",
-        "answer": answer,
-        "vehicle_recommendations": recs_data,
+        "answer": reply.answer,
+        "vehicle_recommendations": _recommendations(top, profile, original_total_price),
     }
 
 # ------------------- HELPERS: protections & addons -------------------
@@ -481,6 +756,16 @@ def summarize_addons(addon_groups) -> str:
 
     return "\n".join(lines) if lines else "No addons available."
 
+
+def _protection_context(data: dict) -> Tuple[list, str]:
+    packages = parse_protection_packages(data)
+    return packages, summarize_protection_packages(packages)
+
+
+def _addons_context(data: dict) -> Tuple[list, str]:
+    addon_groups = parse_addons(data)
+    return addon_groups, summarize_addons(addon_groups)
+
 # ------------------- PROTECTION STEP -------------------
 
 def run_protection_chat(booking_id: str, user_message: str) -> dict:
@@ -503,11 +788,12 @@ def run_protection_chat(booking_id: str, user_message: str) -> dict:
     update_profile_from_text(profile, user_message)
     print(f"[Profile (protections) for {booking_id}] {profile}")
 
-    packages = client.get_available_protection_packages(booking_id)
-    protections_text = summarize_protection_packages(packages)
+    # Validati e renderizzati una volta per catalogo (step_context.py)
+    payload, fp = client.get_protection_packages_payload(booking_id)
+    packages, protections_text = step_context.get(booking_id, "protection", payload, fp, _protection_context)
 
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": get_system_prompt()},
         {
             "role": "system",
             "content": (
@@ -524,8 +810,7 @@ def run_protection_chat(booking_id: str, user_message: str) -> dict:
         {"role": "user", "content": user_message},
     ]
 
-    resp = llm.invoke(messages)
-    answer = resp.content
+    answer = _cached_answer("protection", protections_text, messages, user_message)
 
     return {
         "step": "protection",
@@ -555,11 +840,11 @@ def run_addons_chat(booking_id: str, user_message: str) -> dict:
     update_profile_from_text(profile, user_message)
     print(f"[Profile (addons) for {booking_id}] {profile}")
 
-    addon_groups = client.get_available_addons(booking_id)
-    addons_text = summarize_addons(addon_groups)
+    payload, fp = client.get_addons_payload(booking_id)
+    addon_groups, addons_text = step_context.get(booking_id, "addons", payload, fp, _addons_context)
 
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": get_system_prompt()},
         {
             "role": "system",
             "content": (
@@ -577,8 +862,7 @@ def run_addons_chat(booking_id: str, user_message: str) -> dict:
         {"role": "user", "content": user_message},
     ]
 
-    resp = llm.invoke(messages)
-    answer = resp.content
+    answer = _cached_answer("addons", addons_text, messages, user_message)
 
     return {
         "step": "addons",
@@ -589,7 +873,9 @@ def run_addons_chat(booking_id: str, user_message: str) -> dict:
 # ------------------- ROUTER GENERALE -------------------
 
 
-def run_sales_chat(booking_id: str, user_message: str, step: str = "vehicle") -> dict:
+def run_sales_chat(
+    booking_id: str, user_message: str, step: str = "vehicle", deadline: Optional[Deadline] = None
+) -> dict:
     """
     Router generale:
     - step == "vehicle"    -> run_vehicle_chat
@@ -597,11 +883,11 @@ def run_sales_chat(booking_id: str, user_message: str, step: str = "vehicle") ->
     - step == "addons"     -> run_addons_chat
     """
     if step == "vehicle":
-        return run_vehicle_chat(booking_id, user_message)
+        return run_vehicle_chat(booking_id, user_message, deadline)
     elif step == "protection":
         return run_protection_chat(booking_id, user_message)
     elif step == "addons":
         return run_addons_chat(booking_id, user_message)
     else:
         # fallback: torna allo step veicolo
-        return run_vehicle_chat(booking_id, user_message)
+        return run_vehicle_chat(booking_id, user_message, deadline)
@@ -1,9 +1,17 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sixt_client import SixtApiClient
-from models import Booking, Vehicle, ChatRequest, ChatResponse, SelectedVehicle, UserPreferences, ProtectionPackage, AddonGroup, VehicleRecommendation
+from sixt_client import SixtApiClient, singleflight_stats
+from models import Booking, Vehicle, ChatRequest, ChatResponse, SelectedVehicle, DealRef, UserPreferences, ProtectionPackage, AddonGroup, VehicleRecommendation
 #from recommendation import RecommendationService
-from llm_engine import run_sales_chat
+from llm_engine import run_sales_chat, vehicle_chat_hedger, vehicle_chat_stats
+from deadline import Deadline
+import tasks
+import admission
+import router
+import semantic_cache
+import step_context
+import vehicle_store
+import time
 
 import requests
 from config import SIXT_BASE_URL
@@ -87,6 +95,26 @@ def health():
     return {"status": "ok"}
 
 
+@app.on_event("startup")
+def replay_pending_tasks():
+    tasks.drain()
+
+
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "sixt_singleflight": singleflight_stats(),
+        "tasks": tasks.stats(),
+        "llm_hedging": {"vehicle_chat": vehicle_chat_hedger.stats()},
+        "llm_admission": admission.stats(),
+        "llm_router": router.stats(),
+        "vehicle_chat": vehicle_chat_stats(),
+        "answer_cache": semantic_cache.stats(),
+        "step_context": step_context.stats(),
+        "vehicle_store": vehicle_store.stats(),
+    }
+
+
 @app.get("/booking/{booking_id}", response_model=Booking)
 def get_booking(booking_id: str):
     try:
@@ -102,6 +130,14 @@ def get_booking_vehicles(booking_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/vehicles/{vehicle_ref}", response_model=Vehicle)
+def get_vehicle(vehicle_ref: str):
+    # Per i client con risposte compatte a cui manca un ref
+    vehicle = vehicle_store.get(vehicle_ref)
+    if vehicle is None:
+        raise HTTPException(status_code=404, detail="Unknown vehicle_ref")
+    return vehicle
+
 @app.get("/booking/{booking_id}/protections", response_model=list[ProtectionPackage])
 def get_booking_protections(booking_id: str):
     try:
@@ -169,6 +205,8 @@ def select_addons(booking_id: str, body: SelectAddonsRequest):
 
 @app.post("/chat", response_model=ChatResponse)
 def chat(req: ChatRequest):
+    started = time.perf_counter()
+    deadline = Deadline(started=started)
     booking_id = req.booking_id
     user_message = req.message
 
@@ -183,7 +221,7 @@ def chat(req: ChatRequest):
 
     # 2) Chiamiamo l'LLM in base allo step corrente
     try:
-        llm_result = run_sales_chat(booking_id, user_message, step=state.step.value)
+        llm_result = run_sales_chat(booking_id, user_message, step=state.step.value, deadline=deadline)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM error: {e}")
 
@@ -193,15 +231,18 @@ def chat(req: ChatRequest):
     # 3) Prepara i campi step-specifici
     available_vehicles: list[SelectedVehicle] = []
     recs: list[VehicleRecommendation] = []
+    deals: list[DealRef] = []
+    vehicles: dict[str, Vehicle] = {}
     protection_packages = None
     addons = None
 
     if step == "vehicle":
         # Servono i veicoli per mappare le raccomandazioni
         try:
-            available_vehicles = sixt_client.get_available_vehicles(booking_id)
+            catalog = sixt_client.get_vehicle_catalog(booking_id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Sixt API error: {e}")
+        available_vehicles = catalog.selected()
 
         recs_data = llm_result.get("vehicle_recommendations", [])
         by_id: dict[str, SelectedVehicle] = {
@@ -221,18 +262,37 @@ def chat(req: ChatRequest):
                 )
             )
 
+        if req.known_vehicles is not None:
+            # Risposta compatta: i dettagli solo dei veicoli nuovi per il client
+            deals = catalog.deals
+            vehicles = catalog.details(req.known_vehicles)
+            available_vehicles = []
+
     elif step == "protection":
         protection_packages = llm_result.get("protection_packages")
 
     elif step == "addons":
         addons = llm_result.get("addons")
 
+    # Analytics fuori dal percorso critico
+    tasks.enqueue(
+        "record_chat_turn",
+        booking_id=booking_id,
+        step=step,
+        latency_seconds=round(time.perf_counter() - started, 3),
+        answer_chars=len(answer),
+        variant=llm_result.get("mode"),
+    )
+
     return ChatResponse(
         answer=answer,
         booking=booking,
         step=step,
         available_vehicles=available_vehicles,
         recommendations=recs,
+        deals=deals,
+        vehicles=vehicles,
         protection_packages=protection_packages,
         addons=addons,
+        latency=deadline.summary(),
     )
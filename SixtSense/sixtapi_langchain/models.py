@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -60,6 +60,15 @@ class SelectedVehicle(BaseModel):
     tags: List[str] = []
 
 
+class DealRef(BaseModel):
+    """Un deal senza i dettagli del veicolo: quelli sono in vehicle_store sotto vehicle_ref."""
+    vehicle_ref: str
+    vehicle_id: str
+    pricing: VehiclePricing
+    dealInfo: Optional[str] = None
+    tags: List[str] = []
+
+
 class Booking(BaseModel):
     id: str
     bookedCategory: Optional[str] = None
@@ -162,6 +171,10 @@ class AddonGroup(BaseModel):
 class ChatRequest(BaseModel):
     booking_id: str
     message: str
+    # None: available_vehicles completi come prima. Una lista (anche vuota)
+    # di vehicle_ref già ricevuti: risposta compatta (deals + solo i
+    # veicoli che il client non ha ancora)
+    known_vehicles: Optional[List[str]] = None
 
 
 class ChatResponse(BaseModel):
@@ -172,6 +185,10 @@ class ChatResponse(BaseModel):
     # Step vehicle
     available_vehicles: List[SelectedVehicle] = []
     recommendations: List[VehicleRecommendation] = []
+    # Risposta compatta (known_vehicles): id e prezzi per deal, dettagli
+    # per vehicle_ref solo se nuovi per il client
+    deals: List[DealRef] = []
+    vehicles: Dict[str, Vehicle] = {}
 
     # Step protections
     protection_packages: list[ProtectionPackage] | None = None
@@ -179,3 +196,11 @@ class ChatResponse(BaseModel):
     # Step addons
     addons: list[AddonGroup] | None = None
 
+    # Budget di latenza del turno e percorso di ranking usato (vedi deadline.py)
+    latency: dict | None = None
+
+
+# Output strutturato della chiamata unica dello step vehicle (VEHICLE_CHAT_MODE=single)
+class VehicleChatReply(BaseModel):
+    ranking: List[int] = Field(description="Numbers of the best shortlist options, best first")
+    answer: str = Field(description="Reply to the customer")
@@ -0,0 +1,80 @@
+# router.py
+"""
+Routing locale dei messaggi per complessità, senza rete.
+
+- "template": ringraziamenti / saluti -> risposta fissa, nessuna chiamata LLM
+              (lo step vehicle aggiunge i messaggi con sole preferenze, slots.py)
+- "small":    "ok", "yes", messaggi di 1-3 parole senza domanda -> LLM_SMALL_MODEL
+- "default":  tutto il resto -> get_llm() (gpt-4o)
+
+stats() riporta le decisioni e la latenza risparmiata rispetto alla
+mediana dei turni "default"; esposto su /metrics.
+"""
+import re
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from config import LLM_ROUTER
+
+_THANKS = re.compile(r"^(ok(ay)?[,!. ]*)?(thanks?( you)?( so much| a lot)?|thx|ty|cheers|danke|grazie)[!. ]*$")
+_GREETING = re.compile(r"^(hi|hey|hello|hallo|ciao|good (morning|afternoon|evening))( there)?[!. ]*$")
+_ACK = re.compile(r"^(ok(ay)?|yes|yeah|yep|sure|fine|great|perfect|cool|sounds good|no|nope)[!. ]*$")
+
+TEMPLATES = {
+    "thanks": "You're welcome! If anything else comes up about your rental, just ask.",
+    "greeting": "Hi! Tell me a bit about your trip and I'll suggest the best options for you.",
+}
+
+
+class Route:
+    def __init__(self, tier: str, reply: Optional[str] = None, intent: str = "chat"):
+        self.tier = tier
+        self.reply = reply
+        self.intent = intent
+
+
+def classify(message: str) -> Route:
+    text = " ".join(message.lower().split())
+    if not LLM_ROUTER:
+        return Route("default")
+    if _THANKS.match(text):
+        return Route("template", TEMPLATES["thanks"], "thanks")
+    if _GREETING.match(text):
+        return Route("template", TEMPLATES["greeting"], "greeting")
+    if _ACK.match(text) or (len(text.split()) <= 3 and "?" not in text):
+        return Route("small")
+    return Route("default")
+
+
+_lock = threading.Lock()
+_counts = {"template": 0, "small": 0, "default": 0}
+_latencies = {tier: deque(maxlen=256) for tier in _counts}
+_intents = {}
+_saved = 0.0
+
+
+def observe(route: Route, started: float):
+    global _saved
+    seconds = time.perf_counter() - started
+    with _lock:
+        _counts[route.tier] += 1
+        _intents[route.intent] = _intents.get(route.intent, 0) + 1
+        _latencies[route.tier].append(seconds)
+        default = sorted(_latencies["default"])
+        # Risparmio stimato rispetto alla mediana dei turni "default"
+        if route.tier != "default" and default:
+            _saved += max(0.0, default[len(default) // 2] - seconds)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "routes": dict(_counts),
+            "intents": dict(_intents),
+            "saved_seconds": round(_saved, 3),
+            "latency_p50": {
+                tier: round(sorted(v)[len(v) // 2], 3) if v else None for tier, v in _latencies.items()
+            },
+        }
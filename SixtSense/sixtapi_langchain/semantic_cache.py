@@ -0,0 +1,212 @@
+# semantic_cache.py
+"""
+Cache semantica delle risposte alle domande ricorrenti degli step
+protection / addons ("what does Peace of Mind cover", "is the deductible
+zero", "do I need a child seat").
+
+Le domande sono trasformate in vettori in locale, su CPU, senza modelli da
+scaricare: hashing vectorizer su parole, coppie di parole e trigrammi di
+caratteri, con segno e normalizzato (stesso schema di
+ai_engine/ai/semantic_cache.py nel backend). Una domanda è servita dalla
+cache se una domanda già vista con la stessa fingerprint (step + testo del
+catalogo + fatti detti nella domanda, slots.py) ha similarità coseno
+>= ANSWER_CACHE_THRESHOLD. Le voci scadono dopo ANSWER_CACHE_TTL secondi;
+oltre ANSWER_CACHE_SIZE voci si elimina la meno usata di recente.
+
+Anche numeri e cose nominate nella domanda (entities(): livelli dei
+pacchetti, addon, ...) devono coincidere esattamente: "is the deductible
+zero for the premium package" non riceve mai la risposta del pacchetto
+basic (similarità 0.87).
+
+Solo le domande passano dalla cache; BUSY_ANSWER non viene mai salvata.
+stats() è esposto su /metrics.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+import slots
+from config import ANSWER_CACHE, ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL
+
+DIM = 2 ** 12
+
+_WORD = re.compile(r"\w+")
+# Parole che non cambiano la domanda
+_NOISE = {
+    "please", "pls", "hi", "hello", "hey", "thanks", "thank", "you", "ok", "so", "just", "quick", "question",
+    "bitte", "hallo", "danke", "mal", "eigentlich",
+    "ciao", "grazie", "per", "favore", "scusa",
+}
+_QUESTION = re.compile(
+    r"\?|^(what|which|how|is|are|do|does|can|could|should|will|would|why|when|where|"
+    r"was|welche[rsn]?|wie|ist|sind|brauche|brauchen|kann|muss|gibt|"
+    r"cosa|che|quale|quali|come|quanto|quanta|è|serve|posso|devo)\b"
+)
+
+# Cose nominate di cui può parlare una domanda: se due domande differiscono
+# in una di queste o in un numero sono domande diverse, per quanto simile
+# sia il resto del testo
+_ENTITIES = [
+    ("peace_of_mind", r"peace of mind"),
+    ("basic", r"basic|basis|base"),
+    ("smart", r"smart"),
+    ("premium", r"premium"),
+    ("full", r"full|complete|vollkasko|completa|completo"),
+    ("child_seat", r"child seats?|baby seats?|kindersitze?|babyschale|seggiolin[oi]"),
+    ("booster", r"boosters?|sitzerhöhung|rialzo"),
+    ("navigation", r"gps|navigation|navi|sat ?nav|navigatore"),
+    ("additional_driver", r"(?:additional|second|extra) drivers?|zusatzfahrer|zweiter fahrer|secondo (?:conducente|guidatore)"),
+    ("snow_chains", r"snow chains|schneeketten|catene(?: da neve)?"),
+    ("winter_tyres", r"winter (?:tyres|tires|wheels)|winterreifen|(?:gomme|pneumatici) invernali"),
+    ("tyres", r"tyres?|tires?|reifen|gomme|pneumatici"),
+    ("glass", r"glass|windscreen|windshield|glas|scheiben?|vetri|parabrezza"),
+    ("theft", r"theft|stolen|diebstahl|furto"),
+]
+# "one" / "ein" / "uno" sono anche articoli ("which one"): esclusi
+_NUMBER_WORDS = {
+    "zero": 0, "null": 0,
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "zwei": 2, "drei": 3, "vier": 4, "fünf": 5, "sechs": 6, "sieben": 7, "acht": 8, "neun": 9, "zehn": 10,
+    "due": 2, "tre": 3, "quattro": 4, "cinque": 5, "sei": 6, "sette": 7, "otto": 8, "nove": 9, "dieci": 10,
+}
+_ENTITY = re.compile(
+    r"(?<!\w)(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in _ENTITIES)
+    + r"|(?P<number>\d+(?:[.,]\d+)?|" + "|".join(_NUMBER_WORDS) + r"))(?!\w)"
+)
+
+
+def normalize(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(w for w in _WORD.findall(text) if w not in _NOISE)
+
+
+def _features(text: str):
+    words = text.split()
+    yield from words
+    yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"<{word}>"
+        yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def embed(question: str) -> np.ndarray:
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature in _features(normalize(question)):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Bit bassi -> bucket, bit alto -> segno (le collisioni si compensano)
+        vector[h % DIM] += 1.0 if h >> 31 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def entities(question: str) -> str:
+    """Numeri e cose nominate nella domanda, come chiave da confrontare esattamente."""
+    found = set()
+    for match in _ENTITY.finditer(unicodedata.normalize("NFKC", question).lower()):
+        if match.lastgroup == "number":
+            value = match.group()
+            found.add(str(_NUMBER_WORDS[value]) if value in _NUMBER_WORDS else value.replace(",", "."))
+        else:
+            found.add(match.lastgroup)
+    return "|".join(sorted(found))
+
+
+def fingerprint(step: str, context: str, question: str) -> str:
+    raw = json.dumps([step, context, slots.extract(question).slots, entities(question)], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # Una riga per voce; righe vuote o scadute non matchano mai
+        self._vectors = np.zeros((max_entries, DIM), dtype=np.float32)
+        self._fingerprints = np.full(max_entries, "", dtype=object)
+        self._expires = np.zeros(max_entries)
+        self._answers = [None] * max_entries
+        # Righe in uso, dalla meno usata di recente
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    def get(self, question: str, fp: str) -> Optional[Any]:
+        vector = embed(question)
+        with self._lock:
+            live = (self._fingerprints == fp) & (self._expires > time.monotonic())
+            if vector.any() and live.any():
+                similarity = np.where(live, self._vectors @ vector, -1.0)
+                row = int(similarity.argmax())
+                if similarity[row] >= self.threshold:
+                    self._lru.move_to_end(row)
+                    self._counts["hits"] += 1
+                    return self._answers[row]
+            self._counts["misses"] += 1
+        return None
+
+    def put(self, question: str, fp: str, answer: Any):
+        vector = embed(question)
+        if not vector.any():
+            return
+        with self._lock:
+            row = self._free_row()
+            self._vectors[row] = vector
+            self._fingerprints[row] = fp
+            self._expires[row] = time.monotonic() + self.ttl
+            self._answers[row] = answer
+            self._lru[row] = None
+            self._counts["stored"] += 1
+
+    def _free_row(self) -> int:
+        if len(self._lru) < self.max_entries:
+            return next(i for i in range(self.max_entries) if i not in self._lru)
+        # Piena: prima una voce scaduta, altrimenti la meno usata di recente
+        now = time.monotonic()
+        expired = [row for row in self._lru if self._expires[row] <= now]
+        row = expired[0] if expired else next(iter(self._lru))
+        del self._lru[row]
+        self._counts["evicted"] += 1
+        return row
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {
+                **self._counts,
+                "size": len(self._lru),
+                "hit_rate": round(self._counts["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+_cache = SemanticCache()
+
+
+def _cacheable(question: str) -> bool:
+    return ANSWER_CACHE and bool(_QUESTION.search(" ".join(question.lower().split())))
+
+
+def lookup(step: str, context: str, question: str) -> Optional[str]:
+    """Risposta già data a una domanda simile sullo stesso catalogo, o None."""
+    if not _cacheable(question):
+        return None
+    return _cache.get(question, fingerprint(step, context, question))
+
+
+def store(step: str, context: str, question: str, answer: str):
+    if _cacheable(question):
+        _cache.put(question, fingerprint(step, context, question), answer)
+
+
+def stats() -> dict:
+    return {"enabled": ANSWER_CACHE, "threshold": _cache.threshold, **_cache.stats()}
@@ -0,0 +1,98 @@
+# singleflight.py
+"""
+Request coalescing for SixtApiClient GETs.
+
+Concurrent calls with the same key share one upstream request and its
+result. A finished result is kept for `linger` seconds, so the repeated
+fetches inside a single /chat call reuse it as well.
+
+With lock_dir set, leaders in different processes also serialize on a
+per-key flock (they still each do their own request once they get the lock).
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+
+
+class SingleFlight:
+    def __init__(self, linger: float = 0.0, lock_dir: Optional[str] = None):
+        self.linger = linger
+        self.lock_dir = lock_dir
+        self.calls = 0
+        self.coalesced = 0
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def _process_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        with open(os.path.join(self.lock_dir, f"{digest}.lock"), "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def forget(self, prefix: str):
+        """Drop lingering results whose key starts with prefix (after writes)."""
+        with self._lock:
+            for key in [k for k, c in self._calls.items() if k.startswith(prefix) and c.done.is_set()]:
+                del self._calls[key]
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, c in self._calls.items() if c.done.is_set() and now - c.finished_at > self.linger]:
+            del self._calls[key]
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and time.monotonic() - call.finished_at > self.linger:
+                call = None
+            leader = call is None
+            if leader:
+                self._purge_expired()
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(key):
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            with self._lock:
+                if (call.error is not None or not self.linger) and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced}
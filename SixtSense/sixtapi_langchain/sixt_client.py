@@ -1,7 +1,29 @@
-from typing import List
+import hashlib
+from typing import Any, List, Tuple
 import requests
-from config import SIXT_BASE_URL
+from config import SIXT_BASE_URL, SIXT_SINGLEFLIGHT_LINGER, SIXT_SINGLEFLIGHT_LOCK_DIR
 from models import Booking, SelectedVehicle, ProtectionPackage, AddonGroup
+from singleflight import SingleFlight
+import step_context
+import vehicle_store
+
+# Condiviso da tutte le istanze del client: GET identici e concorrenti
+# fanno una sola richiesta a SIXT
+_flight = SingleFlight(linger=SIXT_SINGLEFLIGHT_LINGER, lock_dir=SIXT_SINGLEFLIGHT_LOCK_DIR)
+
+
+def singleflight_stats() -> dict:
+    return _flight.stats()
+
+
+def parse_protection_packages(data: dict) -> List[ProtectionPackage]:
+    packages = data.get("protectionPackages", [])
+    return [ProtectionPackage.model_validate(p) for p in packages]
+
+
+def parse_addons(data: dict) -> List[AddonGroup]:
+    groups = data.get("addons", [])
+    return [AddonGroup.model_validate(g) for g in groups]
 
 
 class SixtApiClient:
@@ -11,51 +33,61 @@ class SixtApiClient:
     def _url(self, path: str) -> str:
         return f"{self.base_url}{path}"
 
+    def _get(self, path: str) -> Tuple[Any, str]:
+        """(JSON, sha1 del body): il body è hashato una volta per richiesta HTTP."""
+        url = self._url(path)
+
+        def fetch():
+            resp = requests.get(url, timeout=5)
+            resp.raise_for_status()
+            return resp.json(), hashlib.sha1(resp.content).hexdigest()
+
+        return _flight.do(url, fetch)
+
+    def _get_json(self, path: str):
+        return self._get(path)[0]
+
+    def _forget_booking(self, booking_id: str):
+        _flight.forget(self._url(f"/api/booking/{booking_id}"))
+        # Con un'altra auto / protection cambiano i pacchetti e i prezzi
+        step_context.invalidate(booking_id)
+        vehicle_store.invalidate(booking_id)
+
     def get_booking(self, booking_id: str) -> Booking:
-        url = self._url(f"/api/booking/{booking_id}")
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
+        data = self._get_json(f"/api/booking/{booking_id}")
         return Booking.model_validate(data)
 
-    def get_available_vehicles(self, booking_id: str) -> List[SelectedVehicle]:
-        url = self._url(f"/api/booking/{booking_id}/vehicles")
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
+    def get_available_vehicles_raw(self, booking_id: str) -> dict:
+        return self._get_json(f"/api/booking/{booking_id}/vehicles")
 
-        # data è un dict con chiave "deals"
-        deals = data.get("deals", [])
-        if not isinstance(deals, list):
-            raise ValueError(
-                f"Unexpected /vehicles response shape: 'deals' is not a list (type={type(deals)})"
-            )
+    def get_vehicle_catalog(self, booking_id: str) -> vehicle_store.Catalog:
+        """Deals del booking come riferimenti allo store condiviso dei veicoli."""
+        data, fp = self._get(f"/api/booking/{booking_id}/vehicles")
+        return vehicle_store.catalog(booking_id, data, fp)
 
-        return [SelectedVehicle.model_validate(d) for d in deals]
+    def get_available_vehicles(self, booking_id: str) -> List[SelectedVehicle]:
+        return self.get_vehicle_catalog(booking_id).selected()
 
     def assign_vehicle(self, booking_id: str, vehicle_id: str) -> Booking:
         url = self._url(f"/api/booking/{booking_id}/vehicles/{vehicle_id}")
         resp = requests.post(url, timeout=5)
         resp.raise_for_status()
+        self._forget_booking(booking_id)
         return Booking.model_validate(resp.json())
     
+    def get_protection_packages_payload(self, booking_id: str) -> Tuple[dict, str]:
+        """(payload grezzo, fingerprint del payload)."""
+        return self._get(f"/api/booking/{booking_id}/protections")
+
     def get_available_protection_packages(self, booking_id: str) -> list[ProtectionPackage]:
-        url = self._url(f"/api/booking/{booking_id}/protections")
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
+        return parse_protection_packages(self.get_protection_packages_payload(booking_id)[0])
 
-        packages = data.get("protectionPackages", [])
-        return [ProtectionPackage.model_validate(p) for p in packages]
+    def get_addons_payload(self, booking_id: str) -> Tuple[dict, str]:
+        """(payload grezzo, fingerprint del payload)."""
+        return self._get(f"/api/booking/{booking_id}/addons")
 
     def get_available_addons(self, booking_id: str) -> list[AddonGroup]:
-        url = self._url(f"/api/booking/{booking_id}/addons")
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-
-        groups = data.get("addons", [])
-        return [AddonGroup.model_validate(g) for g in groups]
+        return parse_addons(self.get_addons_payload(booking_id)[0])
 
     def assign_protection_package(self, booking_id: str, package_id: str) -> Booking:
         """
@@ -65,6 +97,7 @@ class SixtApiClient:
         url = self._url(f"/api/booking/{booking_id}/protections/{package_id}")
         resp = requests.post(url, timeout=5)
         resp.raise_for_status()
+        self._forget_booking(booking_id)
         return Booking.model_validate(resp.json())
 
 
@@ -72,6 +105,7 @@ class SixtApiClient:
         url = self._url(f"/api/booking/{booking_id}/complete")
         resp = requests.post(url, timeout=5)
         resp.raise_for_status()
+        self._forget_booking(booking_id)
         return Booking.model_validate(resp.json())
 
     def lock_car(self):
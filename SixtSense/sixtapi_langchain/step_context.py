@@ -0,0 +1,98 @@
+# step_context.py
+"""
+Blocchi di contesto degli step renderizzati una volta sola.
+
+Il testo dei protection packages / addons (e le righe dei veicoli del
+re-rank) cambia solo quando cambia il catalogo del booking, non a ogni
+messaggio. Qui è tenuto per (booking, step) insieme alla fingerprint del
+payload SIXT da cui è stato costruito (sha1 del body HTTP, calcolato da
+SixtApiClient una volta per richiesta): finché la fingerprint è la stessa
+si riusa il risultato (anche gli oggetti pydantic già validati), senza
+rifare né la validazione né il rendering.
+
+SixtApiClient chiama invalidate() dopo ogni scrittura sul booking
+(assegnazione veicolo / protection, complete): i pacchetti disponibili
+dipendono dall'auto scelta.
+
+Il rendering è deterministico (stesso payload -> stessi byte), così il
+prefisso dei messaggi (system prompt + contesto dello step) resta identico
+fra i turni e compone con il prompt caching del provider.
+stats() è esposto su /metrics.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import STEP_CONTEXT_CACHE_SIZE
+
+_lock = threading.Lock()
+# (booking_id, step) -> (fingerprint, valore); dalla voce meno usata di recente
+_cache: "OrderedDict[Tuple[str, str], Tuple[str, Any]]" = OrderedDict()
+_counts = {"hits": 0, "misses": 0, "invalidations": 0, "evicted": 0}
+
+
+def _store(key: Tuple[str, str], fp: str, value: Any):
+    with _lock:
+        _cache[key] = (fp, value)
+        _cache.move_to_end(key)
+        while len(_cache) > STEP_CONTEXT_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _counts["evicted"] += 1
+
+
+def get(booking_id: str, step: str, payload: Any, fp: str, render: Callable[[Any], Any]) -> Any:
+    """render(payload), riusato finché la fingerprint del payload per (booking, step) non cambia."""
+    key = (booking_id, step)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == fp:
+            _cache.move_to_end(key)
+            _counts["hits"] += 1
+            return entry[1]
+        _counts["misses"] += 1
+
+    value = render(payload)
+    _store(key, fp, value)
+    return value
+
+
+def _deal_key(deal: Dict) -> Tuple:
+    # Stessi campi della fingerprint del catalogo nel backend (ai_engine/catalog.py)
+    return (
+        deal["vehicle"]["id"],
+        deal["pricing"]["totalPrice"]["amount"],
+        deal["pricing"]["displayPrice"]["amount"],
+        deal.get("dealInfo") or "",
+    )
+
+
+def vehicle_lines(booking_id: str, deals: List[Dict], render: Callable[[Dict], str]) -> List[str]:
+    """
+    render(deal) per ogni deal. Il re-rank vede sottoinsiemi diversi del
+    catalogo a ogni turno, quindi qui la cache è per riga (veicolo + prezzo).
+    """
+    key = (booking_id, "vehicles")
+    with _lock:
+        entry = _cache.get(key)
+        lines = dict(entry[1]) if entry is not None else {}
+
+    missing = [deal for deal in deals if _deal_key(deal) not in lines]
+    with _lock:
+        _counts["hits"] += len(deals) - len(missing)
+        _counts["misses"] += len(missing)
+    if missing:
+        lines.update((_deal_key(deal), render(deal)) for deal in missing)
+        _store(key, "", lines)
+    return [lines[_deal_key(deal)] for deal in deals]
+
+
+def invalidate(booking_id: str):
+    with _lock:
+        for key in [key for key in _cache if key[0] == booking_id]:
+            del _cache[key]
+        _counts["invalidations"] += 1
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_counts, "size": len(_cache)}
@@ -0,0 +1,160 @@
+# tasks.py
+"""
+Local task queue for non-critical work of the FastAPI handlers.
+
+No broker: tasks are written to a SQLite outbox (TASKS_DB) and executed by a
+small thread pool. Pending rows left behind by a crash are replayed by
+drain() at startup.
+
+    @task("record_chat_turn")
+    def record_chat_turn(**kwargs): ...
+
+    enqueue("record_chat_turn", booking_id="...", step="vehicle")
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+TASKS_DB = os.getenv("TASKS_DB", str(Path(__file__).parent / "tasks.sqlite3"))
+MAX_ATTEMPTS = int(os.getenv("TASKS_MAX_ATTEMPTS", "3"))
+
+_registry: Dict[str, Callable] = {}
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TASKS_WORKERS", "2")), thread_name_prefix="tasks")
+
+_lock = threading.Lock()
+_in_flight = 0
+_latencies = deque(maxlen=1024)
+_db_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(TASKS_DB, timeout=5, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " name TEXT NOT NULL,"
+        " payload TEXT NOT NULL,"
+        " status TEXT NOT NULL DEFAULT 'pending',"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " finished_at REAL)"
+    )
+    return conn
+
+
+_conn = _connect()
+
+
+def _db(sql: str, params: tuple = ()) -> list:
+    with _db_lock, _conn:
+        return _conn.execute(sql, params).fetchall()
+
+
+def task(name: str):
+    def decorator(fn):
+        _registry[name] = fn
+        return fn
+    return decorator
+
+
+def _submit(task_id: int):
+    global _in_flight
+    with _lock:
+        _in_flight += 1
+    _executor.submit(_execute, task_id)
+
+
+def enqueue(name: str, **payload) -> int:
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+    with _db_lock, _conn:
+        cur = _conn.execute(
+            "INSERT INTO outbox (name, payload, created_at) VALUES (?, ?, ?)",
+            (name, json.dumps(payload), time.time()),
+        )
+        task_id = cur.lastrowid
+    _submit(task_id)
+    return task_id
+
+
+def _execute(task_id: int):
+    global _in_flight
+    try:
+        rows = _db(
+            "UPDATE outbox SET status = 'running', attempts = attempts + 1 "
+            "WHERE id = ? AND status = 'pending' RETURNING name, payload, attempts, created_at",
+            (task_id,),
+        )
+        if not rows:
+            return
+        name, payload, attempts, created_at = rows[0]
+        try:
+            _registry[name](**json.loads(payload))
+        except Exception as e:
+            status = "pending" if attempts < MAX_ATTEMPTS else "failed"
+            _db("UPDATE outbox SET status = ?, error = ? WHERE id = ?", (status, str(e), task_id))
+            print(f"[Warning] task {name} ({task_id}) failed: {e}")
+            if status == "pending":
+                _submit(task_id)
+            return
+
+        now = time.time()
+        _db("UPDATE outbox SET status = 'done', finished_at = ? WHERE id = ?", (now, task_id))
+        with _lock:
+            _latencies.append(now - created_at)
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+
+def drain() -> int:
+    """Re-submit tasks that were pending/running when the process stopped."""
+    _db("UPDATE outbox SET status = 'pending' WHERE status = 'running'")
+    ids = [r[0] for r in _db("SELECT id FROM outbox WHERE status = 'pending'")]
+    for task_id in ids:
+        _submit(task_id)
+    return len(ids)
+
+
+def stats() -> dict:
+    counts = dict(_db("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+    with _lock:
+        latencies = sorted(_latencies)
+        in_flight = _in_flight
+
+    def pct(q):
+        return round(latencies[int(q * (len(latencies) - 1))], 4) if latencies else None
+
+    return {
+        "queue_depth": in_flight,
+        "outbox": counts,
+        "latency_p50": pct(0.50),
+        "latency_p95": pct(0.95),
+    }
+
+
+# ------------------- Tasks -------------------
+
+@task("record_chat_turn")
+def record_chat_turn(
+    booking_id: str, step: str, latency_seconds: float, answer_chars: int, variant: Optional[str] = None
+):
+    _db(
+        "CREATE TABLE IF NOT EXISTS chat_turns ("
+        " booking_id TEXT, step TEXT, latency_seconds REAL, answer_chars INTEGER, created_at REAL, variant TEXT)"
+    )
+    # Tabelle create prima dell'A/B dello step vehicle (VEHICLE_CHAT_MODE)
+    if "variant" not in [row[1] for row in _db("PRAGMA table_info(chat_turns)")]:
+        _db("ALTER TABLE chat_turns ADD COLUMN variant TEXT")
+    _db(
+        "INSERT INTO chat_turns (booking_id, step, latency_seconds, answer_chars, created_at, variant)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (booking_id, step, latency_seconds, answer_chars, time.time(), variant),
+    )
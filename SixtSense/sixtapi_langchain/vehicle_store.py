@@ -0,0 +1,170 @@
+# vehicle_store.py
+"""
+Store dei veicoli condiviso fra i booking, indirizzato per contenuto.
+
+I deal di booking diversi nella stessa filiale ripetono gli stessi veicoli
+(con liste lunghe: images, attributes, upsellReasons). Qui ogni veicolo è
+validato una volta sola e tenuto una volta sola, sotto
+
+    vehicle_ref = "<vehicle id>:<sha1 del JSON canonico del veicolo, 12 caratteri>"
+
+Il catalogo di un booking (Catalog) tiene solo i DealRef (ref + pricing +
+dealInfo + tags), i riferimenti ai Vehicle condivisi e le DealRow per il
+ranking (deal_row.py); è riusato finché
+la fingerprint del payload /vehicles (sha1 del body, da SixtApiClient._get)
+non cambia. Un veicolo con contenuto diverso (altre foto, altri attributi)
+ha un altro ref, quindi un ref non cambia mai significato e il client
+può tenerlo in cache senza scadenza.
+
+/chat con known_vehicles manda i deal come DealRef e i dettagli solo dei
+ref che il client non ha ancora.
+
+Lo store tiene i veicoli con riferimenti deboli: un veicolo resta finché
+un catalogo (LRU, VEHICLE_CATALOG_CACHE_SIZE) lo usa, quindi get() trova
+ogni ref mandato a un client con un catalogo ancora vivo e intern() non
+ne crea mai una seconda copia. In più gli ultimi VEHICLE_STORE_SIZE
+veicoli usati restano vivi anche senza catalogo. stats() è esposto su
+/metrics.
+"""
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import VEHICLE_CATALOG_CACHE_SIZE, VEHICLE_STORE_SIZE
+from deal_row import DealRow
+from models import DealRef, SelectedVehicle, Vehicle, VehiclePricing
+
+_lock = threading.Lock()
+# vehicle_ref -> Vehicle, finché qualcuno (un catalogo, _recent) lo tiene
+_vehicles: "weakref.WeakValueDictionary[str, Vehicle]" = weakref.WeakValueDictionary()
+# Gli ultimi veicoli usati, dal meno recente
+_recent: "OrderedDict[str, Vehicle]" = OrderedDict()
+# booking_id -> (fingerprint del payload, Catalog)
+_catalogs: "OrderedDict[str, Tuple[str, Catalog]]" = OrderedDict()
+_counts = {"vehicles_parsed": 0, "vehicles_shared": 0, "catalog_hits": 0, "catalog_misses": 0, "evicted": 0}
+
+
+def vehicle_ref(raw: dict) -> str:
+    # JSON canonico e non marshal: l'output di marshal dipende dai refcount
+    # degli oggetti (FLAG_REF), quindi lo stesso veicolo in due payload
+    # diversi avrebbe due ref
+    digest = hashlib.sha1(json.dumps(raw, sort_keys=True, separators=(",", ":")).encode()).hexdigest()[:12]
+    return f"{raw['id']}:{digest}"
+
+
+def intern(raw: dict) -> Tuple[str, Vehicle]:
+    """(ref, Vehicle condiviso) del veicolo grezzo; validato solo la prima volta."""
+    ref = vehicle_ref(raw)
+    with _lock:
+        vehicle = _vehicles.get(ref)
+        if vehicle is not None:
+            _remember(ref, vehicle)
+            _counts["vehicles_shared"] += 1
+            return ref, vehicle
+
+    vehicle = Vehicle.model_validate(raw)
+    with _lock:
+        # Un altro thread potrebbe averlo appena inserito: vince il primo
+        vehicle = _vehicles.setdefault(ref, vehicle)
+        _remember(ref, vehicle)
+        _counts["vehicles_parsed"] += 1
+    return ref, vehicle
+
+
+def _remember(ref: str, vehicle: Vehicle):
+    # Chiamata con _lock preso
+    _recent[ref] = vehicle
+    _recent.move_to_end(ref)
+    while len(_recent) > VEHICLE_STORE_SIZE:
+        _recent.popitem(last=False)
+        _counts["evicted"] += 1
+
+
+def get(ref: str) -> Optional[Vehicle]:
+    with _lock:
+        return _vehicles.get(ref)
+
+
+class Catalog:
+    """I deal di un booking: DealRef + i Vehicle condivisi a cui puntano, e le DealRow per il ranking."""
+
+    def __init__(self, deals: List[DealRef], vehicles: Dict[str, Vehicle], rows: List[DealRow]):
+        self.deals = deals
+        self.vehicles = vehicles
+        self.rows = rows
+        self._selected: Optional[List[SelectedVehicle]] = None
+
+    def selected(self) -> List[SelectedVehicle]:
+        """I deal nella forma completa di prima (il Vehicle è lo stesso oggetto per tutti i booking)."""
+        if self._selected is None:
+            # Parti già validate: niente seconda validazione
+            self._selected = [
+                SelectedVehicle.model_construct(
+                    vehicle=self.vehicles[deal.vehicle_ref],
+                    pricing=deal.pricing,
+                    dealInfo=deal.dealInfo,
+                    tags=deal.tags,
+                )
+                for deal in self.deals
+            ]
+        return self._selected
+
+    def details(self, known: Iterable[str] = ()) -> Dict[str, Vehicle]:
+        """I veicoli del catalogo che il client non ha ancora."""
+        known = set(known)
+        return {ref: vehicle for ref, vehicle in self.vehicles.items() if ref not in known}
+
+
+def _build(data: dict) -> Catalog:
+    # data è un dict con chiave "deals"
+    raw_deals = data.get("deals", [])
+    if not isinstance(raw_deals, list):
+        raise ValueError(
+            f"Unexpected /vehicles response shape: 'deals' is not a list (type={type(raw_deals)})"
+        )
+
+    deals, vehicles, rows = [], {}, []
+    for raw in raw_deals:
+        ref, vehicle = intern(raw["vehicle"])
+        vehicles[ref] = vehicle
+        deals.append(DealRef(
+            vehicle_ref=ref,
+            vehicle_id=vehicle.id,
+            pricing=VehiclePricing.model_validate(raw["pricing"]),
+            dealInfo=raw.get("dealInfo"),
+            tags=raw.get("tags", []),
+        ))
+        rows.append(DealRow.from_raw(raw))
+    return Catalog(deals, vehicles, rows)
+
+
+def catalog(booking_id: str, data: dict, fp: str) -> Catalog:
+    """Catalogo del payload /vehicles del booking, riusato finché la fingerprint non cambia."""
+    with _lock:
+        entry = _catalogs.get(booking_id)
+        if entry is not None and entry[0] == fp:
+            _catalogs.move_to_end(booking_id)
+            _counts["catalog_hits"] += 1
+            return entry[1]
+        _counts["catalog_misses"] += 1
+
+    built = _build(data)
+    with _lock:
+        _catalogs[booking_id] = (fp, built)
+        _catalogs.move_to_end(booking_id)
+        while len(_catalogs) > VEHICLE_CATALOG_CACHE_SIZE:
+            _catalogs.popitem(last=False)
+    return built
+
+
+def invalidate(booking_id: str):
+    with _lock:
+        _catalogs.pop(booking_id, None)
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_counts, "vehicles": len(_vehicles), "recent": len(_recent), "catalogs": len(_catalogs)}